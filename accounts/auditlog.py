@@ -1,7 +1,7 @@
-from auditlog.registry import auditlog
 from django.contrib.auth.models import Group
+from core.auditlog import audit_registry
 from .models import User, Department
 
-auditlog.register(User)
-auditlog.register(Group)
-auditlog.register(Department)
+audit_registry.register(User, exclude_fields=['password', 'last_login'])
+audit_registry.register(Group)
+audit_registry.register(Department)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Server, ServerUpdate, Service, HyperLink, SSLCertificate, Host, VirtualMachine, AuditLog
+from django.utils import timezone
+from .models import Server, ServerUpdate, Service, HyperLink, SSLCertificate, SSLScanRun, EmailOutbox, ExportJob, Host, VirtualMachine, AuditLog
 
 # Register all models
 admin.site.register(Server)
@@ -15,8 +16,8 @@ class HyperLinkAdmin(admin.ModelAdmin):
 
 @admin.register(SSLCertificate)
 class SSLCertificateAdmin(admin.ModelAdmin):
-    list_display = ('hyperlink_url', 'expiry_date', 'days_to_expiry', 'status', 'notification_status', 'last_checked')
-    list_filter = ('notification_status', 'is_valid')
+    list_display = ('hyperlink_url', 'expiry_date', 'days_to_expiry', 'status', 'notification_status', 'last_checked', 'next_check_at', 'consecutive_failures')
+    list_filter = ('notification_status', 'is_valid', 'last_error')
     search_fields = ('hyperlink__url', 'issuer', 'subject')
     readonly_fields = ('days_to_expiry', 'status', 'status_color')
     
@@ -24,6 +25,30 @@ class SSLCertificateAdmin(admin.ModelAdmin):
         return obj.hyperlink.url
     hyperlink_url.short_description = 'URL'
 
+@admin.register(SSLScanRun)
+class SSLScanRunAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'status', 'total_urls', 'started_at', 'deadline', 'heartbeat_at', 'finished_at')
+    list_filter = ('kind', 'status')
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    actions = ['retry_now']
+    
+    @admin.action(description="Retry selected emails now")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} emails queued for delivery")
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'format', 'user', 'status', 'rows_written', 'total_rows', 'size_bytes', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'format')
+    search_fields = ('user__username', 'file')
+    readonly_fields = ('task_id', 'total_rows', 'rows_written', 'file', 'size_bytes', 'error', 'started_at', 'finished_at')
+
 admin.site.register(Host)
 admin.site.register(VirtualMachine)
 
@@ -1,14 +1,22 @@
 import json
+import logging
 import threading
-from django.db.models.signals import post_save, post_delete
+from contextlib import contextmanager
+from functools import partial
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
 from .models import AuditLog, Server, ServerUpdate, Service, HyperLink, Host, VirtualMachine, SSLCertificate
-from accounts.models import Department
 
-# Thread-local storage for request data
+logger = logging.getLogger(__name__)
+
+# Thread-local storage for request data and the audit log buffer
 _thread_locals = threading.local()
 
 def get_current_request():
@@ -31,42 +39,195 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
-def get_model_changes(instance, created=False):
-    """Get field changes for model instance"""
+class AuditRegistry:
+    """
+    The models whose saves and deletes are written to AuditLog.
+    
+    The audit receivers are connected per registered model, so saving any
+    other model (sessions, Celery results, ...) never enters them. Each model
+    can limit the fields that are snapshotted and diffed with include_fields
+    or exclude_fields (field names).
+    
+    Usage:
+        audit_registry.register(Server)
+        audit_registry.register(User, exclude_fields=['password', 'last_login'])
+    """
+    
+    def __init__(self):
+        self._fields = {}
+    
+    def register(self, model, include_fields=None, exclude_fields=None):
+        exclude_fields = set(exclude_fields or ())
+        self._fields[model] = [
+            field for field in model._meta.concrete_fields
+            if (include_fields is None or field.name in include_fields) and field.name not in exclude_fields
+        ]
+        post_init.connect(snapshot_model, sender=model)
+        post_save.connect(log_model_save, sender=model)
+        post_delete.connect(log_model_delete, sender=model)
+    
+    def unregister(self, model):
+        self._fields.pop(model, None)
+        post_init.disconnect(snapshot_model, sender=model)
+        post_save.disconnect(log_model_save, sender=model)
+        post_delete.disconnect(log_model_delete, sender=model)
+    
+    def is_registered(self, model):
+        return model in self._fields
+    
+    def model_names(self):
+        """Sorted class names of the registered models, as stored in AuditLog.model_name"""
+        return sorted(model.__name__ for model in self._fields)
+    
+    def get_fields(self, model):
+        """Audited concrete fields of model (all of them if it is not registered)"""
+        return self._fields.get(model, model._meta.concrete_fields)
+
+audit_registry = AuditRegistry()
+
+def snapshot_fields(instance, fields=None):
+    """
+    Loaded values of the audited fields of instance, keyed by attname.
+    
+    Deferred fields are left out, and foreign keys are read as their raw id,
+    so taking a snapshot never queries the database.
+    """
+    values = {}
+    for field in audit_registry.get_fields(instance.__class__):
+        if fields is not None and field.name not in fields and field.attname not in fields:
+            continue
+        if field.attname in instance.__dict__:
+            values[field.attname] = instance.__dict__[field.attname]
+    return values
+
+def get_model_changes(instance, created=False, update_fields=None):
+    """
+    Get field changes for model instance.
+    
+    Updates are diffed in memory against the snapshot taken when the instance
+    was loaded (or last saved), so no extra query is needed. Only audited
+    fields that were saved (update_fields) and loaded on both sides are
+    compared.
+    """
+    current = snapshot_fields(instance, update_fields)
     if created:
         # For new objects, return all field values
-        changes = {}
-        for field in instance._meta.fields:
-            field_name = field.name
-            field_value = getattr(instance, field_name, None)
-            if field_value is not None:
-                changes[field_name] = {'new': str(field_value)}
-        return changes
-    
-    # For updates, we need to compare with database values
-    # This is a simplified approach - in production you might want to use django-model-utils
+        return {
+            field.name: {'new': str(current[field.attname])}
+            for field in audit_registry.get_fields(instance.__class__)
+            if current.get(field.attname) is not None
+        }
+    
+    snapshot = getattr(instance, '_audit_snapshot', {})
+    changes = {}
+    for field in audit_registry.get_fields(instance.__class__):
+        if field.attname not in current or field.attname not in snapshot:
+            continue
+        old_value = snapshot[field.attname]
+        new_value = current[field.attname]
+        if old_value != new_value:
+            changes[field.name] = {
+                'old': str(old_value) if old_value is not None else None,
+                'new': str(new_value) if new_value is not None else None
+            }
+    return changes
+
+AUDIT_ENTRY_FIELDS = [
+    'user_id', 'ip_address', 'action', 'model_name', 'object_id', 'object_repr', 'changes', 'timestamp',
+]
+
+def open_audit_buffer():
+    """
+    Start collecting audit log entries instead of writing them one by one.
+    
+    Calls nest (a task run eagerly inside a request shares the request's
+    buffer); the entries are written when the outermost scope is closed.
+    """
+    _thread_locals.audit_depth = getattr(_thread_locals, 'audit_depth', 0) + 1
+    if _thread_locals.audit_depth == 1:
+        _thread_locals.audit_buffer = []
+
+def close_audit_buffer():
+    """Close a scope opened by open_audit_buffer, writing the entries if it was the outermost"""
+    _thread_locals.audit_depth -= 1
+    if _thread_locals.audit_depth:
+        return
+    
+    entries, _thread_locals.audit_buffer = _thread_locals.audit_buffer, None
+    if not entries:
+        return
+    try:
+        write_audit_entries(entries)
+    except Exception as e:
+        logger.error(f"Error writing {len(entries)} audit log entries: {str(e)}")
+
+@contextmanager
+def audit_buffer():
+    """
+    Buffer the audit log entries created inside the block and write them in one batch.
+    
+    Usage:
+        with audit_buffer():
+            for server in servers:
+                server.save()
+    """
+    open_audit_buffer()
     try:
-        old_instance = instance.__class__.objects.get(pk=instance.pk)
-        changes = {}
-        for field in instance._meta.fields:
-            field_name = field.name
-            old_value = getattr(old_instance, field_name, None)
-            new_value = getattr(instance, field_name, None)
-            if old_value != new_value:
-                changes[field_name] = {
-                    'old': str(old_value) if old_value is not None else None,
-                    'new': str(new_value) if new_value is not None else None
-                }
-        return changes
-    except instance.__class__.DoesNotExist:
-        return {}
+        yield
+    finally:
+        close_audit_buffer()
+
+def serialize_entry(entry):
+    """JSON-safe dict of an unsaved AuditLog, for handing to the background writer"""
+    values = {field: getattr(entry, field) for field in AUDIT_ENTRY_FIELDS}
+    values['timestamp'] = entry.timestamp.isoformat()
+    return values
+
+def deserialize_entry(values):
+    """Rebuild an unsaved AuditLog from serialize_entry output"""
+    values = dict(values, timestamp=parse_datetime(values['timestamp']))
+    return AuditLog(**values)
+
+def write_audit_entries(entries):
+    """
+    Persist unsaved AuditLog instances with bulk_create.
+    
+    With settings.AUDIT_LOG_ASYNC the batch is handed to the write_audit_logs
+    task instead; if it cannot be queued it is written here.
+    """
+    if settings.AUDIT_LOG_ASYNC:
+        from core.tasks import write_audit_logs
+        try:
+            write_audit_logs.delay([serialize_entry(entry) for entry in entries])
+            return
+        except Exception as e:
+            logger.warning(f"Could not queue {len(entries)} audit log entries, writing them inline: {str(e)}")
+    AuditLog.objects.bulk_create(entries, batch_size=settings.AUDIT_LOG_BATCH_SIZE)
+
+def _buffer_entry(entry):
+    buffer = getattr(_thread_locals, 'audit_buffer', None)
+    if buffer is None:
+        write_audit_entries([entry])
+    else:
+        buffer.append(entry)
+
+def record_audit_entry(entry):
+    """
+    Queue an unsaved AuditLog for writing.
+    
+    The entry is only kept once the surrounding transaction commits (right
+    away outside one), so rolled back changes leave no audit trail. Inside a
+    request or task it joins the scope's buffer; otherwise it is written on
+    its own.
+    """
+    transaction.on_commit(partial(_buffer_entry, entry))
 
 def create_audit_log(user, action, instance, changes=None):
     """Create an audit log entry"""
     request = get_current_request()
     ip_address = get_client_ip(request) if request else None
     
-    AuditLog.objects.create(
+    record_audit_entry(AuditLog(
         user=user,
         ip_address=ip_address,
         action=action,
@@ -74,37 +235,54 @@ def create_audit_log(user, action, instance, changes=None):
         object_id=str(instance.pk) if hasattr(instance, 'pk') else None,
         object_repr=str(instance)[:200],
         changes=changes
-    )
+    ))
 
-# Models to audit
-AUDITED_MODELS = [
-    Server, ServerUpdate, Service, HyperLink, Host, VirtualMachine, SSLCertificate, Department
-]
+def create_bulk_audit_log(action, model, changes=None, user=None):
+    """Create one audit log entry summarising a bulk write to model"""
+    request = get_current_request()
+    if user is None and request:
+        user = getattr(request, 'user', None)
+    if user is not None and not user.is_authenticated:
+        user = None
+    
+    record_audit_entry(AuditLog(
+        user=user,
+        ip_address=get_client_ip(request) if request else None,
+        action=action,
+        model_name=model.__name__,
+        object_id=None,
+        object_repr=f"Bulk {action.lower()} of {model._meta.verbose_name_plural}"[:200],
+        changes=changes
+    ))
+
+def snapshot_model(sender, instance, **kwargs):
+    """Remember the values an audited instance was loaded with, for diffing on save"""
+    instance._audit_snapshot = snapshot_fields(instance)
 
-@receiver(post_save)
-def log_model_save(sender, instance, created, **kwargs):
+def log_model_save(sender, instance, created, update_fields=None, **kwargs):
     """Log model save events"""
-    if sender not in AUDITED_MODELS:
+    saved = snapshot_fields(instance, update_fields)
+    
+    # Saves that only wrote unaudited fields (e.g. last_login) are not logged
+    if not created and update_fields is not None and not saved:
         return
     
     request = get_current_request()
     user = getattr(request, 'user', None) if request else None
     
     # Skip if no user (system operations)
-    if not user or not user.is_authenticated:
-        return
-    
-    action = 'CREATE' if created else 'UPDATE'
-    changes = get_model_changes(instance, created=created)
+    if user and user.is_authenticated:
+        action = 'CREATE' if created else 'UPDATE'
+        changes = get_model_changes(instance, created=created, update_fields=update_fields)
+        create_audit_log(user, action, instance, changes)
     
-    create_audit_log(user, action, instance, changes)
+    # The saved values are the baseline for the next save, logged or not
+    if not hasattr(instance, '_audit_snapshot'):
+        instance._audit_snapshot = {}
+    instance._audit_snapshot.update(saved)
 
-@receiver(post_delete)
 def log_model_delete(sender, instance, **kwargs):
     """Log model delete events"""
-    if sender not in AUDITED_MODELS:
-        return
-    
     request = get_current_request()
     user = getattr(request, 'user', None) if request else None
     
@@ -117,30 +295,15 @@ def log_model_delete(sender, instance, **kwargs):
 @receiver(user_logged_in)
 def log_user_login(sender, request, user, **kwargs):
     """Log user login events"""
-    # Create a mock instance for login event
-    class LoginEvent:
-        def __init__(self, user):
-            self.pk = user.pk
-            self.user = user
-        
-        def __str__(self):
-            return f"Login: {self.user.username}"
-        
-        class __class__:
-            __name__ = 'UserLogin'
-    
-    login_instance = LoginEvent(user)
-    ip_address = get_client_ip(request)
-    
-    AuditLog.objects.create(
+    record_audit_entry(AuditLog(
         user=user,
-        ip_address=ip_address,
+        ip_address=get_client_ip(request),
         action='LOGIN',
         model_name='UserLogin',
         object_id=str(user.pk),
         object_repr=f"Login: {user.username}",
         changes=None
-    )
+    ))
 
 @receiver(user_logged_out)
 def log_user_logout(sender, request, user, **kwargs):
@@ -148,27 +311,25 @@ def log_user_logout(sender, request, user, **kwargs):
     if not user:
         return
     
-    # Create a mock instance for logout event
-    class LogoutEvent:
-        def __init__(self, user):
-            self.pk = user.pk
-            self.user = user
-        
-        def __str__(self):
-            return f"Logout: {self.user.username}"
-        
-        class __class__:
-            __name__ = 'UserLogout'
-    
-    logout_instance = LogoutEvent(user)
-    ip_address = get_client_ip(request)
-    
-    AuditLog.objects.create(
+    record_audit_entry(AuditLog(
         user=user,
-        ip_address=ip_address,
+        ip_address=get_client_ip(request),
         action='LOGOUT',
         model_name='UserLogout',
         object_id=str(user.pk),
         object_repr=f"Logout: {user.username}",
         changes=None
-    )
+    ))
+
+@task_prerun.connect
+def open_task_audit_buffer(**kwargs):
+    """Batch the audit log entries of each Celery task"""
+    open_audit_buffer()
+
+@task_postrun.connect
+def close_task_audit_buffer(**kwargs):
+    close_audit_buffer()
+
+# Models to audit (accounts registers its own in accounts/auditlog.py)
+for model in [Server, ServerUpdate, Service, HyperLink, Host, VirtualMachine, SSLCertificate]:
+    audit_registry.register(model)
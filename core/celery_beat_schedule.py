@@ -1,14 +1,19 @@
 from celery.schedules import crontab
 
 BEAT_SCHEDULE = {
-    'check-ssl-certificates-daily': {
-        'task': 'core.tasks.check_ssl_certificates',
-        'schedule': crontab(hour=0, minute=0),  # Run at midnight every day
+    'check-due-ssl-certificates': {
+        'task': 'core.tasks.check_due_ssl_certificates',
+        'schedule': crontab(minute='*/15'),  # Run every 15 minutes, probing only certificates that are due
         'args': (),
     },
-    'send-ssl-expiry-notifications-daily': {
+    'send-ssl-expiry-notifications': {
         'task': 'core.tasks.send_ssl_expiry_notifications',
-        'schedule': crontab(hour=8, minute=0),  # Run at 8 AM every day
+        'schedule': crontab(minute='*/10'),  # Run every 10 minutes; the ledger makes reruns cheap and idempotent
+        'args': (),
+    },
+    'deliver-email-outbox': {
+        'task': 'core.tasks.deliver_email_outbox',
+        'schedule': crontab(),  # Run every minute, picking up retries and anything not kicked off directly
         'args': (),
     },
     'update-expired-certificates-hourly': {
@@ -16,4 +21,24 @@ BEAT_SCHEDULE = {
         'schedule': crontab(minute=0),  # Run every hour
         'args': (),
     },
+    'archive-audit-log-daily': {
+        'task': 'core.tasks.archive_audit_log',
+        'schedule': crontab(minute=0, hour=3),  # Run daily, before retention so entries are archived before they expire
+        'args': (),
+    },
+    'maintain-audit-log-daily': {
+        'task': 'core.tasks.maintain_audit_log',
+        'schedule': crontab(minute=30, hour=3),  # Run daily: create upcoming partitions, apply audit retention
+        'args': (),
+    },
+    'purge-export-jobs-hourly': {
+        'task': 'core.tasks.purge_export_jobs',
+        'schedule': crontab(minute=15),  # Run hourly: fail exports whose worker died, delete those past their retention
+        'args': (),
+    },
+    'purge-ssl-scan-runs-daily': {
+        'task': 'core.tasks.purge_ssl_scan_runs',
+        'schedule': crontab(minute=45, hour=3),  # Run daily: delete scan runs and checkpoints past their retention
+        'args': (),
+    },
 }
\ No newline at end of file
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.audit_archive import archive_before, archive_cutoff
+
+class Command(BaseCommand):
+    help = (
+        'Moves audit log entries older than AUDIT_ARCHIVE_AFTER_DAYS days to gzipped JSONL '
+        'day shards under AUDIT_ARCHIVE_DIR and deletes them from the database in chunks. '
+        'Archived entries stay searchable from the audit log page (core.tasks.archive_audit_log '
+        'does the same daily).'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Override AUDIT_ARCHIVE_AFTER_DAYS')
+    
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is None:
+            days = settings.AUDIT_ARCHIVE_AFTER_DAYS
+        if days <= 0:
+            raise CommandError('Archiving is disabled; set AUDIT_ARCHIVE_AFTER_DAYS or pass --older-than-days')
+        
+        cutoff = archive_cutoff(days)
+        day_count, row_count = archive_before(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {row_count} audit log entries from {day_count} days before {cutoff:%Y-%m-%d} to {settings.AUDIT_ARCHIVE_DIR}"
+        ))
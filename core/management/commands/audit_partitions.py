@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import AuditLog
+from core.utils.audit_partitions import is_partitioned, list_partitions, maintain, retention_cutoff
+
+class Command(BaseCommand):
+    help = (
+        'Creates upcoming monthly audit log partitions and applies the retention policy. '
+        'On PostgreSQL expired months are removed as whole partitions; other databases '
+        'delete expired rows in chunks. Run daily (core.tasks.maintain_audit_log does the same).'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, help='Override AUDIT_LOG_PARTITION_MONTHS_AHEAD')
+        parser.add_argument('--retention-months', type=int, help='Override AUDIT_LOG_RETENTION_MONTHS (0 keeps everything)')
+        parser.add_argument('--detach', action='store_true', default=None, help='Detach expired partitions instead of dropping them')
+        parser.add_argument('--list', action='store_true', help='Only list the partitions and what the retention policy would remove')
+    
+    def handle(self, *args, **options):
+        for option in ('months_ahead', 'retention_months'):
+            if options[option] is not None and options[option] < 0:
+                raise CommandError(f"--{option.replace('_', '-')} cannot be negative")
+        
+        if options['list']:
+            self._list(options['retention_months'])
+            return
+        
+        detach = settings.AUDIT_LOG_DETACH_EXPIRED if options['detach'] is None else options['detach']
+        created, removed, deleted = maintain(
+            months_ahead=options['months_ahead'],
+            retention_months=options['retention_months'],
+            detach=detach,
+        )
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+        for name in removed:
+            self.stdout.write(f"{'Detached' if detach else 'Dropped'} partition {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(created)} partitions created, {len(removed)} partitions removed, {deleted} rows deleted"
+        ))
+    
+    def _list(self, retention_months):
+        if retention_months is None:
+            retention_months = settings.AUDIT_LOG_RETENTION_MONTHS
+        cutoff = retention_cutoff(retention_months) if retention_months > 0 else None
+        
+        if not is_partitioned():
+            expired = AuditLog.objects.filter(timestamp__lt=cutoff).count() if cutoff else 0
+            self.stdout.write(f"Audit log is not partitioned; {expired} rows are past retention")
+            return
+        for partition in list_partitions():
+            if partition.is_default:
+                bounds = 'default'
+            else:
+                bounds = f"{partition.lower or 'MINVALUE'} .. {partition.upper or 'MAXVALUE'}"
+            expired = cutoff and partition.upper and partition.upper <= cutoff
+            self.stdout.write(f"{partition.name}: {bounds}{' (expired)' if expired else ''}")
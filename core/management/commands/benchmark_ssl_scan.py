@@ -0,0 +1,129 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.models import Server, HyperLink
+from core.utils.ssl_bench import TLSFleet
+from core.utils.ssl_checker import dns_cache, parse_endpoint
+from core.utils.ssl_scan import scan_hyperlinks
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the SSL scanner offline against local TLS listeners on loopback '
+        '(healthy, slow, refusing and expired). Seeds a temporary "ssl-benchmark" server '
+        'with matching URLs in the configured database and removes it afterwards.'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--hosts', type=int, default=200, help='Number of local listeners')
+        parser.add_argument('--urls-per-host', type=int, default=1, help='URLs seeded per listener (sharing its endpoint)')
+        parser.add_argument('--slow', type=int, default=10, help='Percent of listeners that stall before answering the HEAD request')
+        parser.add_argument('--refused', type=int, default=5, help='Percent of ports that refuse connections')
+        parser.add_argument('--expired', type=int, default=5, help='Percent of listeners with an expired certificate')
+        parser.add_argument('--slow-delay', type=float, default=1.0, help='Seconds slow listeners stall')
+        parser.add_argument('--rounds', type=int, default=2, help='Scans to run (later rounds exercise unchanged-skip)')
+        parser.add_argument('--concurrency', type=int, help='Override SSL_SCAN_CONCURRENCY')
+        parser.add_argument('--timeout', type=float, help='Override SSL_SCAN_TIMEOUT')
+        parser.add_argument('--json', action='store_true', help='Print one JSON object per round')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded server, URLs and certificates')
+    
+    def handle(self, *args, **options):
+        hosts = options['hosts']
+        if hosts < 1:
+            raise CommandError('--hosts must be at least 1')
+        counts = {kind: hosts * options[kind] // 100 for kind in ('slow', 'refused', 'expired')}
+        counts['ok'] = hosts - sum(counts.values())
+        if counts['ok'] < 0:
+            raise CommandError('--slow, --refused and --expired add up to more than 100 percent')
+        
+        overrides = {}
+        if options['concurrency']:
+            overrides['SSL_SCAN_CONCURRENCY'] = options['concurrency']
+        if options['timeout']:
+            overrides['SSL_SCAN_TIMEOUT'] = options['timeout']
+        
+        self.stdout.write(f"Starting {hosts} listeners: " + ', '.join(f"{count} {kind}" for kind, count in counts.items()))
+        with TLSFleet(counts, slow_delay=options['slow_delay']) as fleet:
+            with override_settings(SSL_SCAN_CA_FILE=fleet.ca_file, **overrides):
+                server = self._seed(fleet, options['urls_per_host'])
+                try:
+                    for round_number in range(1, options['rounds'] + 1):
+                        report = self._run_round(server)
+                        report['round'] = round_number
+                        self._print_report(report, options['json'])
+                finally:
+                    if not options['keep']:
+                        server.delete()
+    
+    def _seed(self, fleet, urls_per_host):
+        server = Server.objects.create(name='ssl-benchmark', ip_address='127.0.0.1', os='benchmark')
+        hyperlinks = []
+        for listener in fleet.listeners:
+            for i in range(urls_per_host):
+                url = f"{listener.url}{i}" if i else listener.url
+                # bulk_create skips save(), so set the endpoint the scanner groups by here
+                hyperlinks.append(HyperLink(servers=server, url=url, endpoint=parse_endpoint(url).key))
+        HyperLink.objects.bulk_create(hyperlinks)
+        return server
+    
+    def _run_round(self, server):
+        hyperlinks = HyperLink.objects.filter(servers=server, is_enabled=True)
+        stats = {}
+        dns_cache.clear()
+        tracemalloc.start()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            updated, errors = scan_hyperlinks(hyperlinks, stats=stats)
+        elapsed = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        urls = hyperlinks.count()
+        statements = [query['sql'].lstrip().upper() for query in queries.captured_queries]
+        return {
+            'urls': urls,
+            'endpoints': stats['endpoints'],
+            'failed_endpoints': stats['failed'],
+            'seconds': round(elapsed, 3),
+            'urls_per_sec': round(urls / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(stats['latencies'], 50) * 1000, 1),
+            'p99_ms': round(percentile(stats['latencies'], 99) * 1000, 1),
+            'db_queries': len(statements),
+            'db_writes': sum(1 for sql in statements if sql.startswith(WRITE_STATEMENTS)),
+            'peak_mem_mb': round(peak / 1024 / 1024, 2),
+            'updated': updated,
+            'unchanged': stats['unchanged'],
+            'errors': errors,
+        }
+    
+    def _print_report(self, report, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Round {report['round']}: {report['urls']} URLs ({report['endpoints']} endpoints) in {report['seconds']}s, "
+            f"{report['urls_per_sec']} URLs/sec"
+        ))
+        self.stdout.write(
+            f"  probe latency p50 {report['p50_ms']} ms, p99 {report['p99_ms']} ms; "
+            f"{report['db_writes']} DB writes of {report['db_queries']} queries; "
+            f"peak traced memory {report['peak_mem_mb']} MB"
+        )
+        self.stdout.write(
+            f"  {report['updated']} updated ({report['unchanged']} unchanged), "
+            f"{report['failed_endpoints']} endpoints unreachable, {report['errors']} errors"
+        )
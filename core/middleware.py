@@ -1,4 +1,4 @@
-from .auditlog import set_current_request
+from .auditlog import close_audit_buffer, open_audit_buffer, set_current_request
 
 class AuditLogMiddleware:
     """Middleware to capture request context for audit logging"""
@@ -10,9 +10,14 @@ class AuditLogMiddleware:
         # Set the current request in thread-local storage
         set_current_request(request)
         
-        response = self.get_response(request)
+        # Audit entries made while handling the request are written in one batch
+        open_audit_buffer()
+        try:
+            response = self.get_response(request)
+        finally:
+            close_audit_buffer()
+            
+            # Clear the request after processing
+            set_current_request(None)
         
-        # Clear the request after processing
-        set_current_request(None)
-        
-        return response
\ No newline at end of file
+        return response
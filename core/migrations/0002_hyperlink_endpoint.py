@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:29
+
+from urllib.parse import urlparse
+
+from django.db import migrations, models
+
+
+def endpoint_key(url):
+    """
+    Endpoint key of a URL as core.utils.ssl_checker.parse_endpoint computed it when this migration was written.
+    
+    Copied here so later changes to the live parser do not change what this migration does.
+    """
+    url = url.strip()
+    if not url.startswith('http://') and not url.startswith('https://'):
+        url = 'https://' + url
+    parsed_url = urlparse(url)
+    hostname = parsed_url.hostname
+    if not hostname:
+        raise ValueError(f"No hostname in URL {url!r}")
+    hostname = hostname.rstrip('.')
+    return f"{hostname}:{parsed_url.port or 443}"
+
+
+def populate_endpoints(apps, schema_editor):
+    HyperLink = apps.get_model('core', 'HyperLink')
+    hyperlinks = list(HyperLink.objects.only('id', 'url'))
+    for hyperlink in hyperlinks:
+        try:
+            hyperlink.endpoint = endpoint_key(hyperlink.url)
+        except ValueError:
+            hyperlink.endpoint = ''
+    HyperLink.objects.bulk_update(hyperlinks, ['endpoint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hyperlink',
+            name='endpoint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_endpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_hyperlink_endpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslcertificate',
+            name='last_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sslcertificate',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_sslcertificate_adaptive_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslcertificate',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sslcertificate',
+            name='last_error',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
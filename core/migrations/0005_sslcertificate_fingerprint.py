@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_sslcertificate_failure_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslcertificate',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_sslcertificate_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SSLScanRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('full', 'Full sweep'), ('due', 'Due certificates')], max_length=10)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('expired', 'Deadline reached')], default='running', max_length=10)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('deadline', models.DateTimeField()),
+                ('heartbeat_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('total_urls', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['kind', 'status'], name='core_sslsca_kind_4f1295_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SSLScanChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('hyperlink_ids', models.JSONField()),
+                ('size', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done')], default='pending', max_length=10)),
+                ('updated_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='core.sslscanrun')),
+            ],
+            options={
+                'ordering': ['run', 'position'],
+                'indexes': [models.Index(fields=['run', 'status'], name='core_sslsca_run_id_bdde4a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('run', 'position'), name='unique_ssl_scan_chunk_position')],
+            },
+        ),
+    ]
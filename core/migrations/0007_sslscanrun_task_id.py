@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_ssl_scan_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sslscanrun',
+            name='task_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:46
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_ledger(apps, schema_editor):
+    """Certificates already marked notified count as notified for every threshold they have crossed"""
+    SSLCertificate = apps.get_model('core', 'SSLCertificate')
+    SSLNotificationLedger = apps.get_model('core', 'SSLNotificationLedger')
+    now = timezone.now()
+    entries = []
+    for cert in SSLCertificate.objects.filter(notification_status='notified', expiry_date__gt=now).only('id', 'expiry_date'):
+        for days in settings.SSL_NOTIFICATION_DAYS:
+            if cert.expiry_date <= now + timedelta(days=days):
+                entries.append(SSLNotificationLedger(certificate_id=cert.pk, threshold_days=days, expiry_date=cert.expiry_date))
+    SSLNotificationLedger.objects.bulk_create(entries, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SSLNotificationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold_days', models.PositiveIntegerField()),
+                ('expiry_date', models.DateTimeField()),
+                ('notified_at', models.DateTimeField(auto_now_add=True)),
+                ('certificate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.sslcertificate')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('certificate', 'threshold_days', 'expiry_date'), name='unique_ssl_notification_threshold')],
+            },
+        ),
+        migrations.RunPython(seed_ledger, migrations.RunPython.noop),
+    ]
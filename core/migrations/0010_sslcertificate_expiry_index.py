@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sslnotificationledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sslcertificate',
+            name='expiry_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def partition_auditlog(apps, schema_editor):
+    """Partition the audit log by month on PostgreSQL; other databases keep the plain table"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from core.utils.audit_partitions import partition_table
+    partition_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(partition_auditlog, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from accounts.models import Department
-from datetime import datetime, timedelta
-from auditlog.registry import auditlog
+from datetime import timedelta
+from .utils.ssl_checker import parse_endpoint
 
 class Server(models.Model):
     SERVER_TYPE_CHOICES = [
@@ -63,10 +64,26 @@ class HyperLink(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='HyperLink_created_by')
     created_at = models.DateTimeField(auto_now_add=True)
     is_enabled = models.BooleanField(default=True)
+    # Normalised "hostname:port" the SSL scanner connects to; links sharing it are probed once
+    endpoint = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.url} on {self.servers.name}"
 
+    def get_endpoint(self):
+        """Parse the URL into the Endpoint the SSL scanner connects to"""
+        return parse_endpoint(self.url)
+
+    def save(self, *args, **kwargs):
+        try:
+            self.endpoint = self.get_endpoint().key
+        except ValueError:
+            self.endpoint = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'url' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'endpoint'}
+        super().save(*args, **kwargs)
+
 # Host-VM Models
 class Host(models.Model):
     hostname = models.CharField(max_length=100)
@@ -99,7 +116,45 @@ class VirtualMachine(models.Model):
         return f"{self.name} on {self.host.hostname}"
 
 # SSL Certificate Expiry Model
+class SSLCertificateQuerySet(models.QuerySet):
+    """Status buckets (see SSLCertificate.status) computed in SQL"""
+    
+    STATUSES = ['Critical', 'Warning', 'Valid', 'Expired', 'Unknown']
+    
+    @staticmethod
+    def status_filters(now=None):
+        """Map each status to a Q on expiry_date; range filters so they can use its index"""
+        now = now or timezone.now()
+        critical = now + timedelta(days=SSLCertificate.CRITICAL_DAYS)
+        warning = now + timedelta(days=SSLCertificate.WARNING_DAYS)
+        return {
+            'Critical': models.Q(expiry_date__gte=now, expiry_date__lt=critical),
+            'Warning': models.Q(expiry_date__gte=critical, expiry_date__lt=warning),
+            'Valid': models.Q(expiry_date__gte=warning),
+            'Expired': models.Q(expiry_date__lt=now),
+            'Unknown': models.Q(expiry_date__isnull=True),
+        }
+    
+    def with_status(self, now=None):
+        """Annotate status_bucket with the certificate's status"""
+        whens = [models.When(q, then=models.Value(status)) for status, q in self.status_filters(now).items()]
+        return self.annotate(status_bucket=models.Case(*whens, output_field=models.CharField()))
+    
+    def in_status(self, status, now=None):
+        return self.filter(self.status_filters(now)[status])
+    
+    def status_counts(self, now=None):
+        """Number of certificates per status, in one aggregate query"""
+        return self.aggregate(**{
+            status: models.Count('pk', filter=q) for status, q in self.status_filters(now).items()
+        })
+
+
 class SSLCertificate(models.Model):
+    # Days left below which a certificate is Critical / Warning
+    CRITICAL_DAYS = 7
+    WARNING_DAYS = 30
+    
     NOTIFICATION_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('notified', 'Notified'),
@@ -107,21 +162,62 @@ class SSLCertificate(models.Model):
     ]
     
     hyperlink = models.OneToOneField(HyperLink, on_delete=models.CASCADE, related_name='ssl_certificate')
-    expiry_date = models.DateTimeField(null=True, blank=True)
+    expiry_date = models.DateTimeField(null=True, blank=True, db_index=True)
     last_checked = models.DateTimeField(auto_now=True)
     notification_status = models.CharField(max_length=20, choices=NOTIFICATION_STATUS_CHOICES, default='pending')
     issuer = models.CharField(max_length=255, blank=True)
     subject = models.CharField(max_length=255, blank=True)
     is_valid = models.BooleanField(default=True)
+    # SHA-256 of the leaf certificate DER; scans skip parsing and rewriting when it matches
+    fingerprint = models.CharField(max_length=64, blank=True)
+    # When the expiry, issuer or subject last changed (i.e. the certificate was rotated)
+    last_changed_at = models.DateTimeField(null=True, blank=True)
+    # When the adaptive scheduler should probe this certificate again
+    next_check_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Failure tracking for exponential backoff of unreachable endpoints
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=100, blank=True)
+    
+    objects = SSLCertificateQuerySet.as_manager()
     
     def __str__(self):
         return f"SSL for {self.hyperlink.url} (Expires: {self.expiry_date})"
     
+    def compute_next_check(self, now=None, failed=False):
+        """
+        Work out when this certificate should be probed again.
+        
+        Failed probes back off exponentially with consecutive_failures up to
+        settings.SSL_BACKOFF_MAX_HOURS, recently rotated certificates are
+        watched closely, and otherwise the interval grows with the time left
+        before expiry (see settings.SSL_RECHECK_INTERVALS).
+        """
+        now = now or timezone.now()
+        if failed:
+            exponent = max(self.consecutive_failures - 1, 0)
+            hours = min(settings.SSL_RECHECK_FAILURE_HOURS * 2 ** exponent, settings.SSL_BACKOFF_MAX_HOURS)
+        elif self.last_changed_at and now - self.last_changed_at < timedelta(days=settings.SSL_RECHECK_ROTATED_WINDOW_DAYS):
+            hours = settings.SSL_RECHECK_ROTATED_HOURS
+        elif not self.expiry_date:
+            hours = settings.SSL_RECHECK_UNKNOWN_HOURS
+        else:
+            days_left = (self.expiry_date - now).days
+            hours = next(
+                hours for max_days, hours in settings.SSL_RECHECK_INTERVALS
+                if max_days is None or days_left <= max_days
+            )
+        return now + timedelta(hours=hours)
+    
+    @property
+    def is_backing_off(self):
+        """True while failed probes are being retried with backoff"""
+        return self.consecutive_failures > 0
+    
     @property
     def days_to_expiry(self):
         if not self.expiry_date:
             return None
-        return (self.expiry_date - datetime.now().replace(tzinfo=self.expiry_date.tzinfo)).days
+        return (self.expiry_date - timezone.now()).days
     
     @property
     def status(self):
@@ -132,9 +228,9 @@ class SSLCertificate(models.Model):
             return "Unknown"
         elif days < 0:
             return "Expired"
-        elif days < 7:
+        elif days < self.CRITICAL_DAYS:
             return "Critical"
-        elif days < 30:
+        elif days < self.WARNING_DAYS:
             return "Warning"
         else:
             return "Valid"
@@ -154,6 +250,148 @@ class SSLCertificate(models.Model):
             return "secondary"
 
 
+class SSLNotificationLedger(models.Model):
+    """
+    Record that a certificate was notified about for one SSL_NOTIFICATION_DAYS threshold.
+    
+    Keyed on the expiry date too, so a renewed certificate is notified again.
+    """
+    certificate = models.ForeignKey(SSLCertificate, on_delete=models.CASCADE, related_name='notifications')
+    threshold_days = models.PositiveIntegerField()
+    expiry_date = models.DateTimeField()
+    notified_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['certificate', 'threshold_days', 'expiry_date'], name='unique_ssl_notification_threshold',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.certificate} notified at {self.threshold_days} days"
+
+
+class SSLScanRun(models.Model):
+    """
+    One SSL scan (full sweep or due check), split into checkpointed chunks.
+    
+    Chunks are committed as they finish, so a run interrupted by a worker
+    restart or its deadline can be resumed from the chunks still pending.
+    """
+    KIND_CHOICES = [
+        ('full', 'Full sweep'),
+        ('due', 'Due certificates'),
+    ]
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('expired', 'Deadline reached'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(auto_now_add=True)
+    deadline = models.DateTimeField()
+    # Bumped whenever a chunk finishes; a running scan with a stale heartbeat has lost its workers
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    total_urls = models.PositiveIntegerField(default=0)
+    # Celery id of the job that started or last resumed the run, for progress polling
+    task_id = models.CharField(max_length=255, blank=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['kind', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+    
+    @property
+    def is_stale(self):
+        return self.heartbeat_at < timezone.now() - timedelta(minutes=settings.SSL_SCAN_STALE_MINUTES)
+    
+    def totals(self):
+        """Aggregate chunk counters: {'done_urls', 'updated', 'errors', 'pending_chunks'}"""
+        done = models.Q(status='done')
+        return self.chunks.aggregate(
+            done_urls=models.Sum('size', filter=done, default=0),
+            updated=models.Sum('updated_count', default=0),
+            errors=models.Sum('error_count', default=0),
+            pending_chunks=models.Count('pk', filter=models.Q(status='pending')),
+        )
+
+
+class SSLScanChunk(models.Model):
+    """A checkpoint: one slice of a scan run's hyperlinks"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+    ]
+    
+    run = models.ForeignKey(SSLScanRun, on_delete=models.CASCADE, related_name='chunks')
+    position = models.PositiveIntegerField()
+    hyperlink_ids = models.JSONField()
+    size = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'position'], name='unique_ssl_scan_chunk_position'),
+        ]
+        indexes = [
+            models.Index(fields=['run', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.position} of scan #{self.run_id} ({self.status})"
+
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be delivered by the outbox worker (core.utils.email_outbox).
+    
+    Producers insert rows in bulk; deliver_email_outbox sends them in
+    rate-limited batches, retrying failures with backoff until they are sent
+    or dead-lettered.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # When the row may next be picked up; also the lease on rows being sent
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'Email outbox'
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+
 class AuditLog(models.Model):
     ACTION_CHOICES = [
         ('CREATE', 'Create'),
@@ -171,8 +409,12 @@ class AuditLog(models.Model):
     object_id = models.CharField(max_length=100, null=True, blank=True)
     object_repr = models.CharField(max_length=200, null=True, blank=True)
     changes = models.JSONField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered entry is written
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     
+    # On PostgreSQL the table is partitioned by month on timestamp (see
+    # core.utils.audit_partitions); filter on timestamp ranges so queries
+    # only touch the partitions they need.
     class Meta:
         ordering = ['-timestamp']
         indexes = [
@@ -184,3 +426,88 @@ class AuditLog(models.Model):
     def __str__(self):
         return f"{self.user} {self.action} {self.model_name} at {self.timestamp}"
 
+
+
+class ExportJob(models.Model):
+    """
+    A bulk export built in the background by run_export_job (core.utils.export_jobs).
+    
+    The file is written under MEDIA_ROOT in chunks while rows_written tracks
+    progress; finished files are served with HTTP range support so large
+    downloads can be resumed.
+    """
+    KIND_CHOICES = [
+        ('audit_log', 'Audit log'),
+        ('inventory', 'Server inventory'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='csv')
+    compress = models.BooleanField(default=True)
+    # Audit log list filters (as in AuditLogListView's query string) the export was started with
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    task_id = models.CharField(max_length=255, blank=True)
+    # Estimated when the job starts; archived audit entries are counted from the shard indexes
+    total_rows = models.PositiveBigIntegerField(null=True, blank=True)
+    rows_written = models.PositiveBigIntegerField(default=0)
+    file = models.FileField(upload_to='exports/', blank=True)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Bumped with every progress update; a running job with a stale heartbeat has lost its worker
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['status', 'heartbeat_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} export #{self.pk} ({self.get_status_display()})"
+    
+    @property
+    def is_stale(self):
+        return (
+            self.status == 'running' and self.heartbeat_at is not None
+            and self.heartbeat_at < timezone.now() - timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES)
+        )
+    
+    @property
+    def is_active(self):
+        return self.status == 'pending' or (self.status == 'running' and not self.is_stale)
+    
+    @property
+    def progress(self):
+        """Percentage of rows written"""
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(self.rows_written * 100 // self.total_rows, 99)
+    
+    @property
+    def filename(self):
+        """Download name, e.g. audit_log-12.csv.gz"""
+        return f"{self.kind}-{self.pk}.{self.format}{'.gz' if self.compress else ''}"
+    
+    @property
+    def content_type(self):
+        if self.compress:
+            return 'application/gzip'
+        return 'text/csv' if self.format == 'csv' else 'application/x-ndjson'
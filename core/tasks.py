@@ -1,131 +1,383 @@
-from celery import shared_task
+from celery import shared_task, chord
 from django.conf import settings
-from django.core.mail import send_mail
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Case, Exists, IntegerField, OuterRef, Prefetch, Value, When
 from django.template.loader import render_to_string
 from django.utils import timezone
+from collections import defaultdict
 from datetime import timedelta
 import logging
 
-from core.models import HyperLink, SSLCertificate
-from core.utils.ssl_checker import get_ssl_expiry_date, check_url_accessibility
+from core.auditlog import deserialize_entry
+from core.models import AuditLog, ExportJob, HyperLink, SSLCertificate, SSLNotificationLedger, SSLScanRun, SSLScanChunk
+from core.utils.audit_archive import archive_before, archive_cutoff
+from core.utils.audit_partitions import maintain as maintain_audit_partitions
+from core.utils.email_outbox import deliver_batch, enqueue_messages
+from core.utils.export_jobs import purge_expired as purge_expired_exports, run_export
+from core.utils.ssl_checker import probe_url_cached
+from core.utils.ssl_scan import SSLResultWriter, scan_hyperlinks, due_hyperlinks, chunk_hyperlink_ids, exclude_backed_off
 
 logger = logging.getLogger(__name__)
 
+def dispatch_ssl_scan(hyperlinks, kind, task_id=''):
+    """
+    Start a checkpointed scan run of hyperlinks, fanned out across workers.
+    
+    The hyperlinks are split into chunks (settings.SSL_SCAN_CHUNK_SIZE) that
+    are stored as SSLScanChunk checkpoints and dealt round-robin onto at most
+    settings.SSL_SCAN_MAX_PARALLEL_CHUNKS parallel subtasks in a Celery chord;
+    summarize_ssl_check closes the run. If an earlier run of the same kind was
+    interrupted (stale heartbeat or deadline reached) it is resumed instead.
+    task_id links the run to the job that started it, for progress polling.
+    
+    Returns:
+        str: A dispatch summary
+    """
+    run = SSLScanRun.objects.filter(kind=kind, status__in=['running', 'expired']).first()
+    if run and run.status == 'running' and not run.is_stale:
+        return f"Scan run #{run.pk} is still in progress"
+    if run:
+        return resume_ssl_scan(run, task_id)
+    
+    rows = hyperlinks.order_by('endpoint', 'pk').values_list('pk', 'endpoint')
+    chunks = chunk_hyperlink_ids(rows)
+    if not chunks:
+        return "Updated 0 SSL certificates, 0 errors"
+    
+    with transaction.atomic():
+        run = SSLScanRun.objects.create(
+            kind=kind,
+            deadline=timezone.now() + timedelta(minutes=settings.SSL_SCAN_TIME_BUDGET_MINUTES),
+            total_urls=sum(len(chunk) for chunk in chunks),
+            task_id=task_id or '',
+        )
+        chunk_objs = SSLScanChunk.objects.bulk_create([
+            SSLScanChunk(run=run, position=position, hyperlink_ids=chunk, size=len(chunk))
+            for position, chunk in enumerate(chunks)
+        ])
+    lanes = _start_chunks(run, [chunk.pk for chunk in chunk_objs])
+    
+    return f"Scan run #{run.pk}: dispatched {run.total_urls} URLs in {len(chunks)} chunks across {lanes} subtasks"
+
+def resume_ssl_scan(run, task_id=''):
+    """
+    Re-dispatch the pending chunks of an interrupted scan run with a fresh deadline.
+    """
+    pending = list(run.chunks.filter(status='pending').values_list('pk', flat=True))
+    run.status = 'running'
+    run.deadline = timezone.now() + timedelta(minutes=settings.SSL_SCAN_TIME_BUDGET_MINUTES)
+    run.heartbeat_at = timezone.now()
+    update_fields = ['status', 'deadline', 'heartbeat_at']
+    if task_id:
+        run.task_id = task_id
+        update_fields.append('task_id')
+    run.save(update_fields=update_fields)
+    
+    if not pending:
+        # Every chunk finished but the chord callback was lost
+        return summarize_ssl_check([], run.pk)
+    
+    lanes = _start_chunks(run, pending)
+    return f"Resumed scan run #{run.pk}: {len(pending)} chunks left across {lanes} subtasks"
+
+def _start_chunks(run, chunk_pks):
+    """Deal chunk ids onto parallel lanes and dispatch them as a chord; returns the lane count"""
+    max_parallel = settings.SSL_SCAN_MAX_PARALLEL_CHUNKS
+    lanes = [chunk_pks[i::max_parallel] for i in range(min(max_parallel, len(chunk_pks)))]
+    chord(check_ssl_certificate_chunks.s(lane) for lane in lanes)(summarize_ssl_check.s(run.pk))
+    return len(lanes)
+
 @shared_task
-def check_ssl_certificates():
+def check_ssl_certificate_chunks(chunk_pks):
     """
-    Check SSL certificates for all hyperlinks and update their expiry information.
+    Scan pending SSLScanChunks one after another, checkpointing each as it finishes.
+    
+    Stops early once the run's deadline has passed; the remaining chunks stay
+    pending for the next run to resume.
+    
+    Returns:
+        int: Number of chunks completed
     """
-    hyperlinks = HyperLink.objects.filter(is_enabled=True)
-    updated_count = 0
-    error_count = 0
-    
-    for hyperlink in hyperlinks:
-        try:
-            # Check if URL is accessible
-            is_accessible = check_url_accessibility(hyperlink.url)
-            
-            if not is_accessible:
-                logger.warning(f"URL {hyperlink.url} is not accessible")
-                continue
-            
-            # Get SSL certificate information
-            expiry_date, issuer, subject, is_valid = get_ssl_expiry_date(hyperlink.url)
-            
-            # Update or create SSL certificate record
-            ssl_cert, created = SSLCertificate.objects.update_or_create(
-                hyperlink=hyperlink,
-                defaults={
-                    'expiry_date': expiry_date,
-                    'issuer': issuer or '',
-                    'subject': subject or '',
-                    'is_valid': is_valid,
-                    'notification_status': 'pending' if expiry_date and expiry_date > timezone.now() else 'expired'
-                }
+    completed = 0
+    chunks = SSLScanChunk.objects.filter(pk__in=chunk_pks, status='pending').select_related('run').order_by('position')
+    for chunk in chunks:
+        if timezone.now() >= chunk.run.deadline:
+            logger.warning(f"Scan run #{chunk.run_id} reached its deadline, leaving chunk {chunk.position} for later")
+            break
+        
+        updated_count, error_count = scan_hyperlinks(HyperLink.objects.filter(pk__in=chunk.hyperlink_ids, is_enabled=True))
+        
+        now = timezone.now()
+        with transaction.atomic():
+            SSLScanChunk.objects.filter(pk=chunk.pk).update(
+                status='done', updated_count=updated_count, error_count=error_count, finished_at=now,
             )
-            
-            updated_count += 1
-            
-        except Exception as e:
-            logger.error(f"Error checking SSL for {hyperlink.url}: {str(e)}")
-            error_count += 1
+            SSLScanRun.objects.filter(pk=chunk.run_id).update(heartbeat_at=now)
+        completed += 1
+    return completed
+
+@shared_task
+def summarize_ssl_check(results, run_id):
+    """
+    Chord callback: close the scan run and aggregate its chunk counts into the summary.
+    """
+    run = SSLScanRun.objects.get(pk=run_id)
+    totals = run.totals()
+    
+    if totals['pending_chunks']:
+        run.status = 'expired'
+    else:
+        run.status = 'completed'
+        run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'finished_at'])
     
-    return f"Updated {updated_count} SSL certificates, {error_count} errors"
+    summary = f"Updated {totals['updated']} SSL certificates, {totals['errors']} errors"
+    if totals['pending_chunks']:
+        summary += f" ({totals['pending_chunks']} chunks left to resume)"
+    logger.info(f"Scan run #{run.pk}: {summary}")
+    return summary
+
+@shared_task(bind=True)
+def check_ssl_certificates(self):
+    """
+    Check SSL certificates for all hyperlinks and update their expiry information.
+    
+    Hyperlinks sharing an endpoint (hostname, port, SNI) are probed once and the
+    result is fanned out to each of them. Endpoints in failure backoff are
+    skipped until their retry time.
+    """
+    return dispatch_ssl_scan(
+        exclude_backed_off(HyperLink.objects.filter(is_enabled=True)), 'full', task_id=self.request.id,
+    )
+
+@shared_task
+def check_hyperlink_ssl(hyperlink_id):
+    """
+    Check the SSL certificate of a single hyperlink on demand and store it.
+    
+    Returns:
+        dict: Outcome for the job status endpoint, with a user-facing message
+        and its level ('success' or 'error')
+    """
+    hyperlink = HyperLink.objects.get(pk=hyperlink_id)
+    result, cached, age = probe_url_cached(hyperlink.url)
+    outcome = {
+        'hyperlink_id': hyperlink.pk,
+        'url': hyperlink.url,
+        'certificate_id': None,
+        'expiry_date': None,
+        'level': 'error',
+    }
+    
+    if not result.is_accessible:
+        outcome['message'] = f"URL {hyperlink.url} is not accessible"
+        return outcome
+    if not result.expiry_date:
+        outcome['message'] = f"Could not retrieve SSL certificate information for {hyperlink.url}"
+        return outcome
+    
+    # Update or create SSL certificate record, rescheduling its next check
+    with SSLResultWriter() as writer:
+        writer.add(hyperlink, SSLCertificate.objects.filter(hyperlink=hyperlink).first(), result)
+    
+    outcome.update(
+        certificate_id=SSLCertificate.objects.filter(hyperlink=hyperlink).values_list('pk', flat=True).first(),
+        expiry_date=result.expiry_date.isoformat(),
+        level='success',
+        message=f"SSL certificate for {hyperlink.url} checked successfully. Expires on {result.expiry_date.strftime('%Y-%m-%d')}",
+    )
+    return outcome
+
+@shared_task
+def check_due_ssl_certificates():
+    """
+    Check only the certificates whose adaptive next_check_at has passed.
+    
+    Also picks up a full sweep that was interrupted by a restart or its deadline.
+    """
+    interrupted = SSLScanRun.objects.filter(kind='full', status__in=['running', 'expired']).first()
+    if interrupted and (interrupted.status == 'expired' or interrupted.is_stale):
+        logger.info(resume_ssl_scan(interrupted))
+    return dispatch_ssl_scan(due_hyperlinks(), 'due')
+
+def department_admins_prefetch(lookup):
+    """
+    Prefetch for a department relation that loads its Admin-group users with an email into admin_users.
+    
+    Args:
+        lookup (str): Path to the department users relation, e.g.
+            'hyperlink__servers__department__users'
+    """
+    admins = get_user_model().objects.filter(groups__name='Admin').exclude(email='').distinct().order_by('pk')
+    return Prefetch(lookup, queryset=admins, to_attr='admin_users')
+
+def get_server_recipients(server):
+    """
+    Email addresses to notify about a server: its owner and its department's admins.
+    
+    Uses department.admin_users when it was prefetched (see
+    department_admins_prefetch) and queries the department otherwise.
+    
+    Returns:
+        list: Unique email addresses, owner first
+    """
+    recipients = []
+    if server.owner and server.owner.email:
+        recipients.append(server.owner.email)
+    
+    department = server.department
+    if department:
+        admins = getattr(department, 'admin_users', None)
+        if admins is None:
+            admins = department.users.filter(groups__name='Admin').exclude(email='').distinct().order_by('pk')
+        for admin in admins:
+            if admin.email not in recipients:
+                recipients.append(admin.email)
+    return recipients
+
+def expiring_certificates(now=None):
+    """
+    Certificates that crossed a settings.SSL_NOTIFICATION_DAYS threshold not yet notified, in one query.
+    
+    Each certificate is annotated with notification_days, the tightest
+    threshold it has crossed (it expires within that many days), and is left
+    out if the SSLNotificationLedger already has that threshold for its
+    current expiry date. Rows come with their hyperlink, server, owner,
+    department and department admins loaded.
+    """
+    now = now or timezone.now()
+    thresholds = sorted(settings.SSL_NOTIFICATION_DAYS)
+    if not thresholds:
+        return SSLCertificate.objects.none()
+    
+    notified = SSLNotificationLedger.objects.filter(
+        certificate=OuterRef('pk'),
+        threshold_days=OuterRef('notification_days'),
+        expiry_date=OuterRef('expiry_date'),
+    )
+    return SSLCertificate.objects.filter(
+        expiry_date__gt=now,
+        expiry_date__lte=now + timedelta(days=thresholds[-1]),
+    ).annotate(
+        notification_days=Case(
+            *[When(expiry_date__lte=now + timedelta(days=days), then=Value(days)) for days in thresholds],
+            output_field=IntegerField(),
+        ),
+    ).filter(
+        ~Exists(notified),
+    ).select_related(
+        'hyperlink__servers__owner', 'hyperlink__servers__department',
+    ).prefetch_related(
+        department_admins_prefetch('hyperlink__servers__department__users'),
+    )
+
+def build_ssl_digest(recipient, entries):
+    """
+    Render one digest email listing every expiring certificate for a recipient.
+    
+    Args:
+        recipient (str): Email address
+        entries (list): (days, SSLCertificate) tuples
+    
+    Returns:
+        EmailMultiAlternatives: The message, not yet sent
+    """
+    entries = sorted(entries, key=lambda entry: (entry[0], entry[1].hyperlink.url))
+    certificates = [
+        {
+            'server_name': cert.hyperlink.servers.name,
+            'url': cert.hyperlink.url,
+            'days': days,
+            'expiry_date': cert.expiry_date,
+            'issuer': cert.issuer,
+        }
+        for days, cert in entries
+    ]
+    if len(certificates) == 1:
+        subject = f"SSL Certificate Expiring in {certificates[0]['days']} days: {certificates[0]['url']}"
+    else:
+        subject = f"{len(certificates)} SSL Certificates Expiring within {certificates[-1]['days']} days"
+    
+    context = {'recipient': recipient, 'certificates': certificates}
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string('emails/ssl_expiry_digest.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient],
+    )
+    message.attach_alternative(render_to_string('emails/ssl_expiry_digest.html', context), 'text/html')
+    return message
 
 @shared_task
 def send_ssl_expiry_notifications():
     """
     Send notifications for SSL certificates that are about to expire.
+    
+    Incremental and idempotent, so it can run every few minutes: only
+    certificates that crossed a threshold with no ledger entry are picked up.
+    Recipients are resolved first and each gets a single digest listing all
+    of their newly due certificates. Digests are written to the email outbox
+    together with the ledger entries in one transaction; deliver_email_outbox
+    sends them.
     """
-    notification_days = settings.SSL_NOTIFICATION_DAYS
-    notification_sent_count = 0
+    now = timezone.now()
+    thresholds = settings.SSL_NOTIFICATION_DAYS
+    digests = defaultdict(list)
+    ledger = []
+    certificate_ids = set()
     
-    for days in notification_days:
-        # Calculate the date range for this notification period
-        target_date = timezone.now() + timedelta(days=days)
+    with transaction.atomic():
+        # Overlapping runs would both see the same certificates as not yet notified. Each run
+        # locks the rows it picks up until its ledger entries are committed and skips rows
+        # another run holds, so this works across workers and hosts whatever the cache backend.
+        certificates = expiring_certificates(now).select_for_update(skip_locked=True, of=('self',))
+        for cert in certificates:
+            recipients = get_server_recipients(cert.hyperlink.servers)
+            if not recipients:
+                # No ledger entry either, so it is notified once someone can receive it
+                logger.warning(f"No recipients found for SSL notification: {cert}")
+                continue
+            certificate_ids.add(cert.pk)
+            # Crossing the tightest threshold means every looser one was crossed too; none of them should fire later
+            ledger.extend(
+                SSLNotificationLedger(certificate=cert, threshold_days=days, expiry_date=cert.expiry_date)
+                for days in thresholds if days >= cert.notification_days
+            )
+            for recipient in recipients:
+                digests[recipient].append(((cert.expiry_date - now).days, cert))
         
-        # Find certificates expiring on this date (within 24 hours)
-        expiring_certs = SSLCertificate.objects.filter(
-            notification_status='pending',
-            expiry_date__gte=target_date,
-            expiry_date__lt=target_date + timedelta(days=1)
-        )
+        messages = [build_ssl_digest(recipient, entries) for recipient, entries in digests.items()]
         
-        for cert in expiring_certs:
-            try:
-                # Get server and department information
-                hyperlink = cert.hyperlink
-                server = hyperlink.servers
-                department = server.department
-                
-                # Determine recipients (server owner and department admins)
-                recipients = []
-                if server.owner and server.owner.email:
-                    recipients.append(server.owner.email)
-                
-                if department:
-                    department_admins = department.admins.all()
-                    for admin in department_admins:
-                        if admin.email and admin.email not in recipients:
-                            recipients.append(admin.email)
-                
-                if not recipients:
-                    logger.warning(f"No recipients found for SSL notification: {cert}")
-                    continue
-                
-                # Prepare email content
-                subject = f"SSL Certificate Expiring in {days} days: {hyperlink.url}"
-                context = {
-                    'server_name': server.name,
-                    'url': hyperlink.url,
-                    'days': days,
-                    'expiry_date': cert.expiry_date,
-                    'issuer': cert.issuer,
-                }
-                
-                html_message = render_to_string('emails/ssl_expiry_notification.html', context)
-                plain_message = render_to_string('emails/ssl_expiry_notification.txt', context)
-                
-                # Send email
-                send_mail(
-                    subject=subject,
-                    message=plain_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=recipients,
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                
-                # Update notification status
-                cert.notification_status = 'notified'
-                cert.save(update_fields=['notification_status'])
-                
-                notification_sent_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error sending SSL notification for {cert}: {str(e)}")
-    
-    return f"Sent {notification_sent_count} SSL expiry notifications"
+        # Delivery (with retries) is the outbox's job from here on
+        SSLNotificationLedger.objects.bulk_create(ledger, ignore_conflicts=True)
+        enqueue_messages(messages)
+        SSLCertificate.objects.filter(pk__in=certificate_ids).update(notification_status='notified')
+    
+    if messages:
+        _kick_outbox()
+    return f"Queued {len(messages)} SSL expiry digests covering {len(certificate_ids)} certificates"
+
+def _kick_outbox():
+    """Start delivering right away instead of waiting for the next beat tick"""
+    try:
+        deliver_email_outbox.delay()
+    except Exception as e:
+        logger.warning(f"Could not start outbox delivery, leaving it to the schedule: {str(e)}")
+
+@shared_task
+def deliver_email_outbox():
+    """
+    Drain one batch of the email outbox, re-queueing itself while more mail is due.
+    
+    Route this task to its own queue (settings.EMAIL_OUTBOX_QUEUE) to run
+    delivery on a dedicated worker.
+    """
+    sent_count, failed_count, claimed_count = deliver_batch()
+    if claimed_count == settings.EMAIL_OUTBOX_BATCH_SIZE:
+        _kick_outbox()
+    return f"Sent {sent_count} emails, {failed_count} failed"
 
 @shared_task
 def update_expired_certificates():
@@ -138,4 +390,79 @@ def update_expired_certificates():
         notification_status__in=['pending', 'notified']
     ).update(notification_status='expired', is_valid=False)
     
-    return f"Updated {expired_count} expired SSL certificates"
\ No newline at end of file
+    return f"Updated {expired_count} expired SSL certificates"
+
+@shared_task
+def write_audit_logs(entries):
+    """
+    Background audit writer used when settings.AUDIT_LOG_ASYNC is on.
+    
+    Args:
+        entries (list): Audit log entries as produced by core.auditlog.serialize_entry
+    """
+    AuditLog.objects.bulk_create(
+        [deserialize_entry(values) for values in entries],
+        batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    )
+    return f"Wrote {len(entries)} audit log entries"
+
+@shared_task
+def maintain_audit_log():
+    """
+    Create upcoming audit log partitions and purge entries past settings.AUDIT_LOG_RETENTION_MONTHS.
+    """
+    created, removed, deleted = maintain_audit_partitions()
+    return f"Created {len(created)} audit log partitions, removed {len(removed)}, deleted {deleted} rows"
+
+@shared_task
+def archive_audit_log():
+    """
+    Move audit entries older than settings.AUDIT_ARCHIVE_AFTER_DAYS to the compressed archive.
+    """
+    if settings.AUDIT_ARCHIVE_AFTER_DAYS <= 0:
+        return "Audit log archiving is disabled"
+    day_count, row_count = archive_before(archive_cutoff(settings.AUDIT_ARCHIVE_AFTER_DAYS))
+    return f"Archived {row_count} audit log entries from {day_count} days"
+
+@shared_task(bind=True)
+def run_export_job(self, job_id):
+    """
+    Build the file of a pending ExportJob in the background.
+    
+    Route this task to its own queue (settings.EXPORT_JOB_QUEUE) to keep
+    long exports off the workers that run the short jobs.
+    """
+    job = ExportJob.objects.select_related('user').get(pk=job_id)
+    if job.status != 'pending':
+        return f"Export job #{job_id} is already {job.get_status_display().lower()}"
+    job.task_id = self.request.id or ''
+    try:
+        run_export(job)
+    except Exception as e:
+        logger.error(f"Error running export job #{job_id}: {str(e)}")
+        ExportJob.objects.filter(pk=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        return f"Export job #{job_id} failed: {str(e)}"
+    return f"Exported {job.rows_written} rows to {job.file.name}"
+
+@shared_task
+def purge_export_jobs():
+    """
+    Fail stale running export jobs and delete jobs and files older than settings.EXPORT_JOB_RETENTION_DAYS.
+    """
+    failed, deleted = purge_expired_exports()
+    return f"Failed {failed} stale export jobs, deleted {deleted} expired export jobs"
+
+@shared_task
+def purge_ssl_scan_runs(days=None):
+    """
+    Delete scan runs (and their chunks) started more than settings.SSL_SCAN_RUN_RETENTION_DAYS days ago.
+    
+    Running scans are kept; an interrupted run that old is dropped rather
+    than resumed, so the next dispatch starts a fresh sweep.
+    """
+    days = settings.SSL_SCAN_RUN_RETENTION_DAYS if days is None else days
+    runs = SSLScanRun.objects.filter(started_at__lt=timezone.now() - timedelta(days=days)).exclude(status='running')
+    # Chunks first, in one statement, so the runs' cascade has nothing left to collect
+    chunk_count, _ = SSLScanChunk.objects.filter(run__in=runs).delete()
+    run_count, _ = runs.delete()
+    return f"Deleted {run_count} SSL scan runs and {chunk_count} chunks"
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import socket
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_init, post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Department
+from auditlog.models import LogEntry
+from .auditlog import audit_buffer, set_current_request
+from .models import Server, HyperLink, SSLCertificate, SSLScanRun, SSLScanChunk, EmailOutbox, ExportJob, AuditLog
+from server_mgmt.celery import app as celery_app
+from .tasks import (
+    check_hyperlink_ssl, check_ssl_certificates, deliver_email_outbox, expiring_certificates, get_server_recipients,
+    purge_ssl_scan_runs, run_export_job, send_ssl_expiry_notifications, summarize_ssl_check, write_audit_logs,
+)
+from .utils.audit_archive import ArchiveSearch, archive_before, list_shards
+from .utils.export_jobs import fail_stale, purge_expired
+from .utils.audit_partitions import add_months, delete_before, month_start, partition_name, retention_cutoff
+from .utils.ssl_scan import SSLResultWriter, apply_probe_result, chunk_hyperlink_ids, due_hyperlinks, exclude_backed_off
+from .utils.ssl_bench import TLSFleet
+from .utils.ssl_checker import DNSCache, Endpoint, ProbeResult, parse_endpoint, probe_url_cached, scan_endpoints
+
+
+def make_result(endpoint, is_accessible=True, days=90, fingerprint='ab' * 32):
+    if not is_accessible:
+        return ProbeResult(endpoint=endpoint, error='ConnectionRefusedError')
+    return ProbeResult(
+        endpoint=endpoint,
+        is_accessible=True,
+        status_code=200,
+        expiry_date=timezone.now() + timedelta(days=days),
+        issuer='CN=Test CA',
+        subject='CN=example.com',
+        is_valid=True,
+        fingerprint=fingerprint,
+    )
+
+
+class EagerCeleryMixin:
+    """Run Celery tasks (including chords) inline for the duration of each test"""
+
+    def setUp(self):
+        super().setUp()
+        self._always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', self._always_eager)
+
+
+class CheckSSLCertificatesTaskTest(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.department = Department.objects.create(name='Ops')
+        self.server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux', department=self.department)
+        self.up = HyperLink.objects.create(servers=self.server, url='https://up.example.com')
+        self.down = HyperLink.objects.create(servers=self.server, url='https://down.example.com')
+        HyperLink.objects.create(servers=self.server, url='https://disabled.example.com', is_enabled=False)
+
+    @mock.patch('core.utils.ssl_scan.scan_endpoints')
+    def test_scan_results_are_persisted(self, scan_endpoints):
+        scan_endpoints.return_value = {
+            'up.example.com:443': make_result('up.example.com:443'),
+            'down.example.com:443': make_result('down.example.com:443', is_accessible=False),
+        }
+
+        summary = check_ssl_certificates()
+
+        run = SSLScanRun.objects.get()
+        self.assertEqual(summary, f"Scan run #{run.pk}: dispatched 2 URLs in 1 chunks across 1 subtasks")
+        self.assertEqual(run.status, 'completed')
+        probed = sorted(endpoint.key for endpoint in scan_endpoints.call_args.args[0])
+        self.assertEqual(probed, ['down.example.com:443', 'up.example.com:443'])
+        cert = SSLCertificate.objects.get(hyperlink=self.up)
+        self.assertEqual(cert.issuer, 'CN=Test CA')
+        self.assertEqual(cert.notification_status, 'pending')
+        self.assertIsNotNone(cert.next_check_at)
+        # Unreachable links get a placeholder row so they are retried, not re-probed every run
+        down_cert = SSLCertificate.objects.get(hyperlink=self.down)
+        self.assertIsNone(down_cert.expiry_date)
+        self.assertFalse(down_cert.is_valid)
+
+    @mock.patch('core.utils.ssl_scan.scan_endpoints')
+    def test_shared_endpoint_is_probed_once(self, scan_endpoints):
+        other_server = Server.objects.create(name='web02', ip_address='10.0.0.2', os='Linux', department=self.department)
+        alias = HyperLink.objects.create(servers=other_server, url='UP.example.com/status')
+        scan_endpoints.return_value = {
+            'up.example.com:443': make_result('up.example.com:443'),
+            'down.example.com:443': make_result('down.example.com:443', is_accessible=False),
+        }
+
+        summary = check_ssl_certificates()
+
+        self.assertTrue(summary.endswith("dispatched 3 URLs in 1 chunks across 1 subtasks"))
+        self.assertEqual(len(list(scan_endpoints.call_args.args[0])), 2)
+        self.assertEqual(alias.endpoint, 'up.example.com:443')
+        self.assertTrue(SSLCertificate.objects.filter(hyperlink=alias).exists())
+
+    @mock.patch('core.utils.ssl_scan.scan_endpoints')
+    @mock.patch('core.tasks.summarize_ssl_check.run', wraps=summarize_ssl_check.run)
+    def test_scan_fans_out_in_chunks(self, summarize, scan_endpoints):
+        scan_endpoints.side_effect = lambda endpoints: {
+            endpoint.key: make_result(endpoint.key) for endpoint in endpoints
+        }
+
+        with self.settings(SSL_SCAN_CHUNK_SIZE=1, SSL_SCAN_MAX_PARALLEL_CHUNKS=1):
+            summary = check_ssl_certificates()
+
+        self.assertTrue(summary.endswith("dispatched 2 URLs in 2 chunks across 1 subtasks"))
+        self.assertEqual(scan_endpoints.call_count, 2)
+        self.assertEqual(summarize.call_args.args[0], [2])
+
+    @mock.patch('core.utils.ssl_scan.scan_endpoints')
+    def test_run_past_deadline_is_resumed(self, scan_endpoints):
+        scan_endpoints.side_effect = lambda endpoints: {
+            endpoint.key: make_result(endpoint.key) for endpoint in endpoints
+        }
+
+        with self.settings(SSL_SCAN_CHUNK_SIZE=1, SSL_SCAN_MAX_PARALLEL_CHUNKS=1, SSL_SCAN_TIME_BUDGET_MINUTES=0):
+            check_ssl_certificates()
+
+        run = SSLScanRun.objects.get()
+        self.assertEqual(run.status, 'expired')
+        self.assertEqual(run.totals()['pending_chunks'], 2)
+        scan_endpoints.assert_not_called()
+
+        summary = check_ssl_certificates()
+
+        self.assertEqual(summary, f"Resumed scan run #{run.pk}: 2 chunks left across 2 subtasks")
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.totals()['updated'], 2)
+        self.assertEqual(SSLScanRun.objects.count(), 1)
+
+    def test_running_scan_is_not_started_twice(self):
+        run = SSLScanRun.objects.create(kind='full', deadline=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(check_ssl_certificates(), f"Scan run #{run.pk} is still in progress")
+
+    def test_old_scan_runs_are_purged(self):
+        deadline = timezone.now() + timedelta(hours=1)
+        old = SSLScanRun.objects.create(kind='full', status='completed', deadline=deadline)
+        SSLScanChunk.objects.create(run=old, position=0, hyperlink_ids=[self.up.pk], size=1, status='done')
+        running = SSLScanRun.objects.create(kind='due', deadline=deadline)
+        recent = SSLScanRun.objects.create(kind='due', status='completed', deadline=deadline)
+        SSLScanRun.objects.filter(pk__in=[old.pk, running.pk]).update(started_at=timezone.now() - timedelta(days=31))
+
+        with self.settings(SSL_SCAN_RUN_RETENTION_DAYS=30):
+            summary = purge_ssl_scan_runs()
+
+        self.assertEqual(summary, "Deleted 1 SSL scan runs and 1 chunks")
+        self.assertEqual(set(SSLScanRun.objects.values_list('pk', flat=True)), {running.pk, recent.pk})
+        self.assertFalse(SSLScanChunk.objects.exists())
+
+
+class ManualSSLCheckTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        self.hyperlink = HyperLink.objects.create(servers=server, url='https://up.example.com')
+        self.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.user)
+
+    @mock.patch('core.tasks.probe_url_cached')
+    def test_check_job_stores_certificate(self, probe_url_cached):
+        probe_url_cached.return_value = (make_result('up.example.com:443'), False, 0.0)
+
+        outcome = check_hyperlink_ssl(self.hyperlink.pk)
+
+        cert = SSLCertificate.objects.get(hyperlink=self.hyperlink)
+        self.assertEqual(outcome['level'], 'success')
+        self.assertEqual(outcome['certificate_id'], cert.pk)
+
+    @mock.patch('core.views_ssl.check_hyperlink_ssl.delay')
+    def test_check_view_enqueues_and_redirects_with_job(self, delay):
+        delay.return_value = mock.Mock(id='job-1')
+
+        response = self.client.get(reverse('core:check-ssl-certificate', args=[self.hyperlink.pk]))
+
+        delay.assert_called_once_with(self.hyperlink.pk)
+        self.assertRedirects(
+            response, reverse('core:server-urls-detail', args=[self.hyperlink.pk]) + '?job=job-1',
+            fetch_redirect_response=False,
+        )
+
+    @mock.patch('core.views_ssl.check_ssl_certificates.delay', side_effect=OSError('broker down'))
+    @mock.patch('core.tasks.dispatch_ssl_scan')
+    def test_sweep_is_never_run_in_the_request(self, dispatch, delay):
+        self.client.get(reverse('core:run-ssl-check'))
+
+        dispatch.assert_not_called()
+
+    def test_job_status_reports_scan_progress(self):
+        run = SSLScanRun.objects.create(
+            kind='full', deadline=timezone.now() + timedelta(hours=1), total_urls=3, task_id='job-2',
+        )
+        run.chunks.create(position=0, hyperlink_ids=[1, 2], size=2, status='done', updated_count=2)
+        run.chunks.create(position=1, hyperlink_ids=[3], size=1)
+        with mock.patch('core.views_ssl.check_ssl_certificates.delay', return_value=mock.Mock(id='job-2')):
+            self.client.get(reverse('core:run-ssl-check'))
+
+        data = self.client.get(reverse('core:ssl-job-status', args=['job-2'])).json()
+
+        self.assertFalse(data['finished'])
+        self.assertEqual(data['scan']['done_urls'], 2)
+        self.assertEqual(data['scan']['total_urls'], 3)
+
+    def test_job_status_of_another_session_is_not_found(self):
+        SSLScanRun.objects.create(kind='full', deadline=timezone.now() + timedelta(hours=1), task_id='job-3')
+
+        response = self.client.get(reverse('core:ssl-job-status', args=['job-3']))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('scan', response.json())
+
+
+@override_settings(EMAIL_OUTBOX_RATE_PER_MINUTE=0)
+class SSLExpiryNotificationTest(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.department = Department.objects.create(name='Ops')
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        admin = User.objects.create_user('admin', 'admin@example.com', 'pw')
+        admin.groups.add(Group.objects.create(name='Admin'))
+        admin.departments.add(self.department)
+
+    def make_certificate(self, server, url, days):
+        hyperlink = HyperLink.objects.create(servers=server, url=url)
+        return SSLCertificate.objects.create(
+            hyperlink=hyperlink,
+            expiry_date=timezone.now() + timedelta(days=days, hours=-1),
+            issuer='CN=Test CA',
+        )
+
+    def test_one_digest_per_recipient(self):
+        server = Server.objects.create(
+            name='web01', ip_address='10.0.0.1', os='Linux', department=self.department, owner=self.owner,
+        )
+        other = Server.objects.create(name='web02', ip_address='10.0.0.2', os='Linux', owner=self.owner)
+        certs = [
+            self.make_certificate(server, 'https://a.example.com', 7),
+            self.make_certificate(server, 'https://b.example.com', 30),
+            self.make_certificate(other, 'https://c.example.com', 1),
+        ]
+
+        summary = send_ssl_expiry_notifications()
+
+        self.assertEqual(summary, "Queued 2 SSL expiry digests covering 3 certificates")
+        # Delivery is kicked off right away
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 2)
+        digests = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(set(digests), {'owner@example.com', 'admin@example.com'})
+        self.assertEqual(digests['owner@example.com'].subject, "3 SSL Certificates Expiring within 29 days")
+        self.assertIn('https://c.example.com', digests['owner@example.com'].body)
+        self.assertEqual(digests['admin@example.com'].subject, "2 SSL Certificates Expiring within 29 days")
+        for cert in certs:
+            cert.refresh_from_db()
+            self.assertEqual(cert.notification_status, 'notified')
+
+
+    def test_each_threshold_fires_once(self):
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux', owner=self.owner)
+        cert = self.make_certificate(server, 'https://a.example.com', 14)
+
+        self.assertEqual(send_ssl_expiry_notifications(), "Queued 1 SSL expiry digests covering 1 certificates")
+        self.assertEqual(send_ssl_expiry_notifications(), "Queued 0 SSL expiry digests covering 0 certificates")
+        self.assertEqual(
+            sorted(cert.notifications.values_list('threshold_days', flat=True)), [14, 30],
+        )
+
+        # A week later the 7 day threshold is crossed
+        SSLCertificate.objects.filter(pk=cert.pk).update(expiry_date=cert.expiry_date - timedelta(days=7))
+        self.assertEqual(send_ssl_expiry_notifications(), "Queued 1 SSL expiry digests covering 1 certificates")
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_certificate_without_recipients_is_notified_once_it_has_one(self):
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        cert = self.make_certificate(server, 'https://a.example.com', 14)
+
+        self.assertEqual(send_ssl_expiry_notifications(), "Queued 0 SSL expiry digests covering 0 certificates")
+        self.assertFalse(cert.notifications.exists())
+
+        Server.objects.filter(pk=server.pk).update(owner=self.owner)
+        self.assertEqual(send_ssl_expiry_notifications(), "Queued 1 SSL expiry digests covering 1 certificates")
+        self.assertEqual(mail.outbox[0].to, ['owner@example.com'])
+
+    def test_overlapping_runs_skip_locked_certificates(self):
+        # SQLite has no row locks, so check the run asks the database for them
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=lambda qs, **kwargs: qs) as lock:
+            send_ssl_expiry_notifications()
+
+        lock.assert_called_once_with(mock.ANY, skip_locked=True, of=('self',))
+
+    def test_candidates_and_recipients_in_two_queries(self):
+        for i in range(3):
+            department = Department.objects.create(name=f'Dept {i}')
+            get_user_model().objects.get(username='admin').departments.add(department)
+            server = Server.objects.create(
+                name=f'web{i}', ip_address='10.0.0.1', os='Linux', department=department, owner=self.owner,
+            )
+            self.make_certificate(server, f'https://{i}.example.com', [30, 7, 3][i])
+        self.make_certificate(server, 'https://later.example.com', 45)
+
+        with self.assertNumQueries(2):
+            candidates = {
+                cert.hyperlink.url: (cert.notification_days, get_server_recipients(cert.hyperlink.servers))
+                for cert in expiring_certificates()
+            }
+
+        self.assertEqual(candidates, {
+            f'https://{i}.example.com': (days, ['owner@example.com', 'admin@example.com'])
+            for i, days in enumerate([30, 7, 3])
+        })
+
+
+class EmailOutboxTest(TestCase):
+    def setUp(self):
+        self.email = EmailOutbox.objects.create(
+            subject='Hello', body='Body', from_email='noreply@example.com', to=['ops@example.com'],
+        )
+
+    @mock.patch('core.utils.email_outbox.get_connection')
+    def test_failures_back_off_then_dead_letter(self, get_connection):
+        get_connection.return_value.send_messages.side_effect = OSError('connection refused')
+
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_MINUTES=5):
+            self.assertEqual(deliver_email_outbox(), "Sent 0 emails, 1 failed")
+            self.email.refresh_from_db()
+            self.assertEqual((self.email.status, self.email.attempts), ('pending', 1))
+            self.assertGreater(self.email.next_attempt_at, timezone.now() + timedelta(minutes=4))
+            self.assertEqual(self.email.last_error, 'connection refused')
+
+            # Not due yet
+            self.assertEqual(deliver_email_outbox(), "Sent 0 emails, 0 failed")
+
+            EmailOutbox.objects.update(next_attempt_at=timezone.now())
+            deliver_email_outbox()
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), ('dead', 2))
+
+    @mock.patch('core.utils.email_outbox.get_connection')
+    def test_batch_shares_one_connection(self, get_connection):
+        for i in range(2):
+            EmailOutbox.objects.create(
+                subject=f'Hello {i}', body='Body', from_email='noreply@example.com', to=['ops@example.com'],
+            )
+        connection = get_connection.return_value
+
+        self.assertEqual(deliver_email_outbox(), "Sent 3 emails, 0 failed")
+        self.assertEqual(connection.open.call_count, 1)
+        self.assertEqual(connection.send_messages.call_count, 3)
+
+        # A failure drops the connection and the next message reopens it
+        EmailOutbox.objects.update(status='pending', next_attempt_at=timezone.now())
+        connection.reset_mock()
+        connection.send_messages.side_effect = [OSError('reset'), 1, 1]
+        self.assertEqual(deliver_email_outbox(), "Sent 2 emails, 1 failed")
+        self.assertEqual(connection.open.call_count, 2)
+        self.assertEqual(connection.close.call_count, 2)
+
+    def test_abandoned_lease_is_retried(self):
+        EmailOutbox.objects.update(status='sending', next_attempt_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(deliver_email_outbox(), "Sent 1 emails, 0 failed")
+        self.assertEqual(mail.outbox[0].to, ['ops@example.com'])
+
+
+class SSLCertificateListViewTest(TestCase):
+    def setUp(self):
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        for i, days in enumerate([-3, 2, 3, 20, 90, None]):
+            hyperlink = HyperLink.objects.create(servers=server, url=f'https://{i}.example.com')
+            expiry_date = timezone.now() + timedelta(days=days, hours=1) if days is not None else None
+            SSLCertificate.objects.create(hyperlink=hyperlink, expiry_date=expiry_date)
+        user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(user)
+
+    def test_status_buckets_match_model_status(self):
+        statuses = {cert.pk: cert.status for cert in SSLCertificate.objects.all()}
+        annotated = dict(SSLCertificate.objects.with_status().values_list('pk', 'status_bucket'))
+
+        self.assertEqual(annotated, statuses)
+        self.assertEqual(
+            SSLCertificate.objects.status_counts(),
+            {'Critical': 2, 'Warning': 1, 'Valid': 1, 'Expired': 1, 'Unknown': 1},
+        )
+
+    def test_buckets_are_paginated_and_filtered(self):
+        with mock.patch('core.views_ssl.SSLCertificateListView.paginate_bucket_by', 1):
+            response = self.client.get(
+                reverse('core:ssl-certificate-list'), {'status': 'Critical', 'critical_page': 2, 'job': 'abc'},
+            )
+
+        [bucket] = response.context['buckets']
+        self.assertEqual(bucket['page_obj'].number, 2)
+        self.assertEqual([cert.hyperlink.url for cert in bucket['page_obj']], ['https://2.example.com'])
+        self.assertIn('critical_page=1', bucket['previous_query'])
+        self.assertIn('status=Critical', bucket['previous_query'])
+        self.assertNotIn('job=', bucket['previous_query'])
+
+        response = self.client.get(reverse('core:ssl-certificate-list'), {'q': '4.example'})
+        self.assertEqual(response.context['total_count'], 1)
+        self.assertContains(response, 'https://4.example.com')
+
+
+class AuditChangeCaptureTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('ops', 'ops@example.com', 'pw')
+        self.server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        set_current_request(mock.Mock(user=self.user, META={'REMOTE_ADDR': '10.1.1.1'}))
+        self.addCleanup(set_current_request, None)
+
+    def test_update_is_diffed_without_refetching(self):
+        server = Server.objects.get(pk=self.server.pk)
+        server.name = 'web02'
+
+        # Only the UPDATE; the audit row is written once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            server.save()
+
+        log = AuditLog.objects.get(action='UPDATE')
+        self.assertEqual(log.changes, {'name': {'old': 'web01', 'new': 'web02'}})
+
+    def test_snapshot_follows_saves_and_update_fields(self):
+        self.server.os = 'FreeBSD'
+        self.server.location = 'DC1'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.server.save(update_fields=['os'])
+            self.server.save()
+
+        first, second = AuditLog.objects.filter(action='UPDATE').order_by('pk')
+        self.assertEqual(first.changes, {'os': {'old': 'Linux', 'new': 'FreeBSD'}})
+        self.assertEqual(second.changes, {'location': {'old': '', 'new': 'DC1'}})
+
+
+class AuditBufferTest(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('ops', 'ops@example.com', 'pw')
+        set_current_request(mock.Mock(user=self.user, META={'REMOTE_ADDR': '10.1.1.1'}))
+        self.addCleanup(set_current_request, None)
+
+    def test_entries_are_written_when_the_scope_closes(self):
+        with audit_buffer():
+            with self.captureOnCommitCallbacks(execute=True):
+                servers = [
+                    Server.objects.create(name=f'web{i}', ip_address=f'10.0.0.{i}', os='Linux')
+                    for i in range(3)
+                ]
+                servers[0].delete()
+            self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(AuditLog.objects.filter(action='CREATE').count(), 3)
+        self.assertEqual(AuditLog.objects.filter(action='DELETE').count(), 1)
+
+    def test_flush_is_one_insert(self):
+        servers = [
+            Server.objects.create(name=f'web{i}', ip_address=f'10.0.0.{i}', os='Linux')
+            for i in range(3)
+        ]
+
+        # Three UPDATEs, then a single INSERT for their audit entries
+        with self.assertNumQueries(4):
+            with audit_buffer(), self.captureOnCommitCallbacks(execute=True):
+                for server in servers:
+                    server.os = 'FreeBSD'
+                    server.save()
+        self.assertEqual(AuditLog.objects.filter(action='UPDATE').count(), 3)
+
+    def test_rolled_back_changes_are_not_logged(self):
+        with audit_buffer(), self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+                raise RuntimeError
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_timestamp_is_event_time(self):
+        with audit_buffer():
+            with self.captureOnCommitCallbacks(execute=True):
+                Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+            flushed_after = timezone.now()
+        self.assertLessEqual(AuditLog.objects.get().timestamp, flushed_after)
+
+    @override_settings(AUDIT_LOG_ASYNC=True)
+    def test_async_mode_hands_batches_to_the_writer_task(self):
+        with mock.patch('core.tasks.write_audit_logs.delay', wraps=write_audit_logs.delay) as delay:
+            with audit_buffer(), self.captureOnCommitCallbacks(execute=True):
+                Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+                Server.objects.create(name='web02', ip_address='10.0.0.2', os='Linux')
+        delay.assert_called_once()
+        self.assertEqual(len(delay.call_args.args[0]), 2)
+        self.assertEqual(AuditLog.objects.filter(action='CREATE', ip_address='10.1.1.1').count(), 2)
+
+
+class AuditRegistryTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('ops', 'ops@example.com', 'pw')
+        set_current_request(mock.Mock(user=self.user, META={'REMOTE_ADDR': '10.1.1.1'}))
+        self.addCleanup(set_current_request, None)
+
+    def test_receivers_are_only_connected_for_registered_models(self):
+        self.assertTrue(post_save.has_listeners(Server))
+        self.assertFalse(post_save.has_listeners(EmailOutbox))
+        self.assertFalse(post_init.has_listeners(SSLScanRun))
+
+    def test_excluded_fields_are_not_captured(self):
+        self.user.set_password('secret')
+        self.user.first_name = 'Ops'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            # Only unaudited fields written: not logged at all
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+
+        log = AuditLog.objects.get(model_name='User')
+        self.assertEqual(log.changes, {'first_name': {'old': '', 'new': 'Ops'}})
+
+    def test_department_is_written_to_one_audit_store(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.create(name='Ops')
+
+        self.assertEqual(AuditLog.objects.filter(model_name='Department').count(), 1)
+        self.assertFalse(LogEntry.objects.exists())
+
+
+class AuditRetentionTest(TestCase):
+    def setUp(self):
+        self.now = datetime(2026, 10, 18, 12, 0, tzinfo=dt_timezone.utc)
+        for month in (5, 6, 7, 8, 9, 10):
+            for day in (1, 28):
+                AuditLog.objects.create(
+                    action='UPDATE', model_name='Server',
+                    timestamp=datetime(2026, month, day, 9, 0, tzinfo=dt_timezone.utc),
+                )
+
+    def test_month_arithmetic(self):
+        self.assertEqual(month_start(self.now), datetime(2026, 10, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(add_months(month_start(self.now), 3), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(retention_cutoff(3, self.now), datetime(2026, 8, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partition_name(datetime(2027, 1, 1, tzinfo=dt_timezone.utc)), 'core_auditlog_p2027_01')
+
+    def test_unpartitioned_purge_deletes_whole_months_in_chunks(self):
+        deleted = delete_before(retention_cutoff(3, self.now), chunk_size=4)
+
+        self.assertEqual(deleted, 6)
+        self.assertEqual(AuditLog.objects.count(), 6)
+        self.assertEqual(AuditLog.objects.earliest('timestamp').timestamp, datetime(2026, 8, 1, 9, 0, tzinfo=dt_timezone.utc))
+
+    def test_command_applies_retention(self):
+        out = io.StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            call_command('audit_partitions', '--retention-months', '2', stdout=out)
+
+        self.assertIn('0 partitions created, 0 partitions removed, 8 rows deleted', out.getvalue())
+        self.assertEqual(AuditLog.objects.count(), 4)
+
+    def test_retention_is_off_by_default(self):
+        call_command('audit_partitions', stdout=io.StringIO())
+        self.assertEqual(AuditLog.objects.count(), 12)
+
+
+@override_settings(TIME_ZONE='UTC')
+class AuditLogListViewTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.user)
+        AuditLog.objects.all().delete()
+        for day in (1, 2, 3):
+            AuditLog.objects.create(
+                action='UPDATE', model_name='Server', object_repr=f'day {day}',
+                timestamp=datetime(2026, 10, day, 23, 30, tzinfo=dt_timezone.utc),
+            )
+
+    def test_date_filters_are_inclusive_timestamp_ranges(self):
+        params = {'date_from': '2026-10-02', 'date_to': '2026-10-03', 'model': 'Server'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('core:audit-log-list'), params)
+
+        self.assertEqual([log.object_repr for log in response.context['audit_logs']], ['day 3', 'day 2'])
+        sql = ' '.join(query['sql'] for query in queries.captured_queries if 'core_auditlog' in query['sql'])
+        self.assertNotIn('django_datetime_cast_date', sql)
+
+        response = self.client.get(reverse('core:audit-log-export'), params)
+        self.assertEqual(response.getvalue().decode().count('day '), 2)
+
+    def test_invalid_dates_are_ignored(self):
+        response = self.client.get(reverse('core:audit-log-list'), {'date_from': '2026-02-30'})
+        self.assertEqual(len(response.context['audit_logs']), 3)
+
+
+class AuditArchiveTest(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        override = override_settings(AUDIT_ARCHIVE_DIR=self.archive_dir.name, TIME_ZONE='UTC')
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw', first_name='Rita')
+        for day in (1, 2):
+            for hour, action in ((9, 'CREATE'), (10, 'DELETE')):
+                AuditLog.objects.create(
+                    user=self.user, action=action, model_name='Server', object_id='1',
+                    object_repr=f'day {day} {action.lower()}', ip_address='10.0.0.1',
+                    timestamp=datetime(2026, 7, day, hour, tzinfo=dt_timezone.utc),
+                )
+        AuditLog.objects.create(
+            action='UPDATE', model_name='Host', object_repr='recent',
+            timestamp=datetime(2026, 10, 1, 9, tzinfo=dt_timezone.utc),
+        )
+        self.cutoff = datetime(2026, 8, 1, tzinfo=dt_timezone.utc)
+
+    def test_archives_day_shards_with_an_index_and_deletes_the_rows(self):
+        self.assertEqual(archive_before(self.cutoff), (2, 4))
+
+        self.assertEqual(list(AuditLog.objects.values_list('object_repr', flat=True)), ['recent'])
+        shards = list_shards()
+        self.assertEqual([shard['date'] for shard in shards], ['2026-07-02', '2026-07-01'])
+        self.assertEqual(shards[0]['count'], 2)
+        self.assertEqual(shards[0]['actions'], ['CREATE', 'DELETE'])
+        self.assertEqual(shards[0]['users'], [['root', 'Rita', '']])
+
+    def test_search_skips_shards_by_index_and_filters_rows(self):
+        archive_before(self.cutoff)
+        search = ArchiveSearch({'user': 'rita', 'action': 'DELETE', 'date_from': date(2026, 7, 2)})
+        self.assertEqual([entry.object_repr for entry in search], ['day 2 delete'])
+        self.assertEqual(search[0:1][0].user.username, 'root')
+
+        with mock.patch('core.utils.audit_archive.gzip.open') as gzip_open:
+            self.assertEqual(len(ArchiveSearch({'model': 'Host', 'date_from': date(2026, 7, 1)})), 0)
+        gzip_open.assert_not_called()
+
+    def test_shards_are_written_newest_first_and_old_ascending_shards_still_read(self):
+        archive_before(self.cutoff)
+        shard = list_shards()[0]
+        with gzip.open(shard['path'], 'rt', encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertEqual([json.loads(line)['object_repr'] for line in lines], ['day 2 delete', 'day 2 create'])
+        newest_first = ['day 2 delete', 'day 2 create', 'day 1 delete', 'day 1 create']
+        self.assertEqual([entry.object_repr for entry in ArchiveSearch({})], newest_first)
+
+        # A shard archived by an older release: ascending ids and no order key in its index
+        with gzip.open(shard['path'], 'wt', encoding='utf-8') as f:
+            f.writelines(reversed(lines))
+        index_path = shard['path'][:-len('.jsonl.gz')] + '.index.json'
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        del index['order']
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        self.assertEqual([entry.object_repr for entry in ArchiveSearch({})], newest_first)
+
+    def test_unfiltered_count_comes_from_the_shard_indexes(self):
+        archive_before(self.cutoff)
+        with mock.patch('core.utils.audit_archive.gzip.open') as gzip_open:
+            self.assertEqual(len(ArchiveSearch({'date_from': date(2026, 7, 1)})), 4)
+        gzip_open.assert_not_called()
+
+    def test_list_counts_filtered_archive_entries_only_as_far_as_the_page_needs(self):
+        archive_before(self.cutoff)
+        for minute in (1, 2):
+            AuditLog.objects.create(
+                action='DELETE', model_name='Server', object_repr=f'hot delete {minute}',
+                timestamp=datetime(2026, 10, 1, 9, minute, tzinfo=dt_timezone.utc),
+            )
+        self.client.force_login(self.user)
+        url = reverse('core:audit-log-list')
+        params = {'date_from': '2026-07-01', 'action': 'DELETE'}
+
+        with mock.patch('core.views_audit.AuditLogListView.paginate_by', 1):
+            with mock.patch('core.utils.audit_archive.gzip.open') as gzip_open:
+                response = self.client.get(url, params)
+            gzip_open.assert_not_called()
+            self.assertTrue(response.context['count_is_capped'])
+            self.assertTrue(response.context['page_obj'].has_next())
+            self.assertContains(response, '2+ total')
+
+            response = self.client.get(url, dict(params, page=3))
+            self.assertEqual([log.object_repr for log in response.context['audit_logs']], ['day 2 delete'])
+
+            response = self.client.get(url, dict(params, page='last'))
+            self.assertFalse(response.context['count_is_capped'])
+            self.assertEqual(response.context['page_obj'].paginator.count, 4)
+            self.assertEqual([log.object_repr for log in response.context['audit_logs']], ['day 1 delete'])
+
+    def test_interrupted_run_does_not_archive_rows_twice(self):
+        with mock.patch('core.utils.audit_archive._delete_ids', side_effect=[0, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                archive_before(self.cutoff)
+        self.assertEqual(AuditLog.objects.count(), 5)
+
+        archive_before(self.cutoff)
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertEqual(len(ArchiveSearch({'date_from': date(2026, 7, 1)})), 4)
+
+    def test_list_and_export_include_archived_ranges(self):
+        archive_before(self.cutoff)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('core:audit-log-list'), {'date_from': '2026-07-01'})
+        self.assertEqual(
+            [log.object_repr for log in response.context['audit_logs']],
+            ['recent', 'day 2 delete', 'day 2 create', 'day 1 delete', 'day 1 create'],
+        )
+        self.assertContains(response, 'archived')
+
+        response = self.client.get(reverse('core:audit-log-export'), {'date_from': '2026-07-02', 'action': 'CREATE'})
+        content = response.getvalue().decode()
+        self.assertEqual(content.count('day 2 create'), 1)
+        self.assertNotIn('day 1', content)
+
+        # Without a From date the archive is not searched
+        response = self.client.get(reverse('core:audit-log-list'))
+        self.assertEqual(len(response.context['audit_logs']), 1)
+
+
+@override_settings(TIME_ZONE='UTC', AUDIT_EXPORT_CHUNK_SIZE=2)
+class AuditLogExportTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.user)
+        AuditLog.objects.all().delete()
+        for i in range(5):
+            AuditLog.objects.create(
+                user=self.user if i % 2 else None, action='UPDATE', model_name='Server', object_id=str(i),
+                object_repr=f'web{i}', changes={'name': {'old': 'a', 'new': 'b'}} if i == 0 else None,
+                timestamp=datetime(2026, 10, 1, 9, i, tzinfo=dt_timezone.utc),
+            )
+
+    def _rows(self, response):
+        return list(csv.reader(io.StringIO(response.getvalue().decode())))
+
+    def test_streams_rows_from_a_chunked_cursor(self):
+        response = self.client.get(reverse('core:audit-log-export'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        with mock.patch.object(QuerySet, 'iterator', autospec=True, side_effect=QuerySet.iterator) as iterator:
+            rows = self._rows(response)
+        self.assertEqual(iterator.call_args.kwargs, {'chunk_size': 2})
+        self.assertEqual(rows[0][:2], ['Timestamp', 'User'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][:6], ['2026-10-01 09:04:00', 'System', '', 'Update', 'Server', '4'])
+        self.assertEqual(rows[2][1], 'root')
+        self.assertEqual(rows[5][7], "{'name': {'old': 'a', 'new': 'b'}}")
+
+    def test_header_is_sent_before_the_rows_are_queried(self):
+        response = self.client.get(reverse('core:audit-log-export'))
+        with self.assertNumQueries(0):
+            first = next(iter(response.streaming_content))
+        self.assertTrue(first.startswith(b'Timestamp,User'))
+
+    def test_gzip(self):
+        response = self.client.get(reverse('core:audit-log-export'), {'compress': 'gzip', 'model': 'Server'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('audit_logs.csv.gz', response['Content-Disposition'])
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(list(csv.reader(io.StringIO(content)))), 6)
+
+
+class ExportJobTest(EagerCeleryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name, EXPORT_JOB_PROGRESS_ROWS=2, EXPORT_JOB_CHUNK_SIZE=1)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = get_user_model().objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.user)
+        self.ops = Department.objects.create(name='Ops')
+        self.web = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux', department=self.ops)
+        self.db = Server.objects.create(name='db01', ip_address='10.0.0.2', os='Linux')
+        HyperLink.objects.create(servers=self.web, url='https://web.example.com')
+        AuditLog.objects.all().delete()
+        for i in range(5):
+            AuditLog.objects.create(
+                user=self.user, action='UPDATE' if i else 'CREATE', model_name='Server', object_id=str(self.web.pk),
+                object_repr='web01', timestamp=datetime(2026, 10, 1, 9, i, tzinfo=dt_timezone.utc),
+            )
+        AuditLog.objects.create(action='LOGIN', model_name='UserLogin', timestamp=datetime(2026, 10, 2, tzinfo=dt_timezone.utc))
+
+    def _start(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('core:export-job-create'), data)
+        self.assertRedirects(response, reverse('core:export-job-list'))
+        return ExportJob.objects.latest('pk')
+
+    def test_audit_export_applies_the_list_filters(self):
+        job = self._start(kind='audit_log', format='csv', compress='1', model='Server', action='UPDATE', page='3')
+
+        self.assertEqual(job.filters, {'model': 'Server', 'action': 'UPDATE'})
+        self.assertEqual((job.status, job.rows_written, job.total_rows, job.progress), ('done', 4, 4, 100))
+        self.assertTrue(job.file.name.startswith('exports/') and job.file.name.endswith('audit_log-%d.csv.gz' % job.pk))
+        with open(job.file.path, 'rb') as f:
+            content = f.read()
+        self.assertEqual(job.size_bytes, len(content))
+        rows = list(csv.reader(io.StringIO(gzip.decompress(content).decode())))
+        self.assertEqual(rows[0][:2], ['Timestamp', 'User'])
+        self.assertEqual([row[3] for row in rows[1:]], ['Update'] * 4)
+
+    def test_inventory_jsonl_is_limited_to_the_users_departments(self):
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        staff.departments.add(self.ops)
+        self.client.force_login(staff)
+        job = self._start(kind='inventory', format='jsonl')
+
+        self.assertEqual(job.status, 'done')
+        with open(job.file.path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record['name'] for record in records], ['web01'])
+        self.assertEqual(records[0]['department__name'], 'Ops')
+        self.assertEqual(records[0]['hyperlink_count'], 1)
+        self.assertEqual([entry['action'] for entry in records[0]['history']], ['CREATE'] + ['UPDATE'] * 4)
+
+    def test_inventory_csv_summarises_history(self):
+        job = self._start(kind='inventory', format='csv')
+
+        with open(job.file.path, encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][-2:], ['Changes', 'Last Changed'])
+        self.assertEqual(rows[1][1:2] + rows[1][-2:], ['web01', '5', '2026-10-01 09:04:00'])
+        self.assertEqual(rows[2][1:2] + rows[2][-2:], ['db01', '0', ''])
+
+    def test_failure_is_recorded(self):
+        job = ExportJob.objects.create(user=self.user, kind='inventory')
+        with mock.patch('core.tasks.run_export', side_effect=OSError('disk full')):
+            run_export_job.delay(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'disk full'))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_ranged_download(self):
+        job = self._start(kind='audit_log', format='csv')
+        with open(job.file.path, 'rb') as f:
+            content = f.read()
+        url = reverse('core:export-job-download', args=[job.pk])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-{len(content) - 1}/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), content[-5:])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_list_shows_only_own_jobs_to_staff(self):
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        mine = ExportJob.objects.create(user=staff, kind='inventory', status='running', total_rows=10, rows_written=4)
+        theirs = self._start(kind='inventory', format='csv')
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse('core:export-job-list'))
+        self.assertEqual(list(response.context['export_jobs']), [mine])
+        self.assertTrue(response.context['has_active_jobs'])
+        self.assertEqual(mine.progress, 40)
+        response = self.client.get(reverse('core:export-job-download', args=[theirs.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_purge_deletes_expired_jobs_and_files(self):
+        job = self._start(kind='inventory', format='csv')
+        path = job.file.path
+
+        self.assertEqual(purge_expired(now=timezone.now() + timedelta(days=6)), (0, 0))
+        self.assertEqual(purge_expired(now=timezone.now() + timedelta(days=8)), (0, 1))
+        self.assertFalse(ExportJob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_stale_running_job_is_failed_and_purged(self):
+        job = self._start(kind='inventory', format='csv')
+        partial = f"{job.file.path}.tmp"
+        os.rename(job.file.path, partial)
+        ExportJob.objects.filter(pk=job.pk).update(status='running', heartbeat_at=timezone.now() - timedelta(minutes=31))
+        job.refresh_from_db()
+        self.assertTrue(job.is_stale)
+        self.assertFalse(job.is_active)
+
+        self.assertEqual(purge_expired(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertFalse(os.path.exists(partial))
+        self.assertEqual(purge_expired(now=timezone.now() + timedelta(days=8)), (0, 1))
+
+    def test_slow_live_job_is_not_reaped(self):
+        clock = [timezone.now()]
+
+        def slow_export(job):
+            def records():
+                for i in range(4):
+                    # Each row takes ten minutes; the reaper runs meanwhile
+                    clock[0] += timedelta(minutes=10)
+                    yield {'id': i}
+                    self.assertEqual(fail_stale(clock[0]), 0)
+            return 4, records()
+
+        job = ExportJob.objects.create(user=self.user, kind='inventory', format='jsonl')
+        with mock.patch.dict('core.utils.export_jobs.EXPORTERS', {'inventory': slow_export}), \
+                mock.patch('core.utils.export_jobs.timezone.now', lambda: clock[0]), \
+                self.settings(EXPORT_JOB_PROGRESS_ROWS=1000, EXPORT_JOB_STALE_MINUTES=30):
+            run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_written), ('done', 4))
+
+
+class ParseEndpointTest(TestCase):
+    def test_defaults_to_443(self):
+        self.assertEqual(parse_endpoint('Example.COM/path'), Endpoint('example.com', 443, 'example.com'))
+        self.assertEqual(parse_endpoint('http://example.com').port, 443)
+
+    def test_explicit_port_is_honoured(self):
+        endpoint = parse_endpoint('https://example.com:8443/login')
+        self.assertEqual(endpoint.port, 8443)
+        self.assertEqual(endpoint.key, 'example.com:8443')
+
+    def test_invalid_url(self):
+        with self.assertRaises(ValueError):
+            parse_endpoint('https://')
+
+
+class ChunkHyperlinkIdsTest(TestCase):
+    def test_endpoint_groups_are_not_split(self):
+        rows = [(1, 'a:443'), (2, 'a:443'), (3, 'a:443'), (4, 'b:443'), (5, 'c:443')]
+        self.assertEqual(chunk_hyperlink_ids(rows, chunk_size=2), [[1, 2, 3], [4, 5]])
+
+
+class DNSCacheTest(TestCase):
+    @mock.patch('socket.getaddrinfo')
+    def test_lookups_are_cached_with_hit_and_miss_counters(self, getaddrinfo):
+        getaddrinfo.return_value = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.1', 0)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('192.0.2.1', 0)),
+        ]
+        cache = DNSCache()
+
+        async def resolve_twice():
+            await cache.prefetch([Endpoint('example.com', 443), Endpoint('example.com', 8443)])
+            return await cache.resolve('example.com')
+
+        self.assertEqual(asyncio.run(resolve_twice()), ['192.0.2.1'])
+        self.assertEqual(getaddrinfo.call_count, 1)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    @mock.patch('socket.getaddrinfo', side_effect=socket.gaierror(-2, 'Name or service not known'))
+    def test_failed_lookups_are_cached(self, getaddrinfo):
+        cache = DNSCache()
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                asyncio.run(cache.resolve('missing.example.com'))
+        self.assertEqual(getaddrinfo.call_count, 1)
+
+
+class ProbeUrlCachedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @mock.patch('core.utils.ssl_checker.probe_url')
+    def test_results_are_shared_per_endpoint(self, probe_url):
+        probe_url.return_value = make_result('example.com:443')
+
+        result, cached, age = probe_url_cached('https://example.com/login')
+        self.assertFalse(cached)
+        result, cached, age = probe_url_cached('EXAMPLE.com/status')
+
+        self.assertTrue(cached)
+        self.assertGreaterEqual(age, 0)
+        self.assertEqual(result.issuer, 'CN=Test CA')
+        probe_url.assert_called_once()
+
+    @mock.patch('core.utils.ssl_checker.probe_url')
+    def test_waits_for_in_flight_probe(self, probe_url):
+        cache.add('ssl-probe:example.com:443:lock', True, 30)
+
+        def publish(seconds):
+            cache.set('ssl-probe:example.com:443', (0, make_result('example.com:443')), 60)
+
+        with mock.patch('core.utils.ssl_checker.time.sleep', side_effect=publish):
+            result, cached, age = probe_url_cached('https://example.com')
+
+        self.assertTrue(cached)
+        probe_url.assert_not_called()
+
+    @mock.patch('core.utils.ssl_checker.probe_url')
+    def test_takes_over_a_lock_lost_without_a_result(self, probe_url):
+        lock_key = 'ssl-probe:example.com:443:lock'
+        cache.add(lock_key, 'holder', 30)
+
+        def probe(url, timeout=None):
+            self.assertIs(cache.get(lock_key), True)
+            return make_result('example.com:443')
+
+        probe_url.side_effect = probe
+        with mock.patch('core.utils.ssl_checker.time.sleep', side_effect=lambda seconds: cache.delete(lock_key)):
+            result, cached, age = probe_url_cached('https://example.com')
+
+        self.assertFalse(cached)
+        self.assertIsNone(cache.get(lock_key))
+
+    @mock.patch('core.utils.ssl_checker.probe_url')
+    def test_does_not_release_a_lock_it_does_not_own(self, probe_url):
+        lock_key = 'ssl-probe:example.com:443:lock'
+        cache.add(lock_key, 'holder', 30)
+        probe_url.return_value = make_result('example.com:443')
+
+        # The wait gives up at its deadline while the other caller still holds the lock
+        with mock.patch('core.utils.ssl_checker.time.monotonic', side_effect=[0, 10 ** 6]):
+            result, cached, age = probe_url_cached('https://example.com')
+
+        self.assertFalse(cached)
+        probe_url.assert_called_once()
+        self.assertEqual(cache.get(lock_key), 'holder')
+
+    @mock.patch('core.utils.ssl_checker.probe_url')
+    def test_api_reports_cache_state_on_errors(self, probe_url):
+        # Reachable, but the certificate could not be parsed
+        probe_url.return_value = ProbeResult(endpoint='example.com:443', is_accessible=True)
+        self.client.force_login(get_user_model().objects.create_superuser('root', 'root@example.com', 'pw'))
+
+        response = self.client.get(reverse('core:ssl-api-check'), {'url': 'https://example.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['cached'], False)
+        response = self.client.get(reverse('core:ssl-api-check'), {'url': 'https://example.com'})
+        self.assertEqual(response.json()['cached'], True)
+        self.assertIn('age', response.json())
+
+
+class TLSFleetTest(TestCase):
+    def test_scanner_against_local_listeners(self):
+        with TLSFleet({'ok': 1, 'slow': 1, 'refused': 1, 'expired': 1}, slow_delay=0.1) as fleet:
+            with self.settings(SSL_SCAN_CA_FILE=fleet.ca_file):
+                results = scan_endpoints([parse_endpoint(listener.url) for listener in fleet.listeners], timeout=5)
+
+        accessible = {
+            listener.kind: results[parse_endpoint(listener.url).key].is_accessible
+            for listener in fleet.listeners
+        }
+        self.assertEqual(accessible, {'ok': True, 'slow': True, 'refused': False, 'expired': False})
+
+    def test_http_error_status_keeps_certificate(self):
+        not_found = b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+        with mock.patch('core.utils.ssl_bench.HTTP_RESPONSE', not_found), TLSFleet({'ok': 1}) as fleet:
+            endpoint = parse_endpoint(fleet.listeners[0].url)
+            with self.settings(SSL_SCAN_CA_FILE=fleet.ca_file, SSL_SCAN_SEND_HEAD=True):
+                result = scan_endpoints([endpoint], timeout=5)[endpoint.key]
+
+        self.assertTrue(result.is_accessible)
+        self.assertEqual(result.status_code, 404)
+        self.assertEqual(result.error, None)
+        self.assertTrue(result.fingerprint)
+        result.load_certificate()
+        self.assertIsNotNone(result.expiry_date)
+
+        cert = SSLCertificate(hyperlink=HyperLink(url=fleet.listeners[0].url))
+        self.assertTrue(apply_probe_result(cert, result, timezone.now()))
+        self.assertEqual((cert.consecutive_failures, cert.expiry_date), (0, result.expiry_date))
+
+
+class AdaptiveScheduleTest(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        self.hyperlink = HyperLink.objects.create(servers=server, url='https://example.com')
+
+    def next_check_hours(self, **fields):
+        cert = SSLCertificate(hyperlink=self.hyperlink, **fields)
+        return (cert.compute_next_check(self.now) - self.now) / timedelta(hours=1)
+
+    def test_interval_grows_with_time_to_expiry(self):
+        near = self.next_check_hours(expiry_date=self.now + timedelta(days=3))
+        far = self.next_check_hours(expiry_date=self.now + timedelta(days=300))
+        self.assertLess(near, far)
+        self.assertEqual(far, 168)
+
+    def test_recent_rotation_and_failures_are_checked_often(self):
+        rotated = self.next_check_hours(
+            expiry_date=self.now + timedelta(days=300),
+            last_changed_at=self.now - timedelta(hours=1),
+        )
+        self.assertEqual(rotated, 2)
+        cert = SSLCertificate(hyperlink=self.hyperlink, expiry_date=self.now + timedelta(days=300), consecutive_failures=1)
+        self.assertEqual(cert.compute_next_check(self.now, failed=True), self.now + timedelta(hours=1))
+
+    def test_failures_back_off_exponentially_up_to_ceiling(self):
+        cert = SSLCertificate(hyperlink=self.hyperlink)
+        down = make_result('example.com:443', is_accessible=False)
+        intervals = []
+        for _ in range(10):
+            apply_probe_result(cert, down, self.now)
+            intervals.append((cert.next_check_at - self.now) / timedelta(hours=1))
+        self.assertEqual(intervals[:4], [1, 2, 4, 8])
+        self.assertEqual(intervals[-1], 168)
+        self.assertEqual(cert.last_error, 'ConnectionRefusedError')
+
+        apply_probe_result(cert, make_result('example.com:443'), self.now)
+        self.assertEqual((cert.consecutive_failures, cert.last_error), (0, ''))
+
+    def test_full_sweep_skips_backed_off_endpoints(self):
+        SSLCertificate.objects.create(
+            hyperlink=self.hyperlink, consecutive_failures=3, next_check_at=self.now + timedelta(hours=4),
+        )
+        hyperlinks = HyperLink.objects.filter(is_enabled=True)
+        self.assertFalse(exclude_backed_off(hyperlinks, self.now).exists())
+        self.assertTrue(exclude_backed_off(hyperlinks, self.now + timedelta(hours=5)).exists())
+
+    def test_due_selection(self):
+        sibling = HyperLink.objects.create(servers=self.hyperlink.servers, url='https://example.com/other')
+        SSLCertificate.objects.create(hyperlink=sibling, next_check_at=self.now + timedelta(days=1))
+        cert = SSLCertificate.objects.create(hyperlink=self.hyperlink, next_check_at=self.now + timedelta(days=1))
+        new_link = HyperLink.objects.create(servers=self.hyperlink.servers, url='https://new.example.com')
+
+        self.assertEqual(list(due_hyperlinks(self.now)), [new_link])
+
+        cert.next_check_at = self.now - timedelta(minutes=1)
+        cert.save()
+        # The sibling on the same endpoint is refreshed along with the due link
+        self.assertEqual(due_hyperlinks(self.now).count(), 3)
+
+
+class SSLResultWriterTest(TestCase):
+    def setUp(self):
+        server = Server.objects.create(name='web01', ip_address='10.0.0.1', os='Linux')
+        self.hyperlinks = [
+            HyperLink.objects.create(servers=server, url=f'https://site{i}.example.com')
+            for i in range(3)
+        ]
+
+    def test_upserts_in_batches_with_one_audit_entry_per_batch(self):
+        existing = SSLCertificate.objects.create(hyperlink=self.hyperlinks[0], issuer='CN=Old CA')
+        last_checked = existing.last_checked
+
+        with self.captureOnCommitCallbacks(execute=True), SSLResultWriter(batch_size=2) as writer:
+            writer.add(self.hyperlinks[0], existing, make_result('site0.example.com:443'))
+            writer.add(self.hyperlinks[1], None, make_result('site1.example.com:443'))
+            writer.add(self.hyperlinks[2], None, make_result('site2.example.com:443', is_accessible=False))
+
+        self.assertEqual((writer.updated_count, writer.error_count), (2, 0))
+        self.assertEqual(SSLCertificate.objects.count(), 3)
+        existing.refresh_from_db()
+        self.assertEqual(existing.issuer, 'CN=Test CA')
+        self.assertGreater(existing.last_checked, last_checked)
+        self.assertEqual(AuditLog.objects.filter(model_name='SSLCertificate').count(), 2)
+
+    def test_unchanged_fingerprint_only_touches_checked_at(self):
+        cert = SSLCertificate.objects.create(
+            hyperlink=self.hyperlinks[0], issuer='CN=Stored CA', fingerprint='ab' * 32,
+            consecutive_failures=2, last_error='TimeoutError',
+        )
+        result = ProbeResult(
+            endpoint='site0.example.com:443', is_accessible=True, fingerprint='ab' * 32, der=b'der-bytes',
+        )
+
+        with mock.patch('core.utils.ssl_checker.parse_certificate') as parse_certificate:
+            with self.captureOnCommitCallbacks(execute=True), SSLResultWriter() as writer:
+                writer.add(self.hyperlinks[0], cert, result)
+
+        parse_certificate.assert_not_called()
+        self.assertEqual((writer.updated_count, writer.unchanged_count), (1, 1))
+        cert.refresh_from_db()
+        self.assertEqual(cert.issuer, 'CN=Stored CA')
+        self.assertEqual(cert.consecutive_failures, 0)
+        self.assertIsNotNone(cert.next_check_at)
+        self.assertFalse(AuditLog.objects.filter(model_name='SSLCertificate').exists())
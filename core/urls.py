@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 from . import views_ssl
 from . import views_audit
+from . import views_exports
 
 app_name = 'core'
 
@@ -38,7 +39,12 @@ urlpatterns = [
     path('ssl/check/<int:pk>/', views_ssl.CheckSSLCertificateView.as_view(), name='check-ssl-certificate'),
     path('ssl/run-check/', views_ssl.RunSSLCheckView.as_view(), name='run-ssl-check'),
     path('ssl/api/check/', views_ssl.SSLCertificateAPIView.as_view(), name='ssl-api-check'),
+    path('ssl/api/jobs/<str:task_id>/', views_ssl.SSLJobStatusView.as_view(), name='ssl-job-status'),
     # Audit Log URLs
     path('audit-logs/', views_audit.AuditLogListView.as_view(), name='audit-log-list'),
     path('audit-logs/export/', views_audit.export_audit_logs_csv, name='audit-log-export'),
+    # Background export URLs
+    path('exports/', views_exports.ExportJobListView.as_view(), name='export-job-list'),
+    path('exports/new/', views_exports.create_export_job, name='export-job-create'),
+    path('exports/<int:pk>/download/', views_exports.download_export_job, name='export-job-download'),
 ]
\ No newline at end of file
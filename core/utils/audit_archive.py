@@ -0,0 +1,318 @@
+import glob
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+from types import SimpleNamespace
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import AuditLog
+
+SHARD_RE = re.compile(r'auditlog-(?P<date>\d{4}-\d{2}-\d{2})-(?P<first_id>\d+)\.index\.json$')
+
+ARCHIVE_FIELDS = [
+    'id', 'timestamp', 'ip_address', 'action', 'model_name', 'object_id', 'object_repr', 'changes',
+    'user_id', 'user__username', 'user__first_name', 'user__last_name',
+]
+
+ACTION_DISPLAY = dict(AuditLog.ACTION_CHOICES)
+
+class ArchivedAuditLog(SimpleNamespace):
+    """An archived audit entry, with the AuditLog attributes the audit views use"""
+    
+    is_archived = True
+    
+    def get_action_display(self):
+        return ACTION_DISPLAY.get(self.action, self.action)
+
+def shard_base(day, first_id):
+    """Path (without extension) of the shard holding the entries of day starting at first_id"""
+    return os.path.join(
+        settings.AUDIT_ARCHIVE_DIR, f"{day:%Y}", f"{day:%m}", f"auditlog-{day:%Y-%m-%d}-{first_id}",
+    )
+
+def day_bounds(day):
+    """UTC start and end of day; shards are cut on UTC days"""
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+def list_shards(date_from=None, date_to=None):
+    """
+    Indexes of the archived shards for UTC days in [date_from, date_to], newest first.
+    
+    Only the index files are read; each index dict gets a 'path' key pointing
+    at its data file.
+    """
+    shards = []
+    for index_path in glob.glob(os.path.join(settings.AUDIT_ARCHIVE_DIR, '*', '*', 'auditlog-*.index.json')):
+        match = SHARD_RE.search(index_path)
+        if not match:
+            continue
+        day = datetime.strptime(match['date'], '%Y-%m-%d').date()
+        if (date_from and day < date_from) or (date_to and day > date_to):
+            continue
+        with open(index_path, encoding='utf-8') as f:
+            index = json.load(f)
+        index['path'] = index_path[:-len('.index.json')] + '.jsonl.gz'
+        shards.append(index)
+    return sorted(shards, key=lambda index: (index['date'], index['min_id']), reverse=True)
+
+def _record(values):
+    user = None
+    if values['user_id'] is not None:
+        user = {
+            'id': values['user_id'],
+            'username': values['user__username'],
+            'first_name': values['user__first_name'],
+            'last_name': values['user__last_name'],
+        }
+    return {
+        'id': values['id'],
+        'timestamp': values['timestamp'].isoformat(),
+        'user': user,
+        'ip_address': values['ip_address'],
+        'action': values['action'],
+        'model_name': values['model_name'],
+        'object_id': values['object_id'],
+        'object_repr': values['object_repr'],
+        'changes': values['changes'],
+    }
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _delete_ids(ids, chunk_size):
+    """Delete the given hot rows in chunks, one short transaction each"""
+    deleted = 0
+    for i in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            count, _ = AuditLog.objects.filter(pk__in=ids[i:i + chunk_size]).delete()
+        deleted += count
+    return deleted
+
+def archive_day(day, before=None, chunk_size=None):
+    """
+    Move the hot audit rows of one UTC day (up to before) into a compressed shard.
+    
+    Rows are streamed to gzipped JSONL newest first (descending id), the
+    order searches read them in, then a small index (users, models, actions
+    and IP addresses present) is written next to it, and only then are the
+    archived rows deleted in chunks. Rows a previous, interrupted run
+    already archived are deleted without being written again.
+    
+    Returns:
+        int: Number of rows archived
+    """
+    chunk_size = chunk_size or settings.AUDIT_ARCHIVE_CHUNK_SIZE
+    start, end = day_bounds(day)
+    if before is not None:
+        end = min(end, before)
+    rows = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    
+    for shard in list_shards(day, day):
+        stale = list(rows.filter(pk__gte=shard['min_id'], pk__lte=shard['max_id']).values_list('pk', flat=True))
+        _delete_ids(stale, chunk_size)
+    
+    first_id = rows.order_by('pk').values_list('pk', flat=True).first()
+    if first_id is None:
+        return 0
+    
+    base = shard_base(day, first_id)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    ids = []
+    users, models, actions, ip_addresses = {}, set(), set(), set()
+    
+    def write_data(path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for values in rows.order_by('-pk').values(*ARCHIVE_FIELDS).iterator(chunk_size=chunk_size):
+                record = _record(values)
+                f.write(json.dumps(record) + '\n')
+                ids.append(record['id'])
+                if record['user']:
+                    users[record['user']['id']] = [
+                        record['user']['username'], record['user']['first_name'], record['user']['last_name'],
+                    ]
+                models.add(record['model_name'])
+                actions.add(record['action'])
+                if record['ip_address']:
+                    ip_addresses.add(record['ip_address'])
+    
+    def write_index(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'date': day.isoformat(),
+                'count': len(ids),
+                'min_id': min(ids),
+                'max_id': max(ids),
+                # Shards written before this key existed are in ascending id order
+                'order': 'desc',
+                'users': sorted(users.values()),
+                'models': sorted(models),
+                'actions': sorted(actions),
+                'ip_addresses': sorted(ip_addresses),
+            }, f)
+    
+    # The index is written last: a shard without one is incomplete and gets rewritten
+    _write_atomic(base + '.jsonl.gz', write_data)
+    _write_atomic(base + '.index.json', write_index)
+    _delete_ids(ids, chunk_size)
+    return len(ids)
+
+def archive_cutoff(days, now=None):
+    """Start of the UTC day days ago; rows before it are archived"""
+    today = (now or timezone.now()).astimezone(dt_timezone.utc).date()
+    return day_bounds(today - timedelta(days=days))[0]
+
+def archive_before(cutoff):
+    """
+    Archive every hot audit row older than cutoff, one shard per UTC day.
+    
+    Returns:
+        tuple: (days archived, rows archived)
+    """
+    days, archived = 0, 0
+    while True:
+        oldest = (
+            AuditLog.objects.filter(timestamp__lt=cutoff)
+            .order_by('timestamp').values_list('timestamp', flat=True).first()
+        )
+        if oldest is None:
+            break
+        archived += archive_day(oldest.astimezone(dt_timezone.utc).date(), before=cutoff)
+        days += 1
+    return days, archived
+
+class ArchiveSearch:
+    """
+    Archived entries matching the audit log filters, newest first.
+    
+    Shards outside the date range, or whose index shows they cannot match
+    the user/model/action/IP filters, are never opened. Supports len() and
+    slicing so it can be paginated after the hot table's rows; count()
+    takes a limit so a page never reads more shards than it needs.
+    
+    Args:
+        filters (dict): user, action, model and ip_address substrings/values
+            and date_from/date_to dates (local days, inclusive), as parsed by
+            core.utils.audit_export.audit_filters
+        scope (dict): Optional; model name to allowed object ids (as
+            strings) for users limited to their departments
+    """
+    
+    def __init__(self, filters, scope=None):
+        self.filters = filters
+        self.scope = scope
+        self.start = self.end = None
+        if filters.get('date_from'):
+            self.start = timezone.make_aware(datetime.combine(filters['date_from'], time.min))
+        if filters.get('date_to'):
+            self.end = timezone.make_aware(datetime.combine(filters['date_to'] + timedelta(days=1), time.min))
+        self._count = None
+    
+    def shards(self):
+        date_from = self.start.astimezone(dt_timezone.utc).date() if self.start else None
+        date_to = self.end.astimezone(dt_timezone.utc).date() if self.end else None
+        return [shard for shard in list_shards(date_from, date_to) if self._shard_may_match(shard)]
+    
+    def _shard_may_match(self, shard):
+        user, action, model, ip = (self.filters.get(key) for key in ('user', 'action', 'model', 'ip_address'))
+        if action and action not in shard['actions']:
+            return False
+        if model and not any(model.lower() in name.lower() for name in shard['models']):
+            return False
+        if ip and not any(ip in address for address in shard['ip_addresses']):
+            return False
+        if user and not any(user.lower() in (name or '').lower() for names in shard['users'] for name in names):
+            return False
+        if self.scope is not None and not set(shard['models']) & set(self.scope):
+            return False
+        return True
+    
+    def has_row_filters(self):
+        """True if entries must be read to know whether they match (not just their shard's day)"""
+        return self.scope is not None or any(self.filters.get(key) for key in ('user', 'action', 'model', 'ip_address'))
+    
+    def _covers(self, shard):
+        """True if the whole UTC day of shard lies within the date range"""
+        start, end = day_bounds(date.fromisoformat(shard['date']))
+        return (self.start is None or start >= self.start) and (self.end is None or end <= self.end)
+    
+    def count(self, limit=None):
+        """
+        Number of matching archived entries, at most limit.
+        
+        Without row-level filters the shard indexes give the count, and only
+        shards cut by the date range are read. Otherwise entries have to be
+        read, and counting stops at limit.
+        """
+        if not self.has_row_filters():
+            if self._count is None:
+                self._count = sum(
+                    shard['count'] if self._covers(shard) else sum(1 for entry in self._entries(shard))
+                    for shard in self.shards()
+                )
+            return self._count
+        if self._count is not None:
+            return self._count if limit is None else min(self._count, limit)
+        if limit is None:
+            self._count = sum(1 for entry in self)
+            return self._count
+        return sum(1 for entry in islice(self, limit))
+    
+    def _matches(self, record):
+        user, action, model, ip = (self.filters.get(key) for key in ('user', 'action', 'model', 'ip_address'))
+        if user:
+            names = [record['user'][key] or '' for key in ('username', 'first_name', 'last_name')] if record['user'] else []
+            if not any(user.lower() in name.lower() for name in names):
+                return False
+        if action and record['action'] != action:
+            return False
+        if model and model.lower() not in record['model_name'].lower():
+            return False
+        if ip and ip not in (record['ip_address'] or ''):
+            return False
+        if self.scope is not None and record['object_id'] not in self.scope.get(record['model_name'], ()):
+            return False
+        return True
+    
+    def _records(self, shard):
+        """Records of shard newest first, streamed line by line"""
+        with gzip.open(shard['path'], 'rt', encoding='utf-8') as f:
+            if shard.get('order') == 'desc':
+                for line in f:
+                    yield json.loads(line)
+            else:
+                # An ascending shard from an older release has to be read whole to reverse it
+                yield from reversed([json.loads(line) for line in f])
+    
+    def _entries(self, shard):
+        for record in self._records(shard):
+            timestamp = datetime.fromisoformat(record['timestamp'])
+            if (self.start and timestamp < self.start) or (self.end and timestamp >= self.end):
+                continue
+            if self._matches(record):
+                user = record['user']
+                yield ArchivedAuditLog(**dict(
+                    record,
+                    timestamp=timestamp,
+                    user=SimpleNamespace(**user) if user else None,
+                    user_id=user['id'] if user else None,
+                ))
+    
+    def __iter__(self):
+        for shard in self.shards():
+            yield from self._entries(shard)
+    
+    def __len__(self):
+        return self.count()
+    
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('ArchiveSearch only supports slicing')
+        return list(islice(self, key.start, key.stop))
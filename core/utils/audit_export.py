@@ -0,0 +1,289 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import AuditLog, Server, Service, HyperLink, Host, VirtualMachine
+from core.utils.audit_archive import ArchiveSearch
+
+def parse_filter_date(value):
+    """The date in a YYYY-MM-DD filter value, or None if it is missing or invalid"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+def day_start(day):
+    """Start of day in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def audit_filters(params):
+    """The audit log list filters from params (request.GET or a saved dict); dates are parsed, invalid ones dropped"""
+    return {
+        'user': params.get('user', ''),
+        'action': params.get('action', ''),
+        'model': params.get('model', ''),
+        'ip_address': params.get('ip_address', ''),
+        'date_from': parse_filter_date(params.get('date_from')),
+        'date_to': parse_filter_date(params.get('date_to')),
+    }
+
+def department_object_ids(user):
+    """
+    Objects whose audit entries user may see, as model name -> id queryset.
+    
+    Returns None for admins and superusers, who see everything.
+    """
+    # Admins and Superusers can see all audit logs
+    if user.is_superuser or user.is_admin():
+        return None
+    
+    # Non-admins/superusers can only see logs related to their departments
+    user_departments = user.departments.all()
+    server_ids = Server.objects.filter(department__in=user_departments).values_list('id', flat=True)
+    host_ids = Host.objects.filter(department__in=user_departments).values_list('id', flat=True)
+    return {
+        'Server': server_ids,
+        'Service': Service.objects.filter(server__id__in=server_ids).values_list('id', flat=True),
+        'HyperLink': HyperLink.objects.filter(servers__id__in=server_ids).values_list('id', flat=True),
+        'Host': host_ids,
+        'VirtualMachine': VirtualMachine.objects.filter(host__id__in=host_ids).values_list('id', flat=True),
+        'Department': user_departments.values_list('id', flat=True),
+    }
+
+def filter_audit_logs(user, params):
+    """
+    The audit log entries user may see, narrowed by the list view's filters in params.
+    
+    Date filters become plain timestamp ranges (rather than timestamp__date)
+    so the timestamp index is used and, on PostgreSQL, only the monthly
+    partitions in range are scanned.
+    """
+    filters = audit_filters(params)
+    queryset = AuditLog.objects.select_related('user').all()
+    
+    scope = department_object_ids(user)
+    if scope is not None:
+        if not user.departments.exists():
+            return AuditLog.objects.none() # No departments, no logs
+        
+        # Build a Q object for department-based filtering
+        department_q = Q()
+        for model_name, object_ids in scope.items():
+            department_q |= Q(model_name=model_name, object_id__in=object_ids)
+        queryset = queryset.filter(department_q)
+    
+    # Filter by user
+    if filters['user']:
+        queryset = queryset.filter(
+            Q(user__username__icontains=filters['user']) |
+            Q(user__first_name__icontains=filters['user']) |
+            Q(user__last_name__icontains=filters['user'])
+        )
+    
+    # Filter by action
+    if filters['action']:
+        queryset = queryset.filter(action=filters['action'])
+    
+    # Filter by model
+    if filters['model']:
+        queryset = queryset.filter(model_name__icontains=filters['model'])
+    
+    # Filter by date range (date_to is inclusive)
+    if filters['date_from']:
+        queryset = queryset.filter(timestamp__gte=day_start(filters['date_from']))
+    if filters['date_to']:
+        queryset = queryset.filter(timestamp__lt=day_start(filters['date_to'] + timedelta(days=1)))
+    
+    # Filter by IP address
+    if filters['ip_address']:
+        queryset = queryset.filter(ip_address__icontains=filters['ip_address'])
+    
+    return queryset.order_by('-timestamp')
+
+class AuditLogResults:
+    """
+    Hot audit log rows followed by matching archived entries, newest first.
+    
+    Behaves enough like a queryset (count() and slicing) for Paginator;
+    archived entries are only looked at once a page reaches past the hot
+    rows. With count_limit set, archived entries that have to be read to
+    be counted are only counted up to that total, so count() is a lower
+    bound whenever count_is_capped is set.
+    """
+    
+    def __init__(self, queryset, archive, count_limit=None):
+        self.queryset = queryset
+        self.archive = archive
+        self.count_limit = count_limit
+        self.count_is_capped = False
+        self._hot_count = None
+        self._count = None
+    
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.queryset.count()
+        return self._hot_count
+    
+    def count(self):
+        if self._count is None:
+            archive_limit = None
+            if self.count_limit is not None and self.archive.has_row_filters():
+                archive_limit = max(self.count_limit - self.hot_count(), 0)
+            archived = self.archive.count(archive_limit)
+            self.count_is_capped = archive_limit is not None and archived >= archive_limit
+            self._count = self.hot_count() + archived
+        return self._count
+    
+    def __len__(self):
+        return self.count()
+    
+    def __iter__(self):
+        yield from self.queryset.iterator()
+        yield from self.archive
+    
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('AuditLogResults only supports slicing')
+        start, stop = key.start or 0, key.stop
+        hot_count = self.hot_count()
+        entries = list(self.queryset[start:stop]) if start < hot_count else []
+        if stop is None or stop > hot_count:
+            entries += self.archive[max(start - hot_count, 0):None if stop is None else stop - hot_count]
+        return entries
+
+def archive_search(user, params):
+    """
+    The archived entries user may see matching params, or None when the archive is not searched.
+    
+    The archive is only searched when the date range starts on a given day,
+    so unbounded listings never open archive shards.
+    """
+    filters = audit_filters(params)
+    if not filters['date_from']:
+        return None
+    
+    scope = department_object_ids(user)
+    if scope is not None:
+        if not user.departments.exists():
+            return None
+        scope = {model_name: {str(pk) for pk in object_ids} for model_name, object_ids in scope.items()}
+    return ArchiveSearch(filters, scope)
+
+def search_audit_logs(user, params, count_limit=None):
+    """filter_audit_logs, followed by matching archived entries when archive_search applies (see AuditLogResults)"""
+    queryset = filter_audit_logs(user, params)
+    archive = archive_search(user, params)
+    if archive is None:
+        return queryset
+    return AuditLogResults(queryset, archive, count_limit)
+
+class Echo:
+    """Pseudo-buffer whose write() returns the value, so csv.writer rows can be streamed"""
+    
+    def write(self, value):
+        return value
+
+EXPORT_HEADER = [
+    'Timestamp', 'User', 'IP Address', 'Action', 'Model',
+    'Object ID', 'Object Representation', 'Changes'
+]
+
+EXPORT_COLUMNS = [
+    'timestamp', 'user__username', 'ip_address', 'action', 'model_name', 'object_id', 'object_repr', 'changes',
+]
+
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+ACTION_DISPLAY = dict(AuditLog.ACTION_CHOICES)
+
+def export_row(timestamp, username, ip_address, action, model_name, object_id, object_repr, changes):
+    """One CSV row of the audit log export"""
+    return [
+        timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        username or 'System',
+        ip_address or '',
+        ACTION_DISPLAY.get(action, action),
+        model_name,
+        object_id or '',
+        object_repr or '',
+        str(changes) if changes else ''
+    ]
+
+def export_rows(queryset, archive=None):
+    """
+    Header and data rows for the export.
+    
+    Only the exported columns are fetched, in chunks of
+    settings.AUDIT_EXPORT_CHUNK_SIZE through a server-side cursor where the
+    database supports one, so no model instances are built or cached.
+    """
+    yield EXPORT_HEADER
+    rows = queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=settings.AUDIT_EXPORT_CHUNK_SIZE)
+    for row in rows:
+        yield export_row(*row)
+    for entry in archive or ():
+        yield export_row(
+            entry.timestamp, entry.user.username if entry.user else None, entry.ip_address, entry.action,
+            entry.model_name, entry.object_id, entry.object_repr, entry.changes,
+        )
+
+def export_records(queryset, archive=None):
+    """Audit entries for the JSONL export as dicts, fetched like export_rows"""
+    rows = queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=settings.AUDIT_EXPORT_CHUNK_SIZE)
+    for timestamp, username, ip_address, action, model_name, object_id, object_repr, changes in rows:
+        yield {
+            'timestamp': timestamp, 'user': username, 'ip_address': ip_address, 'action': action,
+            'model_name': model_name, 'object_id': object_id, 'object_repr': object_repr, 'changes': changes,
+        }
+    for entry in archive or ():
+        yield {
+            'timestamp': entry.timestamp, 'user': entry.user.username if entry.user else None,
+            'ip_address': entry.ip_address, 'action': entry.action, 'model_name': entry.model_name,
+            'object_id': entry.object_id, 'object_repr': entry.object_repr, 'changes': entry.changes,
+        }
+
+def stream_lines(lines, compress=False):
+    """
+    Join encoded lines into blocks of about EXPORT_FLUSH_BYTES, gzipped on the fly if compress is set.
+    
+    The first line goes out on its own so a download starts before the
+    first query returns.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    
+    def encode(block, flush_mode):
+        if compressor is None:
+            return block
+        data = compressor.compress(block)
+        return data + compressor.flush(flush_mode) if flush_mode is not None else data
+    
+    buffer, size, first = [], 0, True
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if first:
+            yield encode(b''.join(buffer), zlib.Z_SYNC_FLUSH)
+            buffer, size, first = [], 0, False
+        elif size >= EXPORT_FLUSH_BYTES:
+            block = encode(b''.join(buffer), None)
+            buffer, size = [], 0
+            if block:
+                yield block
+    yield encode(b''.join(buffer), zlib.Z_FINISH)
+
+def stream_csv(rows, compress=False):
+    """Encode rows as CSV bytes in blocks (see stream_lines)"""
+    writer = csv.writer(Echo())
+    return stream_lines((writer.writerow(row).encode('utf-8') for row in rows), compress)
+
+def stream_jsonl(records, compress=False):
+    """Encode dicts as JSON Lines bytes in blocks (see stream_lines)"""
+    return stream_lines(
+        ((json.dumps(record, cls=DjangoJSONEncoder) + '\n').encode('utf-8') for record in records), compress,
+    )
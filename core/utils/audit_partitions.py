@@ -0,0 +1,279 @@
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+from django.utils import timezone
+
+from core.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+TABLE = AuditLog._meta.db_table
+
+BOUND_RE = re.compile(r"FROM \((?P<lower>[^)]*)\) TO \((?P<upper>[^)]*)\)")
+
+@dataclass
+class AuditPartition:
+    name: str
+    lower: datetime = None  # None for MINVALUE
+    upper: datetime = None  # None for MAXVALUE
+    is_default: bool = False
+
+def month_start(value):
+    """First instant (UTC) of the month containing value"""
+    value = value.astimezone(dt_timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def add_months(month, count):
+    """Shift a month_start() value by count months"""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+def retention_cutoff(months, now=None):
+    """
+    Start of the oldest month kept when retaining the given number of months
+    (the current month counts as one), so purges always cover whole months.
+    """
+    return add_months(month_start(now or timezone.now()), -(months - 1))
+
+def _quote(connection, name):
+    return connection.ops.quote_name(name)
+
+def _literal(value):
+    return f"'{value:%Y-%m-%d %H:%M:%S}+00'"
+
+def _parse_bound(value):
+    value = value.strip().strip("'")
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(value).astimezone(dt_timezone.utc)
+
+def is_partitioned(connection=default_connection):
+    """True if the audit log table is a native PostgreSQL partitioned table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+def list_partitions(connection=default_connection):
+    """
+    The partitions of the audit log table, oldest first, default partition last.
+    
+    Returns:
+        list: AuditPartition instances
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [TABLE],
+        )
+        rows = cursor.fetchall()
+    
+    partitions = []
+    for name, bound in rows:
+        if bound == 'DEFAULT':
+            partitions.append(AuditPartition(name, is_default=True))
+            continue
+        match = BOUND_RE.search(bound)
+        partitions.append(AuditPartition(name, _parse_bound(match['lower']), _parse_bound(match['upper'])))
+    minimum = datetime.min.replace(tzinfo=dt_timezone.utc)
+    return sorted(partitions, key=lambda p: (p.is_default, p.lower or minimum))
+
+def create_partitions(months_ahead=None, now=None, connection=default_connection):
+    """
+    Make sure monthly partitions exist from the current month to months_ahead months out.
+    
+    Rows outside every monthly partition land in the default partition, so
+    a missed run never makes audit writes fail.
+    
+    Returns:
+        list: Names of the partitions created
+    """
+    if months_ahead is None:
+        months_ahead = settings.AUDIT_LOG_PARTITION_MONTHS_AHEAD
+    current = month_start(now or timezone.now())
+    existing = list_partitions(connection)
+    covered_until = max((p.upper for p in existing if p.upper), default=None)
+    
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if covered_until and month < covered_until:
+            continue
+        name = partition_name(month)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(connection, name)} PARTITION OF {_quote(connection, TABLE)} "
+                f"FOR VALUES FROM ({_literal(month)}) TO ({_literal(add_months(month, 1))})"
+            )
+        created.append(name)
+    if not any(p.is_default for p in existing):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(connection, TABLE + '_default')} "
+                f"PARTITION OF {_quote(connection, TABLE)} DEFAULT"
+            )
+    return created
+
+def drop_partitions_before(cutoff, detach=False, lock_timeout_ms=None, connection=default_connection):
+    """
+    Detach every monthly partition that ends on or before cutoff, and drop it unless detach is set.
+    
+    Each partition is detached in its own short transaction under
+    lock_timeout, so a purge gives up instead of queueing writers behind it
+    while a long query holds the table.
+    
+    Returns:
+        list: Names of the partitions removed
+    """
+    if lock_timeout_ms is None:
+        lock_timeout_ms = settings.AUDIT_LOG_LOCK_TIMEOUT_MS
+    removed = []
+    for partition in list_partitions(connection):
+        if partition.is_default or partition.upper is None or partition.upper > cutoff:
+            continue
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}")
+                cursor.execute(
+                    f"ALTER TABLE {_quote(connection, TABLE)} DETACH PARTITION {_quote(connection, partition.name)}"
+                )
+                if not detach:
+                    cursor.execute(f"DROP TABLE {_quote(connection, partition.name)}")
+        logger.info(f"{'Detached' if detach else 'Dropped'} audit log partition {partition.name}")
+        removed.append(partition.name)
+    return removed
+
+def delete_before(cutoff, chunk_size=None):
+    """
+    Delete audit rows older than cutoff in primary key chunks (unpartitioned tables).
+    
+    Every chunk is one set-based DELETE in its own short transaction, so
+    locks are never held for the whole purge.
+    
+    Returns:
+        int: Number of rows deleted
+    """
+    chunk_size = chunk_size or settings.AUDIT_LOG_PURGE_CHUNK_SIZE
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(AuditLog.objects.filter(timestamp__lt=cutoff).values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            count, _ = AuditLog.objects.filter(pk__in=ids).delete()
+        deleted += count
+    return deleted
+
+def purge_before(cutoff, detach=False, connection=default_connection):
+    """
+    Apply the retention policy: remove audit entries older than cutoff.
+    
+    Partitioned tables lose whole monthly partitions; otherwise rows are
+    deleted in chunks.
+    
+    Returns:
+        tuple: (list of partitions removed, number of rows deleted)
+    """
+    if is_partitioned(connection):
+        return drop_partitions_before(cutoff, detach=detach, connection=connection), 0
+    return [], delete_before(cutoff)
+
+def partition_table(schema_editor, now=None, months_ahead=None):
+    """
+    Convert the plain audit log table into a table partitioned by month on timestamp.
+    
+    The existing table is attached as the partition for everything before
+    next month, so no rows are copied; it is dropped whole by the retention
+    policy once it falls out of the retention window. The primary key becomes
+    (id, timestamp), as PostgreSQL requires the partition key in it.
+    """
+    connection = schema_editor.connection
+    if is_partitioned(connection):
+        return
+    table = _quote(connection, TABLE)
+    legacy = _quote(connection, TABLE + '_legacy')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()",
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        
+        # Free the constraint/index names and the sequence for the new parent table
+        for name, contype, definition in constraints:
+            if contype in ('p', 'u', 'f'):
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {_quote(connection, name)}")
+        primary_key_names = {name for name, contype, definition in constraints if contype in ('p', 'u')}
+        for name, definition in indexes:
+            if name not in primary_key_names:
+                cursor.execute(f"DROP INDEX {_quote(connection, name)}")
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        next_id = cursor.fetchone()[0] + 1
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id DROP DEFAULT")
+        # A serial column (older schemas) leaves its sequence behind
+        cursor.execute(f"DROP SEQUENCE IF EXISTS {_quote(connection, TABLE + '_id_seq')}")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        
+        cursor.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        sequence = _quote(connection, TABLE + '_id_seq')
+        cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {table}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [TABLE + '_id_seq', next_id])
+        cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {_quote(connection, TABLE + "_pkey")} PRIMARY KEY (id, "timestamp")')
+        for name, contype, definition in constraints:
+            if contype == 'f':
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {_quote(connection, name)} {definition}")
+        
+        next_month = add_months(month_start(now or timezone.now()), 1)
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ({_literal(next_month)})"
+        )
+        # Recreate the indexes on the parent; PostgreSQL builds them on every partition
+        for name, definition in indexes:
+            if name not in primary_key_names:
+                cursor.execute(definition)
+    create_partitions(months_ahead, now=next_month, connection=connection)
+
+def maintain(months_ahead=None, retention_months=None, detach=None):
+    """
+    Create upcoming partitions and apply the retention policy.
+    
+    Args:
+        months_ahead (int): Partitions to create in advance (default settings.AUDIT_LOG_PARTITION_MONTHS_AHEAD)
+        retention_months (int): Months kept; 0 disables the purge (default settings.AUDIT_LOG_RETENTION_MONTHS)
+        detach (bool): Keep expired partitions as standalone tables (default settings.AUDIT_LOG_DETACH_EXPIRED)
+    
+    Returns:
+        tuple: (partitions created, partitions removed, rows deleted)
+    """
+    if retention_months is None:
+        retention_months = settings.AUDIT_LOG_RETENTION_MONTHS
+    if detach is None:
+        detach = settings.AUDIT_LOG_DETACH_EXPIRED
+    
+    created = create_partitions(months_ahead) if is_partitioned() else []
+    removed, deleted = [], 0
+    if retention_months > 0:
+        removed, deleted = purge_before(retention_cutoff(retention_months), detach=detach)
+    return created, removed, deleted
@@ -0,0 +1,134 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+def enqueue_messages(messages):
+    """
+    Store email messages in the outbox for the delivery worker.
+    
+    Args:
+        messages (iterable): EmailMessage / EmailMultiAlternatives instances
+    
+    Returns:
+        list: The created EmailOutbox rows
+    """
+    rows = []
+    for message in messages:
+        html_body = ''
+        for content, mimetype in getattr(message, 'alternatives', []):
+            if mimetype == 'text/html':
+                html_body = content
+        rows.append(EmailOutbox(
+            subject=message.subject,
+            body=message.body,
+            html_body=html_body,
+            from_email=message.from_email,
+            to=list(message.to),
+        ))
+    return EmailOutbox.objects.bulk_create(rows)
+
+def build_message(row):
+    """Turn an EmailOutbox row back into an EmailMultiAlternatives"""
+    message = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email,
+        to=row.to,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, 'text/html')
+    return message
+
+def retry_delay(attempts):
+    """Backoff before the next attempt: EMAIL_OUTBOX_RETRY_MINUTES doubled per failed attempt, capped"""
+    minutes = settings.EMAIL_OUTBOX_RETRY_MINUTES * 2 ** (attempts - 1)
+    return timedelta(minutes=min(minutes, settings.EMAIL_OUTBOX_RETRY_MAX_MINUTES))
+
+def claim_batch(now=None):
+    """
+    Lease up to settings.EMAIL_OUTBOX_BATCH_SIZE due rows for sending.
+    
+    Claimed rows are marked 'sending' and leased for EMAIL_OUTBOX_LEASE_MINUTES;
+    if the worker dies mid-batch they become due again when the lease ends.
+    Concurrent workers skip each other's locked rows where the database
+    supports it.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='sending'), next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:settings.EMAIL_OUTBOX_BATCH_SIZE]
+        )
+        lease = now + timedelta(minutes=settings.EMAIL_OUTBOX_LEASE_MINUTES)
+        EmailOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(status='sending', next_attempt_at=lease)
+    return rows
+
+def deliver_batch():
+    """
+    Send one claimed batch over a single backend connection.
+    
+    Messages are spaced to stay under settings.EMAIL_OUTBOX_RATE_PER_MINUTE
+    (0 disables the limit). A failed message is retried with backoff and
+    dead-lettered after settings.EMAIL_OUTBOX_MAX_ATTEMPTS attempts.
+    
+    Returns:
+        tuple: (sent_count, failed_count, claimed_count)
+    """
+    rows = claim_batch()
+    if not rows:
+        return 0, 0, 0
+    
+    rate = settings.EMAIL_OUTBOX_RATE_PER_MINUTE
+    interval = 60.0 / rate if rate else 0
+    sent, failed = [], []
+    
+    connection = get_connection()
+    is_open = False
+    try:
+        for row in rows:
+            started = time.monotonic()
+            try:
+                # Opened once and reused; otherwise send_messages connects and logs in on every call
+                if not is_open:
+                    connection.open()
+                    is_open = True
+                connection.send_messages([build_message(row)])
+            except Exception as e:
+                logger.error(f"Error sending outbox email #{row.pk} to {', '.join(row.to)}: {str(e)}")
+                row.last_error = str(e)
+                failed.append(row)
+                # Drop the broken connection; it is reopened for the next message
+                connection.close()
+                is_open = False
+            else:
+                sent.append(row)
+            
+            wait = interval - (time.monotonic() - started)
+            if wait > 0 and row is not rows[-1]:
+                time.sleep(wait)
+    finally:
+        connection.close()
+    
+    now = timezone.now()
+    EmailOutbox.objects.filter(pk__in=[row.pk for row in sent]).update(status='sent', sent_at=now, last_error='')
+    for row in failed:
+        row.attempts += 1
+        if row.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            row.status = 'dead'
+            logger.error(f"Outbox email #{row.pk} dead-lettered after {row.attempts} attempts")
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = now + retry_delay(row.attempts)
+    EmailOutbox.objects.bulk_update(failed, ['attempts', 'status', 'next_attempt_at', 'last_error'])
+    
+    return len(sent), len(failed), len(rows)
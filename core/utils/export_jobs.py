@@ -0,0 +1,226 @@
+import os
+import secrets
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import AuditLog, ExportJob, Server
+from core.utils.audit_export import (
+    archive_search, export_records, export_rows, filter_audit_logs, stream_csv, stream_jsonl,
+)
+
+EXPORT_DIR = 'exports'
+
+INVENTORY_HEADER = [
+    'ID', 'Name', 'IP Address', 'OS', 'Type', 'Kind', 'CPU', 'CPU Cores', 'Memory', 'Disk', 'Location',
+    'Department', 'Owner', 'Services', 'URLs', 'Changes', 'Last Changed',
+]
+
+INVENTORY_COLUMNS = [
+    'id', 'name', 'ip_address', 'os', 'server_type', 'server_kind', 'cpu', 'cpu_cores', 'memory', 'disk',
+    'location', 'department__name', 'owner__username', 'service_count', 'hyperlink_count',
+]
+
+def visible_servers(user):
+    """Servers user may export: all of them for admins and superusers, otherwise their departments' servers"""
+    if user.is_superuser or user.is_admin():
+        return Server.objects.all()
+    return Server.objects.filter(department__in=user.departments.all())
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def server_history(server_ids):
+    """Audit entries of the given servers, oldest first, as server id -> list of dicts"""
+    history = defaultdict(list)
+    entries = (
+        AuditLog.objects.filter(model_name='Server', object_id__in=[str(pk) for pk in server_ids])
+        .order_by('timestamp').values_list('object_id', 'timestamp', 'user__username', 'action', 'changes')
+    )
+    for object_id, timestamp, username, action, changes in entries.iterator():
+        history[int(object_id)].append({
+            'timestamp': timestamp, 'user': username, 'action': action, 'changes': changes,
+        })
+    return history
+
+def inventory_records(user, chunk_size=None):
+    """
+    Servers visible to user with their department, owner, service and URL counts and change history.
+    
+    Servers are read in chunks of settings.EXPORT_JOB_CHUNK_SIZE and the
+    history of each chunk comes from one audit log query, so memory stays
+    bounded however large the inventory is. History moved to the audit
+    archive is not included.
+    """
+    chunk_size = chunk_size or settings.EXPORT_JOB_CHUNK_SIZE
+    servers = (
+        visible_servers(user)
+        .annotate(service_count=Count('services', distinct=True), hyperlink_count=Count('hyperlinks', distinct=True))
+        .order_by('pk').values(*INVENTORY_COLUMNS)
+    )
+    for batch in _batches(servers.iterator(chunk_size=chunk_size), chunk_size):
+        history = server_history([server['id'] for server in batch])
+        for server in batch:
+            server['history'] = history.get(server['id'], [])
+            yield server
+
+def inventory_rows(records):
+    """Header and CSV rows of the inventory export; the history is summarised as a count and last change"""
+    yield INVENTORY_HEADER
+    for record in records:
+        history = record['history']
+        yield [record[column] if record[column] is not None else '' for column in INVENTORY_COLUMNS] + [
+            len(history),
+            history[-1]['timestamp'].strftime('%Y-%m-%d %H:%M:%S') if history else '',
+        ]
+
+def audit_log_export(job):
+    """
+    (estimated total, CSV rows or JSONL records) of an audit log job.
+    
+    The job's filters are applied exactly as AuditLogListView applies its
+    query string, archive included.
+    """
+    queryset = filter_audit_logs(job.user, job.filters)
+    archive = archive_search(job.user, job.filters)
+    total = queryset.count()
+    if archive is not None:
+        # Shard indexes give an upper bound without decompressing the shards
+        total += sum(shard['count'] for shard in archive.shards())
+    if job.format == 'csv':
+        return total, export_rows(queryset, archive)
+    return total, export_records(queryset, archive)
+
+def inventory_export(job):
+    """(total, CSV rows or JSONL records) of an inventory job"""
+    total = visible_servers(job.user).count()
+    records = inventory_records(job.user)
+    if job.format == 'csv':
+        return total, inventory_rows(records)
+    return total, records
+
+EXPORTERS = {
+    'audit_log': audit_log_export,
+    'inventory': inventory_export,
+}
+
+# A running job saves its progress at least this often, so slow rows never look like a dead worker
+HEARTBEAT_FRACTION = 4  # of settings.EXPORT_JOB_STALE_MINUTES
+
+def _track_progress(job, items, header_rows):
+    """
+    Pass items through, saving job.rows_written and the heartbeat as it goes.
+    
+    Progress is saved every settings.EXPORT_JOB_PROGRESS_ROWS rows, and also
+    whenever a quarter of settings.EXPORT_JOB_STALE_MINUTES has passed since
+    the last save, however few rows that was.
+    """
+    items = iter(items)
+    yield from islice(items, header_rows)
+    beat_every = timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES) / HEARTBEAT_FRACTION
+    last_beat = timezone.now()
+    written = 0
+    for item in items:
+        written += 1
+        now = timezone.now()
+        if written % settings.EXPORT_JOB_PROGRESS_ROWS == 0 or now - last_beat >= beat_every:
+            ExportJob.objects.filter(pk=job.pk).update(rows_written=written, heartbeat_at=now)
+            last_beat = now
+        yield item
+    job.rows_written = written
+
+def run_export(job):
+    """
+    Build the file of a pending job under MEDIA_ROOT, saving progress as it goes.
+    
+    Rows are fetched in chunks and written in compressed blocks, so the
+    worker's memory stays flat. The file gets an unguessable name and is
+    written to a temporary path, then renamed into place once complete.
+    """
+    # The file name is recorded up front so the partial file of a job whose worker died can be found
+    name = f"{EXPORT_DIR}/{secrets.token_hex(8)}-{job.filename}"
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    job.status = 'running'
+    job.started_at = job.heartbeat_at = timezone.now()
+    job.rows_written = 0
+    job.error = ''
+    job.file.name = name
+    job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'rows_written', 'error', 'task_id', 'file'])
+    
+    total, items = EXPORTERS[job.kind](job)
+    ExportJob.objects.filter(pk=job.pk).update(total_rows=total, heartbeat_at=timezone.now())
+    job.total_rows = total
+    
+    encode = stream_csv if job.format == 'csv' else stream_jsonl
+    blocks = encode(_track_progress(job, items, 1 if job.format == 'csv' else 0), compress=job.compress)
+    
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    
+    job.size_bytes = os.path.getsize(path)
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['size_bytes', 'status', 'finished_at', 'rows_written', 'total_rows'])
+    return job
+
+def _remove_files(job):
+    """Delete job's file and any partial file left by an unfinished run"""
+    if not job.file:
+        return
+    for path in (job.file.path, f"{job.file.path}.tmp"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def fail_stale(now=None):
+    """
+    Fail running jobs whose heartbeat is older than settings.EXPORT_JOB_STALE_MINUTES.
+    
+    Their worker died mid-export (a live one bumps the heartbeat with every
+    progress update, and at least every quarter of that window), so the
+    partial file is removed.
+    
+    Returns:
+        int: Number of jobs failed
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=settings.EXPORT_JOB_STALE_MINUTES)
+    failed = 0
+    for job in ExportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).iterator():
+        _remove_files(job)
+        failed += ExportJob.objects.filter(pk=job.pk, status='running').update(
+            status='failed', error='The export worker stopped before finishing', finished_at=now,
+        )
+    return failed
+
+def purge_expired(days=None, now=None):
+    """
+    Fail stale running jobs, then delete jobs (and their files) created more than days ago.
+    
+    Returns:
+        tuple: (stale jobs failed, jobs deleted)
+    """
+    now = now or timezone.now()
+    failed = fail_stale(now)
+    days = settings.EXPORT_JOB_RETENTION_DAYS if days is None else days
+    jobs = ExportJob.objects.filter(created_at__lt=now - timedelta(days=days)).exclude(status='running')
+    deleted = 0
+    for job in jobs.iterator():
+        _remove_files(job)
+        job.delete()
+        deleted += 1
+    return failed, deleted
@@ -0,0 +1,225 @@
+import asyncio
+import datetime
+import ipaddress
+import os
+import socket
+import ssl
+import tempfile
+import threading
+from dataclasses import dataclass
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+LISTENER_KINDS = ('ok', 'slow', 'refused', 'expired')
+
+HTTP_RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+def _name(common_name):
+    return x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+
+def _write_pem(path, *chunks):
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+def _key_pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+def generate_ca(directory):
+    """
+    Create a throwaway CA for the fleet.
+    
+    Returns:
+        tuple: (certificate, private key, path of the CA PEM file)
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(_name('SSL Benchmark CA'))
+        .issuer_name(_name('SSL Benchmark CA'))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True, content_commitment=False, key_encipherment=False,
+                data_encipherment=False, key_agreement=False, key_cert_sign=True,
+                crl_sign=True, encipher_only=False, decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    path = os.path.join(directory, 'ca.pem')
+    _write_pem(path, cert.public_bytes(serialization.Encoding.PEM))
+    return cert, key, path
+
+def issue_certificate(ca_cert, ca_key, hostname, days, directory, name):
+    """
+    Issue a leaf certificate for hostname (and 127.0.0.1) signed by the fleet CA.
+    
+    A negative days gives a certificate that expired that many days ago.
+    
+    Returns:
+        tuple: (certificate PEM path, key PEM path)
+    """
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if days < 0:
+        not_before, not_after = now + datetime.timedelta(days=days - 90), now + datetime.timedelta(days=days)
+    else:
+        not_before, not_after = now - datetime.timedelta(days=1), now + datetime.timedelta(days=days)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(_name(hostname))
+        .issuer_name(ca_cert.subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(not_before)
+        .not_valid_after(not_after)
+        .add_extension(
+            x509.SubjectAlternativeName([
+                x509.DNSName(hostname),
+                x509.IPAddress(ipaddress.ip_address('127.0.0.1')),
+            ]),
+            critical=False,
+        )
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False,
+        )
+        .sign(ca_key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, f'{name}.pem')
+    key_path = os.path.join(directory, f'{name}.key')
+    _write_pem(cert_path, cert.public_bytes(serialization.Encoding.PEM))
+    _write_pem(key_path, _key_pem(key))
+    return cert_path, key_path
+
+def _free_port():
+    """A loopback port with nothing listening on it (connections are refused)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@dataclass
+class Listener:
+    kind: str
+    port: int
+    url: str
+
+class TLSFleet:
+    """
+    Many local TLS listeners on loopback standing in for monitored hosts.
+    
+    Every listener gets its own certificate from a private CA (so fingerprints
+    differ, as they would across real hosts) and answers any request with an
+    empty 200. 'slow' listeners wait slow_delay seconds before answering the
+    scanner's HEAD request, 'refused' ports have nothing listening and
+    'expired' listeners present a certificate that expired a week ago. The listeners run on their
+    own event loop in a background thread; point settings.SSL_SCAN_CA_FILE at
+    ca_file so the scanner trusts them.
+    
+    Usage:
+        with TLSFleet({'ok': 90, 'slow': 5, 'refused': 5}) as fleet:
+            urls = [listener.url for listener in fleet.listeners]
+    """
+    
+    def __init__(self, counts, slow_delay=1.0, hostname='localhost'):
+        unknown = set(counts) - set(LISTENER_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown listener kinds: {', '.join(sorted(unknown))}")
+        self.counts = counts
+        self.slow_delay = slow_delay
+        self.hostname = hostname
+        self.listeners = []
+        self.ca_file = None
+        self._tempdir = None
+        self._loop = None
+        self._thread = None
+        self._servers = []
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def start(self):
+        self._tempdir = tempfile.TemporaryDirectory(prefix='ssl-bench-')
+        directory = self._tempdir.name
+        ca_cert, ca_key, self.ca_file = generate_ca(directory)
+        
+        contexts = []
+        for kind in LISTENER_KINDS:
+            for i in range(self.counts.get(kind, 0)):
+                if kind == 'refused':
+                    contexts.append((kind, None))
+                    continue
+                days = -7 if kind == 'expired' else 90
+                cert_path, key_path = issue_certificate(
+                    ca_cert, ca_key, self.hostname, days, directory, f'{kind}-{i}',
+                )
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+                context.load_cert_chain(cert_path, key_path)
+                contexts.append((kind, context))
+        
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='ssl-bench-fleet', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_servers(contexts), self._loop).result()
+    
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop_servers(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+    
+    async def _start_servers(self, contexts):
+        for kind, context in contexts:
+            if context is None:
+                port = _free_port()
+            else:
+                handler = self._slow_handle if kind == 'slow' else self._handle
+                server = await asyncio.start_server(handler, '127.0.0.1', 0, ssl=context, backlog=1024)
+                self._servers.append(server)
+                port = server.sockets[0].getsockname()[1]
+            self.listeners.append(Listener(kind, port, f'https://{self.hostname}:{port}/'))
+    
+    async def _stop_servers(self):
+        for server in self._servers:
+            server.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+    
+    async def _handle(self, reader, writer, delay=0):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(HTTP_RESPONSE)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+    
+    async def _slow_handle(self, reader, writer):
+        await self._handle(reader, writer, delay=self.slow_delay)
@@ -1,88 +1,420 @@
 import ssl
 import socket
+import asyncio
+import ipaddress
+import time
 import OpenSSL
-import requests
+import hashlib
+import functools
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
 from urllib.parse import urlparse
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 import pytz
 
 logger = logging.getLogger(__name__)
 
-def get_ssl_expiry_date(url):
+def parse_certificate(cert):
     """
-    Get the SSL certificate expiry date for a given URL.
+    Extract expiry, issuer and subject from a DER encoded certificate.
     
     Args:
-        url (str): The URL to check (can be with or without protocol)
+        cert (bytes): The certificate in DER (ASN.1) form
     
     Returns:
-        tuple: (expiry_date, issuer, subject, is_valid) or (None, None, None, False) if error
+        tuple: (expiry_date, issuer, subject, is_valid)
     """
+    x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_ASN1, cert)
+    
+    # Extract expiry date
+    naive_expiry_date = datetime.strptime(x509.get_notAfter().decode('ascii'), '%Y%m%d%H%M%SZ')
+    # Make the expiry date timezone-aware
+    expiry_date = timezone.make_aware(naive_expiry_date, pytz.UTC)
+    
+    # Extract issuer and subject
+    issuer = dict(x509.get_issuer().get_components())
+    issuer_str = ', '.join([f"{k.decode('utf-8')}={v.decode('utf-8')}" for k, v in issuer.items()])
+    
+    subject = dict(x509.get_subject().get_components())
+    subject_str = ', '.join([f"{k.decode('utf-8')}={v.decode('utf-8')}" for k, v in subject.items()])
+    
+    # Check if certificate is valid using timezone-aware comparison
+    is_valid = timezone.now() < expiry_date
+    
+    return expiry_date, issuer_str, subject_str, is_valid
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A TLS endpoint: where to connect and which name to send as SNI"""
+    hostname: str
+    port: int = 443
+    sni: str = None
+    
+    @property
+    def key(self):
+        """Stable string form, stored on HyperLink.endpoint for grouping"""
+        address = f"{self.hostname}:{self.port}"
+        if self.sni and self.sni != self.hostname:
+            return f"{self.sni}@{address}"
+        return address
+
+def parse_endpoint(url):
+    """
+    Normalise a URL to the endpoint the scanner connects to.
+    
+    The hostname is lower-cased, an explicit port is honoured and anything
+    else defaults to 443 (the scanner always speaks TLS). The hostname is
+    also used for SNI.
+    
+    Args:
+        url (str): The URL to parse (can be with or without protocol)
+    
+    Returns:
+        Endpoint
+    
+    Raises:
+        ValueError: if the URL has no hostname or an invalid port
+    """
+    parsed_url = urlparse(_normalize_url(url.strip()))
+    hostname = parsed_url.hostname
+    if not hostname:
+        raise ValueError(f"No hostname in URL {url!r}")
+    hostname = hostname.rstrip('.')
+    return Endpoint(hostname=hostname, port=parsed_url.port or 443, sni=hostname)
+
+@dataclass
+class ProbeResult:
+    """Outcome of a single probe: reachability plus the peer certificate"""
+    endpoint: str
+    is_accessible: bool = False
+    status_code: int = None
+    expiry_date: datetime = None
+    issuer: str = None
+    subject: str = None
+    is_valid: bool = False
+    error: str = None
+    elapsed: float = 0.0
+    # SHA-256 of the leaf certificate DER, used to skip unchanged certificates
+    fingerprint: str = None
+    der: bytes = field(default=None, repr=False)
+    
+    def load_certificate(self):
+        """Parse der into expiry_date/issuer/subject/is_valid, once"""
+        if self.der is None or self.expiry_date is not None:
+            return
+        try:
+            self.expiry_date, self.issuer, self.subject, self.is_valid = parse_certificate(self.der)
+        except Exception as e:
+            logger.error(f"Error parsing certificate for {self.endpoint}: {e!r}")
+
+def _normalize_url(url):
+    """Ensure URL has a protocol"""
+    if not url.startswith('http://') and not url.startswith('https://'):
+        url = 'https://' + url
+    return url
+
+async def _close_writer(writer):
+    """Close an asyncio stream without letting a failed TLS shutdown escape"""
+    writer.close()
     try:
-        # Ensure URL has a protocol
-        if not url.startswith('http://') and not url.startswith('https://'):
-            url = 'https://' + url
-        
-        # Parse the URL to get the hostname
-        parsed_url = urlparse(url)
-        hostname = parsed_url.netloc
-        
-        # Remove port if present
-        if ':' in hostname:
-            hostname = hostname.split(':')[0]
-        
-        # Create a connection to the server
-        context = ssl.create_default_context()
-        conn = socket.create_connection((hostname, 443), timeout=10)
-        sock = context.wrap_socket(conn, server_hostname=hostname)
-        
-        # Get certificate
-        cert = sock.getpeercert(binary_form=True)
-        x509 = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_ASN1, cert)
-        
-        # Extract expiry date
-        naive_expiry_date = datetime.strptime(x509.get_notAfter().decode('ascii'), '%Y%m%d%H%M%SZ')
-        # Make the expiry date timezone-aware
-        expiry_date = timezone.make_aware(naive_expiry_date, pytz.UTC)
-        
-        # Extract issuer and subject
-        issuer = dict(x509.get_issuer().get_components())
-        issuer_str = ', '.join([f"{k.decode('utf-8')}={v.decode('utf-8')}" for k, v in issuer.items()])
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+class DNSCache:
+    """
+    In-process cache of hostname lookups for the scanner.
+    
+    The system resolver (getaddrinfo) does not report record TTLs, so answers
+    are kept for settings.SSL_DNS_CACHE_TTL seconds and failed lookups for
+    settings.SSL_DNS_NEGATIVE_TTL seconds. Concurrent lookups of the same name
+    on one event loop share a single resolver call. hits/misses count how many
+    lookups were answered from the cache.
+    """
+    
+    def __init__(self):
+        self._entries = {}
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self):
+        """Counters for logging: {'hits', 'misses', 'entries'}"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+    
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    async def resolve(self, hostname):
+        """
+        Resolve hostname to a list of IP addresses.
         
-        subject = dict(x509.get_subject().get_components())
-        subject_str = ', '.join([f"{k.decode('utf-8')}={v.decode('utf-8')}" for k, v in subject.items()])
+        Raises:
+            socket.gaierror: if the lookup failed (possibly a cached failure)
+        """
+        try:
+            ipaddress.ip_address(hostname)
+            return [hostname]
+        except ValueError:
+            pass
         
-        # Check if certificate is valid using timezone-aware comparison
-        is_valid = timezone.now() < expiry_date
+        entry = self._entries.get(hostname)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            addresses, error = entry[1], entry[2]
+            if error:
+                raise socket.gaierror(*error.args)
+            return addresses
         
-        sock.close()
-        conn.close()
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(hostname)
+        if pending and pending.get_loop() is loop:
+            self.hits += 1
+            return await asyncio.shield(pending)
         
-        return expiry_date, issuer_str, subject_str, is_valid
+        self.misses += 1
+        future = loop.create_task(self._lookup(hostname))
+        self._pending[hostname] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._pending.get(hostname) is future:
+                del self._pending[hostname]
     
-    except Exception as e:
-        logger.error(f"Error checking SSL for {url}: {str(e)}")
-        return None, None, None, False
+    async def _lookup(self, hostname):
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            self._entries[hostname] = (time.monotonic() + settings.SSL_DNS_NEGATIVE_TTL, None, e)
+            raise
+        # Keep resolver order, dropping duplicate addresses
+        addresses = list(dict.fromkeys(sockaddr[0] for family, type_, proto, canonname, sockaddr in infos))
+        self._entries[hostname] = (time.monotonic() + settings.SSL_DNS_CACHE_TTL, addresses, None)
+        return addresses
+    
+    async def prefetch(self, endpoints):
+        """Resolve the hostnames of many endpoints in parallel, ignoring failures"""
+        hostnames = {endpoint.hostname for endpoint in endpoints}
+        await asyncio.gather(*(self.resolve(hostname) for hostname in hostnames), return_exceptions=True)
+
+# Shared by every probe in this process (Celery worker or web worker)
+dns_cache = DNSCache()
 
-def check_url_accessibility(url):
+@functools.lru_cache(maxsize=None)
+def _client_context(cafile=None):
     """
-    Check if a URL is accessible via HTTP request.
+    Verifying TLS client context, shared by every probe.
+    
+    Building a context loads the trust store, which is far more expensive than
+    the handshake it is used for. cafile (settings.SSL_SCAN_CA_FILE) replaces
+    the system trust store, e.g. with the benchmark fleet's private CA.
+    """
+    return ssl.create_default_context(cafile=cafile)
+
+async def _open_tls_connection(endpoint, context):
+    """Connect to the endpoint's resolved addresses in turn and complete the TLS handshake"""
+    addresses = await dns_cache.resolve(endpoint.hostname)
+    error = None
+    for address in addresses:
+        try:
+            return await asyncio.open_connection(
+                address, endpoint.port, ssl=context, server_hostname=endpoint.sni or endpoint.hostname,
+            )
+        except ssl.SSLError:
+            # The host answered; trying another address will not fix its certificate
+            raise
+        except OSError as e:
+            error = e
+    raise error or OSError(f"No addresses for {endpoint.hostname}")
+
+async def _send_head(reader, writer, endpoint, path, timeout):
+    """Send a HEAD request over an open connection and return the status code"""
+    host = endpoint.sni or endpoint.hostname
+    if endpoint.port != 443:
+        host = f"{host}:{endpoint.port}"
+    
+    writer.write(
+        f"HEAD {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        "User-Agent: server-mgmt-ssl-checker\r\n"
+        "Connection: close\r\n\r\n".encode('ascii')
+    )
+    await writer.drain()
+    status_line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+    return int(status_line.split()[1])
+
+async def probe_endpoint_async(endpoint, path='/', timeout=None, send_head=None, parse=True):
+    """
+    Probe an endpoint over a single TLS connection.
+    
+    One DNS lookup, TCP connect and TLS handshake yields the peer certificate;
+    a completed handshake is what makes the endpoint accessible. An optional
+    HEAD request over the same socket records the HTTP status in
+    result.status_code for information only: a host whose / answers 404 or
+    500 still serves a certificate worth tracking. Redirects are not followed.
     
     Args:
-        url (str): The URL to check
+        endpoint (Endpoint): Where to connect
+        path (str): Request path for the HEAD request
+        timeout (float): Per-host connect/handshake/response timeout in seconds
+            (defaults to settings.SSL_SCAN_TIMEOUT)
+        send_head (bool): Whether to send a HEAD request after the handshake
+            (defaults to settings.SSL_SCAN_SEND_HEAD)
+        parse (bool): Parse the certificate now; when False only the DER and
+            its fingerprint are captured and callers use load_certificate()
     
     Returns:
-        bool: True if accessible, False otherwise
+        ProbeResult: never raises; failures are reported in result.error
     """
+    timeout = timeout or settings.SSL_SCAN_TIMEOUT
+    if send_head is None:
+        send_head = settings.SSL_SCAN_SEND_HEAD
+    result = ProbeResult(endpoint=endpoint.key)
+    started = time.monotonic()
+    
     try:
-        # Ensure URL has a protocol
-        if not url.startswith('http://') and not url.startswith('https://'):
-            url = 'https://' + url
+        context = _client_context(settings.SSL_SCAN_CA_FILE)
+        reader, writer = await asyncio.wait_for(_open_tls_connection(endpoint, context), timeout=timeout)
+        try:
+            cert = writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+            if send_head:
+                try:
+                    result.status_code = await _send_head(reader, writer, endpoint, path, timeout)
+                except Exception as e:
+                    # The certificate is already in hand; a host that does not speak HTTP is still up
+                    logger.debug(f"No HTTP response from {endpoint.key}: {e!r}")
+        finally:
+            await _close_writer(writer)
         
-        response = requests.head(url, timeout=10, allow_redirects=True)
-        return response.status_code < 400
+        result.is_accessible = True
+        result.der = cert
+        result.fingerprint = hashlib.sha256(cert).hexdigest()
+        if parse:
+            result.load_certificate()
+    
     except Exception as e:
-        logger.error(f"Error accessing {url}: {str(e)}")
-        return False
\ No newline at end of file
+        logger.error(f"Error checking SSL for {endpoint.key}: {e!r}")
+        result.error = e.__class__.__name__
+    
+    result.elapsed = time.monotonic() - started
+    return result
+
+async def probe_url_async(url, timeout=None, send_head=None):
+    """
+    Probe a single URL, sending the HEAD request for its own path.
+    
+    See probe_endpoint_async for arguments and return value.
+    """
+    try:
+        endpoint = parse_endpoint(url)
+    except ValueError as e:
+        logger.error(f"Error checking SSL for {url}: {e}")
+        return ProbeResult(endpoint=url, error=e.__class__.__name__)
+    
+    parsed_url = urlparse(_normalize_url(url.strip()))
+    path = parsed_url.path or '/'
+    if parsed_url.query:
+        path = f"{path}?{parsed_url.query}"
+    return await probe_endpoint_async(endpoint, path=path, timeout=timeout, send_head=send_head)
+
+def probe_url(url, timeout=None, send_head=None):
+    """
+    Synchronous wrapper around probe_url_async, for use in views.
+    
+    See probe_endpoint_async for arguments and return value.
+    """
+    return async_to_sync(probe_url_async)(url, timeout=timeout, send_head=send_head)
+
+def probe_url_cached(url, timeout=None):
+    """
+    probe_url with a short-lived result cache and single-flight coalescing.
+    
+    Results are cached per normalised endpoint for settings.SSL_PROBE_CACHE_TTL
+    seconds (failures for settings.SSL_PROBE_CACHE_NEGATIVE_TTL). While one
+    request is probing an endpoint, concurrent requests for the same endpoint
+    wait for its result instead of opening their own connection. Coalescing
+    spans processes when the default cache is shared (e.g. Redis).
+    
+    Returns:
+        tuple: (ProbeResult, cached, age) where cached is True if the result
+        was not probed by this call and age is its age in seconds
+    """
+    try:
+        key = f"ssl-probe:{parse_endpoint(url).key}"
+    except ValueError:
+        return probe_url(url, timeout=timeout), False, 0.0
+    
+    timeout = timeout or settings.SSL_SCAN_TIMEOUT
+    # A probe is a connect/handshake plus a HEAD, each bounded by timeout
+    lock_timeout = int(timeout * 2) + 5
+    lock_key = f"{key}:lock"
+    
+    entry = cache.get(key)
+    owns_lock = entry is None and cache.add(lock_key, True, lock_timeout)
+    if entry is None and not owns_lock:
+        # Someone else is probing this endpoint; wait for them to publish the result
+        deadline = time.monotonic() + lock_timeout
+        while entry is None and time.monotonic() < deadline and cache.get(lock_key):
+            time.sleep(0.1)
+            entry = cache.get(key)
+        if entry is None:
+            # The holder's lock expired or was evicted without a result; take it over if it is free
+            owns_lock = cache.add(lock_key, True, lock_timeout)
+    
+    if entry is not None:
+        probed_at, result = entry
+        return result, True, max(time.time() - probed_at, 0.0)
+    
+    try:
+        result = probe_url(url, timeout=timeout)
+        ttl = settings.SSL_PROBE_CACHE_TTL if result.is_accessible else settings.SSL_PROBE_CACHE_NEGATIVE_TTL
+        cache.set(key, (time.time(), result), ttl)
+    finally:
+        # Only release our own lock; another caller may hold it now
+        if owns_lock:
+            cache.delete(lock_key)
+    return result, False, 0.0
+
+async def scan_endpoints_async(endpoints, concurrency=None, timeout=None):
+    """
+    Probe many endpoints concurrently, each one exactly once.
+    
+    Args:
+        endpoints (iterable): Endpoint instances to check
+        concurrency (int): Maximum number of endpoints in flight at once
+            (defaults to settings.SSL_SCAN_CONCURRENCY)
+        timeout (float): Per-host connect/handshake timeout in seconds
+            (defaults to settings.SSL_SCAN_TIMEOUT)
+    
+    Returns:
+        dict: Mapping of endpoint key to its ProbeResult; certificates are not
+        parsed yet (see ProbeResult.load_certificate)
+    """
+    concurrency = concurrency or settings.SSL_SCAN_CONCURRENCY
+    timeout = timeout or settings.SSL_SCAN_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def bounded_probe(endpoint):
+        async with semaphore:
+            return endpoint.key, await probe_endpoint_async(endpoint, timeout=timeout, parse=False)
+    
+    unique = {endpoint.key: endpoint for endpoint in endpoints}
+    # Resolve every hostname up front so the handshakes below hit the DNS cache
+    await dns_cache.prefetch(unique.values())
+    results = await asyncio.gather(*(bounded_probe(endpoint) for endpoint in unique.values()))
+    return dict(results)
+
+def scan_endpoints(endpoints, concurrency=None, timeout=None):
+    """
+    Synchronous entry point for the scan engine (used by Celery tasks).
+    
+    See scan_endpoints_async for arguments and return value.
+    """
+    return asyncio.run(scan_endpoints_async(endpoints, concurrency=concurrency, timeout=timeout))
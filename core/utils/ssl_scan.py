@@ -0,0 +1,304 @@
+import logging
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.auditlog import create_bulk_audit_log
+from core.models import HyperLink, SSLCertificate
+from core.utils.ssl_checker import ProbeResult, dns_cache, scan_endpoints
+
+logger = logging.getLogger(__name__)
+
+def group_by_endpoint(hyperlinks):
+    """
+    Group hyperlinks by the endpoint the scanner connects to.
+    
+    Returns:
+        tuple: (dict of endpoint key to Endpoint, dict of endpoint key to list of
+        hyperlinks, list of hyperlinks whose URL could not be parsed)
+    """
+    endpoints = {}
+    groups = defaultdict(list)
+    invalid = []
+    for hyperlink in hyperlinks:
+        try:
+            endpoint = hyperlink.get_endpoint()
+        except ValueError:
+            invalid.append(hyperlink)
+            continue
+        endpoints[endpoint.key] = endpoint
+        groups[endpoint.key].append(hyperlink)
+    return endpoints, groups, invalid
+
+def due_hyperlinks(now=None):
+    """
+    Enabled hyperlinks the adaptive scheduler wants probed now.
+    
+    A hyperlink is due when it has no certificate yet or its certificate's
+    next_check_at has passed. Every other enabled hyperlink on the same
+    endpoint is included too, since probing the endpoint refreshes them all.
+    """
+    now = now or timezone.now()
+    due_certificates = SSLCertificate.objects.filter(
+        Q(next_check_at__lte=now) | Q(next_check_at__isnull=True)
+    ).values('hyperlink_id')
+    due_endpoints = HyperLink.objects.filter(
+        Q(pk__in=due_certificates) | Q(ssl_certificate__isnull=True),
+        is_enabled=True,
+    ).values('endpoint')
+    return HyperLink.objects.filter(is_enabled=True, endpoint__in=due_endpoints)
+
+def exclude_backed_off(hyperlinks, now=None):
+    """
+    Drop hyperlinks whose certificate is in failure backoff and not yet due.
+    
+    Used by full sweeps so a handful of dead hosts do not cost a timeout on
+    every run; the due-check task already honours next_check_at.
+    """
+    now = now or timezone.now()
+    return hyperlinks.exclude(
+        ssl_certificate__consecutive_failures__gt=0,
+        ssl_certificate__next_check_at__gt=now,
+    )
+
+def chunk_hyperlink_ids(rows, chunk_size=None):
+    """
+    Split (id, endpoint) rows, ordered by endpoint, into lists of hyperlink ids.
+    
+    Chunks are cut at roughly chunk_size ids but never inside an endpoint
+    group, so every endpoint is still probed exactly once per scan.
+    """
+    chunk_size = chunk_size or settings.SSL_SCAN_CHUNK_SIZE
+    chunks = []
+    chunk = []
+    previous_endpoint = None
+    for hyperlink_id, endpoint in rows:
+        if len(chunk) >= chunk_size and endpoint != previous_endpoint:
+            chunks.append(chunk)
+            chunk = []
+        chunk.append(hyperlink_id)
+        previous_endpoint = endpoint
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def is_unchanged(cert, result):
+    """True if an existing certificate row already holds the certificate just probed"""
+    return bool(
+        cert.pk is not None
+        and result.is_accessible
+        and result.fingerprint
+        and cert.fingerprint == result.fingerprint
+    )
+
+def apply_probe_result(cert, result, now=None):
+    """
+    Copy a ProbeResult onto an SSLCertificate (new or existing) without saving.
+    
+    Failed probes keep the last known certificate data, record the failure
+    and back off; a successful probe clears the failure state. When the
+    certificate fingerprint matches the stored one the certificate is not
+    parsed at all and only the checked-at/scheduling fields change.
+    
+    Returns:
+        bool: True if the certificate data changed (new row or rotation)
+    """
+    now = now or timezone.now()
+    if not result.is_accessible:
+        if cert.pk is None:
+            cert.is_valid = False
+        cert.consecutive_failures += 1
+        cert.last_error = (result.error or '')[:100]
+        cert.next_check_at = cert.compute_next_check(now, failed=True)
+        return False
+    
+    cert.consecutive_failures = 0
+    cert.last_error = ''
+    if is_unchanged(cert, result):
+        cert.last_checked = now
+        cert.next_check_at = cert.compute_next_check(now)
+        return False
+    
+    result.load_certificate()
+    issuer = result.issuer or ''
+    subject = result.subject or ''
+    # A stored fingerprint that no longer matches means the certificate was rotated
+    changed = (
+        cert.pk is None
+        or bool(cert.fingerprint)
+        or (cert.expiry_date, cert.issuer, cert.subject) != (result.expiry_date, issuer, subject)
+    )
+    
+    cert.expiry_date = result.expiry_date
+    cert.issuer = issuer
+    cert.subject = subject
+    cert.is_valid = result.is_valid
+    cert.fingerprint = result.fingerprint or ''
+    cert.notification_status = 'pending' if result.expiry_date and result.expiry_date > now else 'expired'
+    if changed:
+        cert.last_changed_at = now
+    cert.next_check_at = cert.compute_next_check(now)
+    return changed
+
+class SSLResultWriter:
+    """
+    Collects probe results and writes them to SSLCertificate in batches.
+    
+    Successful probes and new rows are written with one upsert per batch
+    (bulk_create with update_conflicts on the hyperlink key); failed probes on
+    existing rows only update their failure/backoff fields via bulk_update;
+    unchanged certificates (same fingerprint) are only touched with one
+    UPDATE per distinct next_check_at. Each batch is one transaction and emits
+    a single audit log entry, covering only rows whose data changed.
+    
+    Usage:
+        with SSLResultWriter() as writer:
+            writer.add(hyperlink, cert, result)
+    """
+    
+    UPSERT_FIELDS = [
+        'expiry_date', 'issuer', 'subject', 'is_valid', 'notification_status',
+        'last_changed_at', 'next_check_at', 'consecutive_failures', 'last_error', 'last_checked',
+        'fingerprint',
+    ]
+    RESCHEDULE_FIELDS = ['next_check_at', 'consecutive_failures', 'last_error']
+    
+    def __init__(self, batch_size=None, now=None):
+        self.batch_size = batch_size or settings.SSL_SCAN_WRITE_BATCH_SIZE
+        self.now = now or timezone.now()
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.error_count = 0
+        self._upserts = []
+        self._reschedules = []
+        self._touches = defaultdict(list)
+        self._pending = 0
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+    
+    def add(self, hyperlink, cert, result):
+        """
+        Queue the result of probing hyperlink; cert is its existing SSLCertificate or None.
+        """
+        if cert is None:
+            cert = SSLCertificate(hyperlink=hyperlink)
+        is_new = cert.pk is None
+        unchanged = is_unchanged(cert, result)
+        apply_probe_result(cert, result, self.now)
+        
+        if unchanged:
+            self._touches[cert.next_check_at].append(cert.pk)
+        elif result.is_accessible or is_new:
+            self._upserts.append((cert, is_new, result.is_accessible))
+        else:
+            self._reschedules.append(cert)
+        
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Write everything queued so far"""
+        upserts, self._upserts = self._upserts, []
+        reschedules, self._reschedules = self._reschedules, []
+        touches, self._touches = self._touches, defaultdict(list)
+        count, self._pending = self._pending, 0
+        if not count:
+            return
+        
+        try:
+            with transaction.atomic():
+                if upserts:
+                    # Fresh instances so the upsert never carries a primary key
+                    SSLCertificate.objects.bulk_create(
+                        [
+                            SSLCertificate(
+                                hyperlink_id=cert.hyperlink_id,
+                                **{field: getattr(cert, field) for field in self.UPSERT_FIELDS},
+                            )
+                            for cert, is_new, is_accessible in upserts
+                        ],
+                        update_conflicts=True,
+                        unique_fields=['hyperlink'],
+                        update_fields=self.UPSERT_FIELDS,
+                    )
+                    create_bulk_audit_log('UPDATE', SSLCertificate, {
+                        'created': [cert.hyperlink_id for cert, is_new, is_accessible in upserts if is_new],
+                        'updated': [cert.hyperlink_id for cert, is_new, is_accessible in upserts if not is_new],
+                    })
+                if reschedules:
+                    SSLCertificate.objects.bulk_update(reschedules, self.RESCHEDULE_FIELDS)
+                for next_check_at, ids in touches.items():
+                    SSLCertificate.objects.filter(pk__in=ids).update(
+                        last_checked=self.now,
+                        next_check_at=next_check_at,
+                        consecutive_failures=0,
+                        last_error='',
+                    )
+        except Exception as e:
+            logger.error(f"Error writing {count} SSL scan results: {str(e)}")
+            self.error_count += count
+            return
+        
+        unchanged_count = sum(len(ids) for ids in touches.values())
+        self.unchanged_count += unchanged_count
+        self.updated_count += sum(1 for cert, is_new, is_accessible in upserts if is_accessible) + unchanged_count
+
+def scan_hyperlinks(hyperlinks, stats=None):
+    """
+    Probe the given hyperlinks (one probe per unique endpoint) and persist the results.
+    
+    Args:
+        hyperlinks (iterable): HyperLink instances to check
+        stats (dict): Optional; filled with endpoints, failed (endpoints that
+            could not be probed), unchanged and the per-endpoint probe
+            latencies in seconds (used by benchmark_ssl_scan)
+    
+    Returns:
+        tuple: (updated_count, error_count)
+    """
+    endpoints, groups, invalid = group_by_endpoint(hyperlinks)
+    
+    # Probe every unique endpoint concurrently, then persist the results
+    results = scan_endpoints(endpoints.values())
+    
+    # Unparseable URLs are recorded as failed probes so they get rescheduled too
+    for hyperlink in invalid:
+        logger.error(f"Error checking SSL for {hyperlink.url}: invalid URL")
+    if invalid:
+        groups[''] = invalid
+        results[''] = ProbeResult(endpoint='', error='ValueError')
+    
+    hyperlink_ids = [hyperlink.pk for group in groups.values() for hyperlink in group]
+    certificates = {
+        cert.hyperlink_id: cert
+        for cert in SSLCertificate.objects.filter(hyperlink_id__in=hyperlink_ids)
+    }
+    
+    with SSLResultWriter() as writer:
+        for key, result in results.items():
+            if key and not result.is_accessible:
+                logger.warning(f"Endpoint {key} is not accessible ({len(groups[key])} URLs)")
+            
+            for hyperlink in groups[key]:
+                writer.add(hyperlink, certificates.get(hyperlink.pk), result)
+    
+    dns_stats = dns_cache.stats()
+    if stats is not None:
+        stats.update(
+            endpoints=len(endpoints),
+            failed=sum(1 for key, result in results.items() if key and not result.is_accessible),
+            unchanged=writer.unchanged_count,
+            latencies=[result.elapsed for key, result in results.items() if key],
+        )
+    logger.info(
+        f"Probed {len(endpoints)} endpoints for {len(hyperlink_ids) - len(invalid)} URLs, "
+        f"{writer.unchanged_count} unchanged (DNS cache: {dns_stats['hits']} hits, {dns_stats['misses']} misses)"
+    )
+    return writer.updated_count, writer.error_count + len(invalid)
@@ -0,0 +1,139 @@
+import logging
+import os
+import re
+from django.shortcuts import redirect, get_object_or_404
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
+from django.views.generic import ListView
+from .models import ExportJob
+from .tasks import run_export_job
+
+logger = logging.getLogger(__name__)
+
+# The audit log list filters an audit export can be started with
+AUDIT_FILTER_KEYS = ['user', 'action', 'model', 'date_from', 'date_to', 'ip_address']
+
+RANGE_RE = re.compile(r'bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+RANGE_BLOCK_BYTES = 64 * 1024
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(RANGE_BLOCK_BYTES, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+def ranged_file_response(request, path, filename, content_type, etag):
+    """
+    Serve a file as an attachment, honouring a single byte range so interrupted downloads can resume.
+    
+    Multiple ranges, or a range whose If-Range validator no longer matches,
+    get the whole file (as RFC 9110 allows); unsatisfiable ranges get 416.
+    """
+    size = os.path.getsize(path)
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    if not match or not (match['start'] or match['end']) or (if_range and if_range != etag):
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+    
+    if match['start']:
+        start = int(match['start'])
+        end = min(int(match['end']), size - 1) if match['end'] else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(match['end']), 0), size - 1
+    if start >= size or start > end:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    
+    response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@method_decorator(staff_member_required, name='dispatch')
+class ExportJobListView(ListView):
+    """Background exports of the current user (every user's for superusers), newest first"""
+    model = ExportJob
+    template_name = 'core/export_jobs.html'
+    context_object_name = 'export_jobs'
+    paginate_by = 25
+    
+    def get_queryset(self):
+        jobs = ExportJob.objects.select_related('user')
+        if not self.request.user.is_superuser:
+            jobs = jobs.filter(user=self.request.user)
+        return jobs
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['kind_choices'] = ExportJob.KIND_CHOICES
+        context['format_choices'] = ExportJob.FORMAT_CHOICES
+        # The page reloads itself while a listed job is still being built
+        context['has_active_jobs'] = any(job.is_active for job in context['export_jobs'])
+        return context
+
+def _queue_export(job):
+    try:
+        run_export_job.delay(job.pk)
+    except Exception as e:
+        logger.error(f"Could not queue export job #{job.pk}: {str(e)}")
+        ExportJob.objects.filter(pk=job.pk).update(
+            status='failed', error=f"Could not queue the export: {str(e)}", finished_at=timezone.now(),
+        )
+
+@staff_member_required
+@require_POST
+def create_export_job(request):
+    """
+    Start a background export.
+    
+    POST parameters: kind (audit_log or inventory), format (csv or jsonl),
+    compress, and for audit exports the audit log list filters.
+    """
+    kind = request.POST.get('kind', 'audit_log')
+    export_format = request.POST.get('format', 'csv')
+    if kind not in dict(ExportJob.KIND_CHOICES) or export_format not in dict(ExportJob.FORMAT_CHOICES):
+        messages.error(request, "Unknown export type or format.")
+        return redirect('core:export-job-list')
+    
+    filters = {}
+    if kind == 'audit_log':
+        filters = {key: request.POST[key] for key in AUDIT_FILTER_KEYS if request.POST.get(key)}
+    job = ExportJob.objects.create(
+        user=request.user,
+        kind=kind,
+        format=export_format,
+        compress=bool(request.POST.get('compress')),
+        filters=filters,
+    )
+    transaction.on_commit(lambda: _queue_export(job))
+    messages.success(request, f"{job.get_kind_display()} export #{job.pk} started; it can be downloaded here once done.")
+    return redirect('core:export-job-list')
+
+@staff_member_required
+def download_export_job(request, pk):
+    """Download a finished export; supports Range requests for resuming"""
+    job = get_object_or_404(ExportJob, pk=pk, status='done')
+    if job.user_id != request.user.pk and not request.user.is_superuser:
+        raise Http404
+    if not job.file or not os.path.exists(job.file.path):
+        raise Http404("The export file no longer exists")
+    etag = f'"export-{job.pk}-{job.size_bytes}"'
+    return ranged_file_response(request, job.file.path, job.filename, job.content_type, etag)
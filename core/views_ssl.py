@@ -5,40 +5,101 @@ from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
 from django.http import JsonResponse
+from django.core.paginator import Paginator
+from django.db.models import Q
 
-from .models import HyperLink, SSLCertificate
-from .utils.ssl_checker import get_ssl_expiry_date, check_url_accessibility
-from .tasks import check_ssl_certificates
+from .models import HyperLink, SSLCertificate, SSLScanRun
+from .utils.ssl_checker import probe_url_cached
+from .tasks import check_ssl_certificates, check_hyperlink_ssl
 from accounts.mixins import RoleBasedAccessMixin
 
+# Session key holding the ids of the SSL check jobs the user started; SSLJobStatusView reports only these
+SSL_JOB_SESSION_KEY = 'ssl_job_ids'
+SSL_JOB_SESSION_LIMIT = 20
+
+def remember_ssl_job(request, task_id):
+    """Record a job started by request's user in their session, keeping the most recent SSL_JOB_SESSION_LIMIT"""
+    job_ids = [job_id for job_id in request.session.get(SSL_JOB_SESSION_KEY, []) if job_id != task_id]
+    request.session[SSL_JOB_SESSION_KEY] = (job_ids + [task_id])[-SSL_JOB_SESSION_LIMIT:]
+
 class SSLCertificateListView(RoleBasedAccessMixin, ListView):
+    """
+    Certificates grouped by status, each group paginated on its own.
+    
+    Status buckets, their counts and the search filter are all evaluated in
+    the database; only the rows on the current page of each bucket are
+    loaded. Query parameters: q (URL or server name), status (show one
+    bucket) and <status>_page (e.g. critical_page=2).
+    """
     model = SSLCertificate
     template_name = "ssl/certificate_list.html"
     context_object_name = "certificates"
     allowed_roles = ['admin', 'manager', 'viewer']  # All roles can view certificates
+    paginate_bucket_by = 25
+    
+    BUCKETS = [
+        # (status, heading, header classes, icon, badge class)
+        ('Critical', 'Critical (Expiring within 7 days)', 'bg-danger text-white', 'fa-exclamation-triangle', 'bg-danger'),
+        ('Warning', 'Warning (Expiring within 30 days)', 'bg-warning text-dark', 'fa-exclamation-circle', 'bg-warning text-dark'),
+        ('Valid', 'Valid Certificates', 'bg-success text-white', 'fa-check-circle', 'bg-success'),
+        ('Expired', 'Expired Certificates', 'bg-danger text-white', 'fa-times-circle', 'bg-danger'),
+        ('Unknown', 'Unknown Status', 'bg-secondary text-white', 'fa-question-circle', 'bg-secondary'),
+    ]
     
     def get_queryset(self):
         user = self.request.user
-        # Admin and superuser can see all certificates
-        if user.is_superuser or user.is_admin():
-            return SSLCertificate.objects.all().select_related('hyperlink', 'hyperlink__servers')
+        queryset = SSLCertificate.objects.select_related('hyperlink', 'hyperlink__servers')
         # Manager and Viewer can only see certificates in their departments
-        return SSLCertificate.objects.filter(
-            hyperlink__servers__department__in=user.departments.all()
-        ).distinct().select_related('hyperlink', 'hyperlink__servers')
+        if not (user.is_superuser or user.is_admin()):
+            queryset = queryset.filter(hyperlink__servers__department__in=user.departments.all())
+        
+        search = self.request.GET.get('q', '').strip()
+        if search:
+            queryset = queryset.filter(
+                Q(hyperlink__url__icontains=search) | Q(hyperlink__servers__name__icontains=search)
+            )
+        return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Group certificates by status
-        certificates = self.get_queryset()
-        
-        context['critical_certs'] = [cert for cert in certificates if cert.status == "Critical"]
-        context['warning_certs'] = [cert for cert in certificates if cert.status == "Warning"]
-        context['valid_certs'] = [cert for cert in certificates if cert.status == "Valid"]
-        context['expired_certs'] = [cert for cert in certificates if cert.status == "Expired"]
-        context['unknown_certs'] = [cert for cert in certificates if cert.status == "Unknown"]
-        
+        certificates = self.object_list
+        now = timezone.now()
+        counts = certificates.status_counts(now)
+        selected = self.request.GET.get('status', '')
+        
+        buckets = []
+        for status, heading, header_class, icon, badge_class in self.BUCKETS:
+            if selected and selected != status:
+                continue
+            order = ['-last_checked', 'pk'] if status == 'Unknown' else ['expiry_date', 'pk']
+            paginator = Paginator(certificates.in_status(status, now).order_by(*order), self.paginate_bucket_by)
+            # Reuse the aggregate instead of a COUNT per bucket
+            paginator.count = counts[status]
+            page_param = f"{status.lower()}_page"
+            page_obj = paginator.get_page(self.request.GET.get(page_param))
+            buckets.append({
+                'status': status,
+                'heading': heading,
+                'header_class': header_class,
+                'icon': icon,
+                'badge_class': badge_class,
+                'page_obj': page_obj,
+                'previous_query': self._page_query(page_param, page_obj.previous_page_number()) if page_obj.has_previous() else '',
+                'next_query': self._page_query(page_param, page_obj.next_page_number()) if page_obj.has_next() else '',
+            })
+        
+        context['counts'] = counts
+        context['total_count'] = sum(counts.values())
+        context['buckets'] = buckets
+        context['statuses'] = [bucket[0] for bucket in self.BUCKETS]
         return context
+    
+    def _page_query(self, page_param, number):
+        """The current query string with one bucket's page number replaced (and no job progress banner)"""
+        params = self.request.GET.copy()
+        params.pop('job', None)
+        params[page_param] = number
+        return params.urlencode()
 
 class SSLCertificateDetailView(RoleBasedAccessMixin, DetailView):
     model = SSLCertificate
@@ -48,7 +109,10 @@ class SSLCertificateDetailView(RoleBasedAccessMixin, DetailView):
 
 class CheckSSLCertificateView(RoleBasedAccessMixin, View):
     """
-    View to manually check an SSL certificate for a hyperlink
+    View to manually check an SSL certificate for a hyperlink.
+    
+    The check runs as a Celery job; the page it redirects to polls
+    SSLJobStatusView for the outcome.
     """
     allowed_roles = ['admin', 'manager']  # Only Admin and Manager can check SSL certificates
     
@@ -61,36 +125,21 @@ class CheckSSLCertificateView(RoleBasedAccessMixin, View):
         hyperlink_id = self.kwargs.get('pk')
         hyperlink = get_object_or_404(HyperLink, pk=hyperlink_id)
         
-        # Check if URL is accessible
-        is_accessible = check_url_accessibility(hyperlink.url)
-        
-        if not is_accessible:
-            messages.error(request, f"URL {hyperlink.url} is not accessible")
-            return redirect('core:hyperlink-detail', pk=hyperlink_id)
-        
-        # Get SSL certificate information
-        expiry_date, issuer, subject, is_valid = get_ssl_expiry_date(hyperlink.url)
-        
-        if not expiry_date:
-            messages.error(request, f"Could not retrieve SSL certificate information for {hyperlink.url}")
-            return redirect('core:hyperlink-detail', pk=hyperlink_id)
-        
-        # Update or create SSL certificate record
-        ssl_cert, created = SSLCertificate.objects.update_or_create(
-            hyperlink=hyperlink,
-            defaults={
-                'expiry_date': expiry_date,
-                'issuer': issuer or '',
-                'subject': subject or '',
-                'is_valid': is_valid,
-                'notification_status': 'pending' if expiry_date and expiry_date > timezone.now() else 'expired'
-            }
-        )
+        ssl_cert = SSLCertificate.objects.filter(hyperlink=hyperlink).first()
+        if ssl_cert:
+            next_url = reverse('core:ssl-certificate-detail', kwargs={'pk': ssl_cert.pk})
+        else:
+            next_url = reverse('core:server-urls-detail', kwargs={'pk': hyperlink_id})
         
-        messages.success(request, f"SSL certificate for {hyperlink.url} checked successfully. Expires on {expiry_date.strftime('%Y-%m-%d')}")
+        try:
+            job = check_hyperlink_ssl.delay(hyperlink.pk)
+        except Exception as e:
+            messages.error(request, f"Could not start SSL certificate check for {hyperlink.url}: {str(e)}")
+            return redirect(next_url)
         
-        # Redirect to certificate detail page
-        return redirect('core:ssl-certificate-detail', pk=ssl_cert.pk)
+        remember_ssl_job(request, job.id)
+        messages.info(request, f"SSL certificate check for {hyperlink.url} started")
+        return redirect(f"{next_url}?job={job.id}")
 
 class RunSSLCheckView(RoleBasedAccessMixin, View):
     """
@@ -104,19 +153,57 @@ class RunSSLCheckView(RoleBasedAccessMixin, View):
         return super().test_func()
     
     def get(self, request, *args, **kwargs):
+        # Never run the sweep in the web worker; without Celery there is no check
         try:
-            # Run the task asynchronously
             task = check_ssl_certificates.delay()
-            messages.success(request, f"SSL certificate check task started (Task ID: {task.id})")
         except Exception as e:
-            # If Celery is not available, run the task synchronously
-            try:
-                result = check_ssl_certificates()
-                messages.success(request, f"SSL certificate check completed: {result}")
-            except Exception as inner_e:
-                messages.error(request, f"Error checking SSL certificates: {str(inner_e)}")
-        
-        return redirect('core:ssl-certificate-list')
+            messages.error(request, f"Could not start SSL certificate check: {str(e)}")
+            return redirect('core:ssl-certificate-list')
+        
+        remember_ssl_job(request, task.id)
+        messages.success(request, f"SSL certificate check task started (Task ID: {task.id})")
+        return redirect(f"{reverse('core:ssl-certificate-list')}?job={task.id}")
+
+class SSLJobStatusView(RoleBasedAccessMixin, View):
+    """
+    API view reporting the state of a manual SSL check job, polled by the certificate pages.
+    
+    Only jobs started from the user's own session are reported; any other
+    id gets a 404, so job results and scan progress do not leak between users.
+    """
+    allowed_roles = ['admin', 'manager']
+    
+    def get(self, request, *args, **kwargs):
+        task_id = self.kwargs.get('task_id')
+        if task_id not in request.session.get(SSL_JOB_SESSION_KEY, []):
+            return JsonResponse({'error': f"Unknown SSL check job {task_id}"}, status=404)
+        job = check_hyperlink_ssl.AsyncResult(task_id)
+        
+        data = {
+            'id': task_id,
+            'state': job.state,
+            'finished': job.ready(),
+        }
+        if job.successful():
+            data['result'] = job.result
+        elif job.failed():
+            data['error'] = str(job.result)
+        
+        # A full sweep finishes its job once the chunks are dispatched; report the scan run instead
+        run = SSLScanRun.objects.filter(task_id=task_id).first()
+        if run:
+            totals = run.totals()
+            data['finished'] = run.status != 'running'
+            data['scan'] = {
+                'id': run.pk,
+                'status': run.status,
+                'total_urls': run.total_urls,
+                'done_urls': totals['done_urls'],
+                'updated': totals['updated'],
+                'errors': totals['errors'],
+            }
+        
+        return JsonResponse(data)
 
 class SSLCertificateAPIView(RoleBasedAccessMixin, View):
     """
@@ -129,24 +216,30 @@ class SSLCertificateAPIView(RoleBasedAccessMixin, View):
         if not url:
             return JsonResponse({'error': 'URL parameter is required'}, status=400)
         
-        # Check if URL is accessible
-        is_accessible = check_url_accessibility(url)
+        # Check reachability and fetch the certificate over one connection,
+        # reusing a result another request fetched moments ago
+        result, cached, age = probe_url_cached(url)
         
-        if not is_accessible:
-            return JsonResponse({'error': f"URL {url} is not accessible"}, status=400)
+        if not result.is_accessible:
+            return JsonResponse({'error': f"URL {url} is not accessible", 'cached': cached, 'age': round(age, 1)}, status=400)
         
-        # Get SSL certificate information
-        expiry_date, issuer, subject, is_valid = get_ssl_expiry_date(url)
+        expiry_date = result.expiry_date
         
         if not expiry_date:
-            return JsonResponse({'error': f"Could not retrieve SSL certificate information for {url}"}, status=400)
+            return JsonResponse({
+                'error': f"Could not retrieve SSL certificate information for {url}",
+                'cached': cached,
+                'age': round(age, 1),
+            }, status=400)
         
         # Return certificate information
         return JsonResponse({
             'url': url,
             'expiry_date': expiry_date.isoformat(),
-            'issuer': issuer,
-            'subject': subject,
-            'is_valid': is_valid,
-            'days_to_expiry': (expiry_date - timezone.now()).days
+            'issuer': result.issuer,
+            'subject': result.subject,
+            'is_valid': result.is_valid,
+            'days_to_expiry': (expiry_date - timezone.now()).days,
+            'cached': cached,
+            'age': round(age, 1),
         })
\ No newline at end of file
@@ -103,6 +103,11 @@ DATABASES = {
     'default': env.db()
 }
 
+# Shared cache (set CACHE_URL to a redis:// or memcache:// URL when running several web processes)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -191,9 +196,65 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='Server Management <noreply@servermgmt.example.com>')
 
+# Email outbox delivery (core.tasks.deliver_email_outbox)
+EMAIL_OUTBOX_BATCH_SIZE = env.int('EMAIL_OUTBOX_BATCH_SIZE', default=50)  # Emails sent per batch over one connection
+EMAIL_OUTBOX_RATE_PER_MINUTE = env.int('EMAIL_OUTBOX_RATE_PER_MINUTE', default=120)  # Max emails sent per minute (0 for no limit)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6)  # Failed attempts before an email is dead-lettered
+EMAIL_OUTBOX_RETRY_MINUTES = env.int('EMAIL_OUTBOX_RETRY_MINUTES', default=5)  # Delay after the first failure, doubled on each further failure
+EMAIL_OUTBOX_RETRY_MAX_MINUTES = env.int('EMAIL_OUTBOX_RETRY_MAX_MINUTES', default=240)  # Ceiling for the retry delay
+EMAIL_OUTBOX_LEASE_MINUTES = env.int('EMAIL_OUTBOX_LEASE_MINUTES', default=10)  # Claimed emails are retried after this if the worker dies
+EMAIL_OUTBOX_QUEUE = env('EMAIL_OUTBOX_QUEUE', default='celery')  # Celery queue for delivery; run a dedicated worker with -Q to isolate it
+
+# Audit log writing (core.auditlog)
+AUDIT_LOG_BATCH_SIZE = env.int('AUDIT_LOG_BATCH_SIZE', default=500)  # Audit entries inserted per bulk_create
+AUDIT_LOG_ASYNC = env.bool('AUDIT_LOG_ASYNC', default=False)  # Hand each request's/task's entries to the write_audit_logs task
+AUDIT_LOG_QUEUE = env('AUDIT_LOG_QUEUE', default='celery')  # Celery queue for the background audit writer
+AUDIT_LOG_RETENTION_MONTHS = env.int('AUDIT_LOG_RETENTION_MONTHS', default=0)  # Months of audit history kept, counting the current one (0 keeps everything)
+AUDIT_LOG_DETACH_EXPIRED = env.bool('AUDIT_LOG_DETACH_EXPIRED', default=False)  # Detach expired partitions instead of dropping them (PostgreSQL)
+AUDIT_LOG_PARTITION_MONTHS_AHEAD = env.int('AUDIT_LOG_PARTITION_MONTHS_AHEAD', default=3)  # Monthly partitions created in advance (PostgreSQL)
+AUDIT_LOG_LOCK_TIMEOUT_MS = env.int('AUDIT_LOG_LOCK_TIMEOUT_MS', default=5000)  # Give up detaching a partition rather than wait longer for its lock
+AUDIT_LOG_PURGE_CHUNK_SIZE = env.int('AUDIT_LOG_PURGE_CHUNK_SIZE', default=5000)  # Rows deleted per transaction on unpartitioned databases
+AUDIT_EXPORT_CHUNK_SIZE = env.int('AUDIT_EXPORT_CHUNK_SIZE', default=2000)  # Rows fetched per round trip while streaming the CSV export
+AUDIT_ARCHIVE_AFTER_DAYS = env.int('AUDIT_ARCHIVE_AFTER_DAYS', default=0)  # Move audit entries older than this to the archive (0 disables archiving)
+AUDIT_ARCHIVE_DIR = env('AUDIT_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'audit_archive'))  # Gzipped JSONL day shards; must be shared by web and worker hosts
+AUDIT_ARCHIVE_CHUNK_SIZE = env.int('AUDIT_ARCHIVE_CHUNK_SIZE', default=5000)  # Rows streamed and deleted per batch while archiving
+EXPORT_JOB_CHUNK_SIZE = env.int('EXPORT_JOB_CHUNK_SIZE', default=2000)  # Inventory servers (with their history) read per batch by background exports
+EXPORT_JOB_PROGRESS_ROWS = env.int('EXPORT_JOB_PROGRESS_ROWS', default=10000)  # Rows written between progress updates of a background export
+EXPORT_JOB_RETENTION_DAYS = env.int('EXPORT_JOB_RETENTION_DAYS', default=7)  # Finished exports and their files are deleted after this many days
+EXPORT_JOB_STALE_MINUTES = env.int('EXPORT_JOB_STALE_MINUTES', default=30)  # A running export with no progress for this long is failed and its partial file removed
+EXPORT_JOB_QUEUE = env('EXPORT_JOB_QUEUE', default='celery')  # Celery queue for background exports; long jobs may deserve their own worker
+
+CELERY_TASK_ROUTES = {
+    'core.tasks.deliver_email_outbox': {'queue': EMAIL_OUTBOX_QUEUE},
+    'core.tasks.write_audit_logs': {'queue': AUDIT_LOG_QUEUE},
+    'core.tasks.run_export_job': {'queue': EXPORT_JOB_QUEUE},
+}
+
 
 # SSL Certificate settings
 SSL_NOTIFICATION_DAYS = [30, 14, 7, 3, 1]  # Days before expiry to send notifications
+SSL_SCAN_CONCURRENCY = env.int('SSL_SCAN_CONCURRENCY', default=100)  # Max URLs probed at once by the scan engine
+SSL_SCAN_TIMEOUT = env.float('SSL_SCAN_TIMEOUT', default=10)  # Per-host connect/handshake timeout in seconds
+SSL_SCAN_SEND_HEAD = env.bool('SSL_SCAN_SEND_HEAD', default=True)  # Confirm reachability with a HEAD over the probe's TLS socket
+SSL_SCAN_CA_FILE = env('SSL_SCAN_CA_FILE', default=None)  # CA bundle to verify probed certificates against (system store if unset)
+SSL_DNS_CACHE_TTL = env.int('SSL_DNS_CACHE_TTL', default=300)  # Seconds to cache resolved scanner hostnames
+SSL_DNS_NEGATIVE_TTL = env.int('SSL_DNS_NEGATIVE_TTL', default=60)  # Seconds to cache failed lookups
+SSL_SCAN_WRITE_BATCH_SIZE = env.int('SSL_SCAN_WRITE_BATCH_SIZE', default=500)  # Scan results written per bulk upsert
+SSL_SCAN_CHUNK_SIZE = env.int('SSL_SCAN_CHUNK_SIZE', default=500)  # Hyperlinks per chunk when fanning a scan out to workers
+SSL_SCAN_MAX_PARALLEL_CHUNKS = env.int('SSL_SCAN_MAX_PARALLEL_CHUNKS', default=8)  # Max chunk subtasks running in parallel
+SSL_SCAN_TIME_BUDGET_MINUTES = env.int('SSL_SCAN_TIME_BUDGET_MINUTES', default=120)  # Deadline for a scan run; leftover chunks resume next time
+SSL_SCAN_STALE_MINUTES = env.int('SSL_SCAN_STALE_MINUTES', default=30)  # A running scan with no finished chunk for this long is resumed
+SSL_SCAN_RUN_RETENTION_DAYS = env.int('SSL_SCAN_RUN_RETENTION_DAYS', default=30)  # Finished scan runs and their chunks are deleted after this many days
+SSL_PROBE_CACHE_TTL = env.int('SSL_PROBE_CACHE_TTL', default=60)  # Seconds on-demand check results are reused per endpoint
+SSL_PROBE_CACHE_NEGATIVE_TTL = env.int('SSL_PROBE_CACHE_NEGATIVE_TTL', default=15)  # Seconds a failed on-demand check is reused
+
+# Adaptive re-check scheduling: (max days to expiry, hours between checks), first match wins
+SSL_RECHECK_INTERVALS = [(-1, 6), (7, 1), (30, 6), (60, 24), (None, 168)]
+SSL_RECHECK_ROTATED_WINDOW_DAYS = 2  # Certificates changed this recently count as freshly rotated
+SSL_RECHECK_ROTATED_HOURS = 2  # Re-check interval for freshly rotated certificates
+SSL_RECHECK_UNKNOWN_HOURS = 6  # Re-check interval when no expiry date could be read
+SSL_RECHECK_FAILURE_HOURS = 1  # Retry interval after the first failed probe, doubled on each further failure
+SSL_BACKOFF_MAX_HOURS = 168  # Ceiling for the failure backoff interval
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = ["bootstrap5"]
 